@@ -2,6 +2,11 @@
 
 from . import agent
 from .agent import AgentD
+from .answer_policy import AnswerPolicy
+from .token_usage import TokenUsage
+from .utils.log_utils import configure_logging
+
+configure_logging()
 
 # run pre checks
 agent.run_preliminary_tests()
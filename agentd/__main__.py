@@ -1,9 +1,11 @@
+import argparse
 import asyncio
+import json
+import sys
 
 from .agent import AgentD
-
-agentd = AgentD()
-USER_ID = AgentD.generate_user_id()
+from .answer_policy import AnswerPolicy
+from .batch import DEFAULT_CONCURRENCY, read_topics, run_batch
 
 
 def simple_callback(event, eventType: AgentD.EventType):
@@ -16,8 +18,9 @@ def simple_callback(event, eventType: AgentD.EventType):
         )
 
 
-async def main():
-    new_session = await agentd.new_sesion(USER_ID)
+async def interactive():
+    agentd = AgentD()
+    new_session = await agentd.new_sesion(AgentD.generate_user_id())
 
     while True:
         try:
@@ -37,4 +40,79 @@ async def main():
             print(f"An error occurred: {e}")
 
 
-asyncio.run(main())
+async def batch(args) -> int:
+    items = read_topics(args.topics)
+    answer_policy = None
+    if args.answer_policy:
+        with open(args.answer_policy, "r", encoding="utf-8") as f:
+            answer_policy = AnswerPolicy.from_dict(json.load(f))
+
+    agentd = AgentD()
+    with open(args.output, "a" if args.append else "w", encoding="utf-8") as output:
+        statuses = await run_batch(
+            agentd,
+            items,
+            output,
+            concurrency=args.concurrency,
+            answer_policy=answer_policy,
+        )
+
+    print(
+        f"{len(items)} topics: "
+        + ", ".join(f"{count} {status}" for status, count in sorted(statuses.items()))
+        + f". Results written to {args.output}."
+    )
+    return 0 if statuses.get("completed", 0) == len(items) else 1
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m agentd",
+        description="Chat with AgentD, or run it for a file of topics with 'batch'.",
+    )
+    commands = parser.add_subparsers(dest="command")
+    batch_parser = commands.add_parser(
+        "batch",
+        help="Run the pipeline for every topic of a JSONL file, without a user.",
+    )
+    batch_parser.add_argument(
+        "topics",
+        help="JSONL file, one object per line with a 'topic' (or 'title' and"
+        " 'body') and optionally an 'id' and an 'answer_policy'.",
+    )
+    batch_parser.add_argument(
+        "output", help="JSONL file the result of every topic is written to."
+    )
+    batch_parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help=f"Topics run at the same time (default: {DEFAULT_CONCURRENCY}).",
+    )
+    batch_parser.add_argument(
+        "--answer-policy",
+        help="JSON file with the answers to the agents' questions, e.g."
+        ' {"answers": {"solution_analysis_agent": "2"}, "default": "yes"}.',
+    )
+    batch_parser.add_argument(
+        "--append",
+        action="store_true",
+        help="Append to the output file instead of overwriting it.",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.command == "batch":
+        try:
+            return asyncio.run(batch(args))
+        except (OSError, ValueError) as e:
+            print(f"An error occurred: {e}", file=sys.stderr)
+            return 2
+    asyncio.run(interactive())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
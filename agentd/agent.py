@@ -8,7 +8,9 @@
 from google.adk.agents import Agent, ParallelAgent, SequentialAgent
 from google.adk.agents.callback_context import CallbackContext
 
+from agentd.artifact_store import state_value
 from agentd.utils import create_and_upload_pdf, extract_json_from_text, json_to_markdown
+from agentd.utils.log_utils import fields, get_logger
 
 from . import agent_constants
 from .sub_agents.architecture_agent import architecture_agent
@@ -24,6 +26,12 @@ from .sub_agents.target_users_analysis_agent import target_users_analysis_agent
 from .sub_agents.technical_advisor_agent import technical_advisor_agent
 from .sub_agents.topic_analysis_agent import topic_analysis_agent
 
+logger = get_logger(__name__)
+
+# state keys of the master report's URL and of the outputs it was generated from
+MASTER_REPORT_URL_KEY = "master_report_url"
+MASTER_REPORT_KEYS_KEY = "master_report_keys"
+
 """
 Agents involved in the system:
 
@@ -94,10 +102,6 @@ def simple_after_model_modifier(callback_context: CallbackContext, *_args, **_kw
     if architecture_agent.output_key not in callback_context.state:
         return None
 
-    print("===" * 8)
-    print("== GENERATING MASTER REPORT ==")
-    print("===" * 8)
-
     selected_keys = [
         # topic_analysis_agent.output_key,
         # problem_identification_agent.output_key,
@@ -110,14 +114,24 @@ def simple_after_model_modifier(callback_context: CallbackContext, *_args, **_kw
         architecture_agent.output_key,
         social_media_post_generation_agent.output_key,
     ]
+    report_keys = [key for key in selected_keys if key in callback_context.state]
+
+    # the callback runs after every turn of the root agent, the report is only
+    # generated again once it is missing an output (e.g. the social media posts)
+    if MASTER_REPORT_URL_KEY in callback_context.state and set(report_keys) <= set(
+        callback_context.state.get(MASTER_REPORT_KEYS_KEY) or []
+    ):
+        return None
+
+    logger.info("Generating master report")
 
     # collect all values for the keys from the state
     final_markdown = "# Master Report\n\n"
     final_markdown += "This report is generated by the AgentD system.\n\n"
 
-    for key in selected_keys:
+    for key in report_keys:
         if key in callback_context.state:
-            value = callback_context.state[key]
+            value = state_value(callback_context.state, key)
 
             # value could be a json string dump
             try:
@@ -126,7 +140,9 @@ def simple_after_model_modifier(callback_context: CallbackContext, *_args, **_kw
                 if json_data:
                     value = json_data
             except Exception as e:
-                print(f"Error extracting JSON from {key}: {e}")
+                logger.warning(
+                    "Could not extract JSON", extra=fields(key=key, error=str(e))
+                )
 
             final_markdown += "\n\n"
             if isinstance(value, dict) or isinstance(value, list):
@@ -143,22 +159,22 @@ def simple_after_model_modifier(callback_context: CallbackContext, *_args, **_kw
         local_dir="master_reports",
         remote_dir="master_reports",
     )
-    callback_context.state["master_report_url"] = public_url
-    print(f"Master report generated and uploaded to: {public_url}")
-    print("===" * 8)
+    callback_context.state[MASTER_REPORT_URL_KEY] = public_url
+    callback_context.state[MASTER_REPORT_KEYS_KEY] = report_keys
+    logger.info("Master report uploaded", extra=fields(url=public_url))
 
-    return types.Content(
-        parts=[
-            types.Part(
-                text=f"\n\n## Download Report:\nYou can download the Master report from [here]({public_url}).",
-            ),
+    parts = [
+        types.Part(
+            text=f"\n\n## Download Report:\nYou can download the Master report from [here]({public_url}).",
+        ),
+    ]
+    if social_media_post_generation_agent.output_key not in callback_context.state:
+        parts.append(
             types.Part(
                 text="<ASK>Please do tell if you would also like to generate social media posts for your Idea.<ASK>",
-            ),
-        ],
-        role="model",
-    )
-    return None
+            )
+        )
+    return types.Content(parts=parts, role="model")
 
 
 root_agent = Agent(
@@ -178,12 +194,8 @@ root_agent = Agent(
 
 
 def run_preliminary_tests():
-    print("=========================================================")
-
     # - Check if all python packages are installed
-    print(
-        "[PRELIMINARY CHECK] Checking if all required Python packages are installed..."
-    )
+    logger.info("Preliminary check: required Python packages")
     try:
         # pylint: disable=unused-import
         import google.adk
@@ -195,8 +207,9 @@ def run_preliminary_tests():
         import weasyprint
         from wordcloud import WordCloud
     except ImportError as e:
-        print(
-            f"[PRELIMINARY CHECK: FAILED!] Missing required package: {e.name}. Please install it using pip."
+        logger.error(
+            f"Preliminary check failed: missing required package {e.name}."
+            " Please install it using pip."
         )
         return
 
@@ -204,24 +217,35 @@ def run_preliminary_tests():
     from agentd.utils import get_cloud_storage
 
     # this will throw an error if the environment variables are missing or authentication fails
-    print("[PRELIMINARY CHECK] Testing Cloud Storage...")
+    logger.info("Preliminary check: Cloud Storage")
     get_cloud_storage()
-    print("[PRELIMINARY CHECK] Cloud Storage is working correctly.")
-
-    print("[PRELIMINARY CHECK] All preliminary checks passed.")
-    print("=========================================================")
+    logger.info("Preliminary checks passed")
 
 
 """The class for the agentd api."""
 
+import logging
+import os
 from datetime import datetime
 
+from google.adk.agents.run_config import RunConfig, StreamingMode
 from google.adk.events import Event
 from google.adk.runners import Runner
-from google.adk.sessions import InMemorySessionService, Session
+from google.adk.sessions import Session
 from google.genai import types
 
+from agentd.utils.metrics import AgentEventTimer, record_token_usage
+from agentd.utils.retry import use_retrying_models
+from agentd.utils.tracing import configure_tracing, trace_callbacks
+
 from .agent import root_agent
+from .progress_estimator import get_progress_estimator
+from .session_service import get_session_service
+from .token_usage import TokenUsage
+
+# `sse` streams model responses, partial text reaches callbacks as TEXT_DELTA
+# events before the complete TEXT_MESSAGE, `none` only sends complete responses
+AGENT_STREAMING_MODE = os.getenv("AGENT_STREAMING_MODE", "sse").lower()
 
 
 class AgentD:
@@ -236,6 +260,9 @@ class AgentD:
         USER_INPUT_REQUEST = "user_input_request"
         PROGRESS_UPDATE = "progress_update"
         FILE_URL = "file_url"
+        TEXT_DELTA = "text_delta"
+        TOKEN_USAGE = "token_usage"
+        TOKEN_BUDGET_EXCEEDED = "token_budget_exceeded"
 
     def parse_tool_call_event(self, event: Event):
         """Parse a tool call event and return its details."""
@@ -263,13 +290,27 @@ class AgentD:
 
         return tool_results
 
-    def __init__(self):
-        self.log("INITIALIZING AGENTD")
+    def __init__(self, streaming_mode: str = AGENT_STREAMING_MODE):
+        if streaming_mode not in ("sse", "none"):
+            raise ValueError(
+                f"Unknown AGENT_STREAMING_MODE '{streaming_mode}', use 'sse' or 'none'."
+            )
+        self.run_config = RunConfig(
+            streaming_mode=(
+                StreamingMode.SSE if streaming_mode == "sse" else StreamingMode.NONE
+            )
+        )
         self._setup()
-        self.log("AGENTD INITIALIZED")
+        self.log("AgentD initialized")
 
     def _setup(self):
-        session_service = InMemorySessionService()
+        # model calls get a deadline and retries of transient errors (429, 503...)
+        use_retrying_models(root_agent)
+        if configure_tracing():
+            trace_callbacks(root_agent)
+
+        # AGENT_SESSION_SERVICE=sqlite keeps conversations across restarts
+        session_service = get_session_service()
         runner = Runner(
             agent=root_agent,
             session_service=session_service,
@@ -277,9 +318,28 @@ class AgentD:
         )
         self.runner = runner
         self.session_service = session_service
+        self.progress_estimator = get_progress_estimator()
 
-    def log(self, message: str):
-        print(f"========= [AGENTD] {message} =========")
+    def log(self, message: str, **kwargs):
+        logger.info(message, extra=fields(**kwargs))
+
+    @staticmethod
+    def _log_event(
+        session: Session,
+        event: Event,
+        event_type: str,
+        debug_fields: dict = None,
+        **kwargs,
+    ):
+        """Logs one line per event, payloads (`debug_fields`) only at DEBUG level."""
+        if debug_fields and logger.isEnabledFor(logging.DEBUG):
+            kwargs.update(debug_fields)
+        logger.info(
+            "Agent event",
+            extra=fields(
+                session_id=session.id, author=event.author, type=event_type, **kwargs
+            ),
+        )
 
     @staticmethod
     def generate_user_id() -> str:
@@ -289,33 +349,21 @@ class AgentD:
         return "u_" + str(uuid.uuid4())
 
     async def new_sesion(self, user_id: str = None):
-        self.log(f"CREATING NEW SESSION FOR 'user:{user_id}'")
         session = await self.session_service.create_session(
             session_id=str(datetime.now().timestamp()),
             app_name="agentd",
             user_id=user_id,
         )
-        self.log(f"SESSION CREATED: {session.id} for user: {user_id}")
+        self.log("Session created", session_id=session.id, user_id=user_id)
         return session
 
-    @staticmethod
-    def get_progress_from_agent(agent_name: str) -> int:
-        """
-        Returns the progress percentage based on the agent_name.
-        """
-        agent_progress_map = {
-            "topic_analysis_agent": 5,
-            "problem_identification_agent": 15,
-            "solution_analysis_agent": 30,
-            "target_users_analysis_agent": 40,
-            "competitor_analysis_agent": 50,
-            "report_generation_agent": 70,
-            "idea_value_identifier_agent": 80,
-            "technical_advisor_agent": 90,
-            "architecture_agent": 100,
-        }
-
-        return agent_progress_map.get(agent_name, 100)
+    def _report_progress(self, agent_name: str, event_timer: AgentEventTimer, callback):
+        """Sends the progress and ETA estimated for a run working in `agent_name`."""
+        estimate = self.progress_estimator.estimate(
+            agent_name, event_timer.agent_seconds(agent_name)
+        )
+        if estimate is not None and callback:
+            callback(estimate, AgentD.EventType.PROGRESS_UPDATE)
 
     async def continue_session(
         self,
@@ -323,6 +371,7 @@ class AgentD:
         session: Session = None,
         session_id: str = None,
         callback=None,
+        token_usage: TokenUsage = None,
     ):
         if not session:
             if not session_id:
@@ -331,43 +380,117 @@ class AgentD:
             if not session:
                 raise ValueError(f"Session with ID {session_id} does not exist.")
 
-        self.log(f"CONTINUING SESSION '{session.id}'")
+        self.log("Continuing session", session_id=session.id)
 
         await self.run(
             session,
             new_message=types.Content(role="user", parts=[types.Part(text=message)]),
             callback=callback,
+            token_usage=token_usage,
         )
 
+    def _record_token_usage(
+        self, session: Session, event: Event, token_usage: TokenUsage, callback
+    ) -> bool:
+        """Records the usage of a model response, returns True once over budget."""
+        tokens = token_usage.record(event.author, event.usage_metadata)
+        record_token_usage(event.author, tokens)
+        if callback:
+            callback(token_usage.to_dict(), AgentD.EventType.TOKEN_USAGE)
+        if not token_usage.exceeded:
+            return False
+
+        logger.warning(
+            "Token budget exceeded, stopping the run",
+            extra=fields(
+                session_id=session.id,
+                agent=event.author,
+                budget=token_usage.budget,
+                total_tokens=token_usage.total_tokens,
+                last_call=tokens,
+            ),
+        )
+        if callback:
+            callback(token_usage.to_dict(), AgentD.EventType.TOKEN_BUDGET_EXCEEDED)
+        return True
+
     async def run(
-        self, session: Session, new_message: types.Content = None, callback=None
+        self,
+        session: Session,
+        new_message: types.Content = None,
+        callback=None,
+        token_usage: TokenUsage = None,
     ):
-        self.log(f"RUNNING AGENTD FOR SESSION '{session.id}'")
+        """
+        Runs the agents on a new message. The tokens of model responses are added
+        to `token_usage` (a new, unlimited one if not given), the run stops once
+        they exceed its budget.
+        """
+        self.log("Running AgentD", session_id=session.id)
 
         from google.genai import errors
 
+        if token_usage is None:
+            token_usage = TokenUsage(budget=None)
+        over_budget = False
+        failed = False
+        # agent durations feed the progress and ETA estimates of later runs
+        event_timer = AgentEventTimer(on_agent_finished=self.progress_estimator.record)
+        agent_name = None
+        events = self.runner.run_async(
+            user_id=session.user_id,
+            session_id=session.id,
+            new_message=new_message,
+            run_config=self.run_config,
+        )
         try:
-            async for event in self.runner.run_async(
-                user_id=session.user_id, session_id=session.id, new_message=new_message
-            ):
+            async for event in events:
                 event: Event
-                print(f"@({event.author})")
-
-                if event.content and event.content.parts:
+                event_timer.observe(event)
+                if not event.partial and event.author != agent_name:
+                    agent_name = event.author
+                    self._report_progress(agent_name, event_timer, callback)
+
+                if event.partial:
+                    # a chunk of a streamed response, the complete one follows
+                    parts = (event.content and event.content.parts) or []
+                    delta = "".join(
+                        part.text for part in parts if part.text and not part.thought
+                    )
+                    if delta and callback:
+                        callback(
+                            {"agent_name": event.author, "text": delta},
+                            AgentD.EventType.TEXT_DELTA,
+                        )
+                elif event.content and event.content.parts:
                     if event.get_function_calls():
                         if callback:
                             callback(event, AgentD.EventType.TOOL_CALL_REQUEST)
-                        print("  • Type: Tool Call Request")
-                        for call in event.get_function_calls():
-                            print(f"    ↳ Function: {call.name}")
-                            print(f"    ↳ Args: {call.args}")
+                        calls = event.get_function_calls()
+                        self._log_event(
+                            session,
+                            event,
+                            "tool_call",
+                            tools=[call.name for call in calls],
+                            debug_fields={
+                                "args": {call.name: call.args for call in calls}
+                            },
+                        )
                     elif event.get_function_responses():
                         if callback:
                             callback(event, AgentD.EventType.TOOL_RESULT)
-                        print("  • Type: Tool Result")
-                        for resp in event.get_function_responses():
-                            print(f"    ↳ Function: {resp.name}")
-                            print(f"    ↳ Result: {resp.response}")
+                        responses = event.get_function_responses()
+                        self._log_event(
+                            session,
+                            event,
+                            "tool_result",
+                            tools=[resp.name for resp in responses],
+                            debug_fields={
+                                "responses": {
+                                    resp.name: resp.response for resp in responses
+                                }
+                            },
+                        )
                     elif event.content.parts[0].text:
                         texts = [t.text.strip() for t in event.content.parts]
                         for text in texts:
@@ -380,8 +503,12 @@ class AgentD:
                                         .replace("</ASK>", "")
                                         .strip()
                                     )
-                                    print("  • Type: User Input Request")
-                                    print(f"    ↳ Prompt: {prompt}")
+                                    self._log_event(
+                                        session,
+                                        event,
+                                        "user_input_request",
+                                        prompt=prompt,
+                                    )
                                     callback(
                                         {
                                             "agent_name": event.author,
@@ -391,33 +518,32 @@ class AgentD:
                                     )
                                 else:
                                     callback([text], AgentD.EventType.TEXT_MESSAGE)
-                                    # calc progress based on agent name
-                                    agent_name = event.author
-                                    progress = AgentD.get_progress_from_agent(
-                                        agent_name
-                                    )
-                                    callback(
-                                        progress,
-                                        AgentD.EventType.PROGRESS_UPDATE,
+                                    self._report_progress(
+                                        agent_name, event_timer, callback
                                     )
 
-                        if event.partial:
-                            print("  • Type: Streaming Text Chunk")
-                        else:
-                            print("  • Type: Complete Text Message")
-                        print(f"    ↳ Text: {text}")
+                        self._log_event(
+                            session,
+                            event,
+                            "text",
+                            length=sum(len(text) for text in texts),
+                            debug_fields={"text": "\n".join(texts)},
+                        )
                     else:
-                        print("  • Type: Other Content (e.g., code result)")
+                        self._log_event(session, event, "other_content")
                 elif event.actions and (
                     event.actions.state_delta or event.actions.artifact_delta
                 ):
-                    print("  • Type: State/Artifact Update")
+                    # state values are whole reports, only their keys are logged
+                    self._log_event(
+                        session,
+                        event,
+                        "state_update",
+                        state_keys=list(event.actions.state_delta or {}),
+                        artifacts=list(event.actions.artifact_delta or {}),
+                        debug_fields={"state_delta": event.actions.state_delta},
+                    )
                     if event.actions.state_delta:
-                        print(f"    ↳ State Delta: {event.actions.state_delta}")
-                        print("    ↳ Updated State:")
-                        for key, value in event.actions.state_delta.items():
-                            print(f"      - {key}: {value}")
-
                         if "user_input_specs" in event.actions.state_delta:
                             user_input_specs = event.actions.state_delta[
                                 "user_input_specs"
@@ -431,25 +557,43 @@ class AgentD:
                                         AgentD.EventType.USER_INPUT_REQUEST,
                                     )
 
-                    if event.actions.artifact_delta:
-                        print(f"    ↳ Artifact Delta: {event.actions.artifact_delta}")
                 else:
-                    print("  • Type: Control Signal or Other")
+                    self._log_event(session, event, "control_signal")
                     if callback:
                         callback(event, AgentD.EventType.CONTROL_SIGNAL)
 
-        except errors.APIError as e:
-            import json
+                if event.usage_metadata and not event.partial:
+                    # checked after the response is handled, so its text isn't lost
+                    over_budget = self._record_token_usage(
+                        session, event, token_usage, callback
+                    )
+                    if over_budget:
+                        break
 
-            d = e.details
-            print(f"[ERROR] APIError: {json.dumps(d, indent=2)}")
+        except errors.APIError as e:
+            # fatal, or still failing after the model's retries
+            failed = True
+            logger.error(
+                "LLM API error",
+                extra=fields(session_id=session.id, code=e.code, details=e.details),
+            )
+            if callback:
+                callback(e, AgentD.EventType.CONTROL_SIGNAL)
         except Exception as e:
-            print(f"An error occurred while running AgentD: {e}")
+            failed = True
+            logger.exception(
+                "An error occurred while running AgentD",
+                extra=fields(session_id=session.id),
+            )
             if callback:
                 callback(e, AgentD.EventType.CONTROL_SIGNAL)
+        finally:
+            # stops the agents, also when the loop was left early
+            await events.aclose()
+            event_timer.finish()
 
-        if "master_report_url" in session.state:
-            master_report_url = session.state["master_report_url"]
+        if MASTER_REPORT_URL_KEY in session.state:
+            master_report_url = session.state[MASTER_REPORT_URL_KEY]
             if callback:
                 callback(
                     {
@@ -462,9 +606,13 @@ class AgentD:
                 )
 
         # check is user input is required
-        if session.state.get("user_input_specs") and session.state[
-            "user_input_specs"
-        ].get("required", False):
+        # (not once over budget or failed, the run is over and can't take an answer)
+        if (
+            not over_budget
+            and not failed
+            and session.state.get("user_input_specs")
+            and session.state["user_input_specs"].get("required", False)
+        ):
             user_input_specs = session.state["user_input_specs"]
             agent_asking = session.state.get("agent_name", "Unknown Agent")
             if callback:
@@ -473,9 +621,11 @@ class AgentD:
             prompt_for_user = user_input_specs.get(
                 "description", "Please provide your input."
             )
-            print("  • User Input Required:")
-            print(
-                f"    ↳ Specs: '{agent_asking}' is asking for input: {prompt_for_user}"
+            logger.info(
+                "User input required",
+                extra=fields(
+                    session_id=session.id, agent=agent_asking, prompt=prompt_for_user
+                ),
             )
             # since state is consumed, we can remove it
             session.state.pop("user_input_specs")
@@ -0,0 +1,113 @@
+"""Scripted answers for the questions agents ask, used to run pipelines unattended."""
+
+from typing import Dict, Optional
+
+# the questions the pipeline asks today, by the agent asking them
+SOLUTION_CHOICE_AGENT = "solution_analysis_agent"
+PROCEED_AGENT = "report_generation_agent"
+SOCIAL_MEDIA_POSTS_AGENT = "root_agent"
+
+DEFAULT_ANSWERS = {
+    # pick the first proposed solution
+    SOLUTION_CHOICE_AGENT: "1",
+    # proceed with the detailed report
+    PROCEED_AGENT: "yes",
+    # the social media posts the root agent offers are optional, skip them
+    SOCIAL_MEDIA_POSTS_AGENT: "no",
+}
+DEFAULT_ANSWER = "yes"
+# an agent asking more often than this is stuck in a loop
+DEFAULT_MAX_ANSWERS = 10
+MAX_ANSWER_LENGTH = 2000
+
+
+class AnswerPolicy:
+    """
+    Answers agent questions without a user, e.g. "pick solution 1" and "proceed yes".
+
+    Answers are looked up by the name of the agent asking, questions from other
+    agents get `default`. A policy without an answer (no `default`) or that has
+    answered `max_answers` times returns None, the run should then stop instead
+    of waiting for a user who isn't there.
+    """
+
+    def __init__(
+        self,
+        answers: Optional[Dict[str, str]] = None,
+        default: Optional[str] = DEFAULT_ANSWER,
+        max_answers: int = DEFAULT_MAX_ANSWERS,
+    ):
+        self.answers = dict(DEFAULT_ANSWERS if answers is None else answers)
+        self.default = default
+        self.max_answers = max_answers
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict]) -> "AnswerPolicy":
+        """
+        Builds a policy from a request body field, e.g.
+        `{"answers": {"solution_analysis_agent": "2"}, "default": "no"}`.
+        Missing fields keep their defaults.
+
+        Raises:
+            ValueError: if a field has the wrong type.
+        """
+        if data is None:
+            return cls()
+        if not isinstance(data, dict):
+            raise ValueError("Field 'answer_policy' must be an object.")
+
+        answers = data.get("answers")
+        if answers is not None:
+            if not isinstance(answers, dict):
+                raise ValueError("Field 'answer_policy.answers' must be an object.")
+            answers = {**DEFAULT_ANSWERS, **answers}
+            for agent_name, answer in answers.items():
+                cls._validate_answer(answer, f"answer_policy.answers.{agent_name}")
+
+        default = data.get("default", DEFAULT_ANSWER)
+        if default is not None:
+            cls._validate_answer(default, "answer_policy.default")
+
+        max_answers = data.get("max_answers", DEFAULT_MAX_ANSWERS)
+        if (
+            not isinstance(max_answers, int)
+            or isinstance(max_answers, bool)
+            or not 0 < max_answers <= 100
+        ):
+            raise ValueError(
+                "Field 'answer_policy.max_answers' must be an integer from 1 to 100."
+            )
+        return cls(answers, default, max_answers)
+
+    @staticmethod
+    def _validate_answer(answer, field: str):
+        if (
+            not isinstance(answer, str)
+            or not answer.strip()
+            or len(answer) > MAX_ANSWER_LENGTH
+        ):
+            raise ValueError(
+                f"Field '{field}' must be a non-empty string of at most"
+                f" {MAX_ANSWER_LENGTH} characters."
+            )
+
+    def answer_for(
+        self, user_input_specs: Dict, answers_given: int = 0
+    ) -> Optional[str]:
+        """
+        Returns the answer to a USER_INPUT_REQUEST, or None if the policy has none.
+
+        Args:
+            user_input_specs: The request, `agent_name` tells which agent is asking.
+            answers_given: How many questions of this run the policy already answered.
+        """
+        if answers_given >= self.max_answers:
+            return None
+        return self.answers.get(user_input_specs.get("agent_name"), self.default)
+
+    def to_dict(self) -> Dict:
+        return {
+            "answers": dict(self.answers),
+            "default": self.default,
+            "max_answers": self.max_answers,
+        }
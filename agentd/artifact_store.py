@@ -0,0 +1,189 @@
+"""
+Content-addressed storage for large session state values.
+
+Agents keep whole documents (analyses, reports) in the session state. Values
+of at least ARTIFACT_MIN_SIZE characters are stored once, by their SHA-256, and
+the state holds a short reference instead. References are resolved only where
+a value is used: in instruction templates (`state_instruction`) and in
+callbacks (`state_value`). Values not written or read for ARTIFACT_TTL_SECONDS
+are deleted by `sweep`.
+"""
+
+import hashlib
+import os
+import re
+import threading
+import time
+import uuid
+import zlib
+from typing import Any, Callable, Dict, Mapping, Optional
+
+from agentd.utils import get_generated_directory
+
+# directory of the stored values, `generated/artifacts` by default
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", "")
+# string state values at least this long are stored as artifacts, 0 = off
+ARTIFACT_MIN_SIZE = int(os.getenv("ARTIFACT_MIN_SIZE", "2048"))
+# artifacts not written or read for this long are deleted, 0 = never. Longer
+# than agent sessions are kept, so that a stored session keeps its values.
+ARTIFACT_TTL_SECONDS = float(os.getenv("ARTIFACT_TTL_SECONDS", str(8 * 24 * 60 * 60)))
+# an artifact's modification time is its last use, refreshed at most this often
+TOUCH_INTERVAL_SECONDS = 60 * 60
+
+REFERENCE_PREFIX = "artifact://sha256/"
+_REFERENCE_PATTERN = re.compile(re.escape(REFERENCE_PREFIX) + r"[0-9a-f]{64}\Z")
+# `{key}` and `{key?}` placeholders of instruction templates, like ADK's own
+_PLACEHOLDER_PATTERN = re.compile(r"{+[^{}]*}+")
+_STATE_PREFIXES = ("app:", "user:", "temp:")
+
+
+def is_reference(value: Any) -> bool:
+    return isinstance(value, str) and bool(_REFERENCE_PATTERN.match(value))
+
+
+class ArtifactStore:
+    """
+    Stores strings as compressed files named by the SHA-256 of their content,
+    so a value written twice (e.g. by every run on the same topic) is kept once.
+    A file's modification time is when it was last written or read (within
+    TOUCH_INTERVAL_SECONDS), which `sweep` uses to find unused artifacts.
+    """
+
+    def __init__(self, directory: str = None, min_size: int = ARTIFACT_MIN_SIZE):
+        self.directory = directory or os.path.join(
+            get_generated_directory(), "artifacts"
+        )
+        self.min_size = min_size
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def put(self, value: str) -> str:
+        """Stores `value` and returns its reference."""
+        data = value.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        if not self._touch(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # written under a unique name and renamed, readers never see part of it
+            temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(zlib.compress(data))
+            os.replace(temp_path, path)
+        return REFERENCE_PREFIX + digest
+
+    def get(self, reference: str) -> str:
+        """
+        Returns the value of a reference.
+
+        Raises:
+            KeyError: if the artifact doesn't exist.
+        """
+        digest = reference[len(REFERENCE_PREFIX) :]
+        path = self._path(digest)
+        try:
+            with open(path, "rb") as f:
+                value = zlib.decompress(f.read()).decode("utf-8")
+        except FileNotFoundError:
+            raise KeyError(reference) from None
+        self._touch(path)
+        return value
+
+    @staticmethod
+    def _touch(path: str) -> bool:
+        """Marks an artifact as used, False if it doesn't exist."""
+        try:
+            if time.time() - os.path.getmtime(path) > TOUCH_INTERVAL_SECONDS:
+                os.utime(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def sweep(self, max_age_seconds: float) -> int:
+        """
+        Deletes the artifacts (and abandoned partial writes) not written or read
+        for `max_age_seconds`.
+
+        Returns:
+            int: The number of deleted files.
+        """
+        cutoff = time.time() - max_age_seconds
+        deleted = 0
+        for directory, _, file_names in os.walk(self.directory):
+            for file_name in file_names:
+                path = os.path.join(directory, file_name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        deleted += 1
+                except FileNotFoundError:
+                    pass
+        return deleted
+
+    def offload(self, value: Any) -> Any:
+        """Returns a reference for large strings, other values unchanged."""
+        if (
+            self.min_size > 0
+            and isinstance(value, str)
+            and len(value) >= self.min_size
+            and not is_reference(value)
+        ):
+            return self.put(value)
+        return value
+
+    def offload_state_delta(self, state_delta: Dict[str, Any]):
+        """Replaces the large values of a state delta with references, in place."""
+        for key, value in state_delta.items():
+            # temp: values are never persisted, there is nothing to save
+            if not key.startswith("temp:"):
+                state_delta[key] = self.offload(value)
+
+    def resolve(self, value: Any) -> Any:
+        """Returns the stored value for a reference, other values unchanged."""
+        return self.get(value) if is_reference(value) else value
+
+
+_store: Optional[ArtifactStore] = None
+_store_lock = threading.Lock()
+
+
+def get_artifact_store() -> ArtifactStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ArtifactStore(ARTIFACT_DIR)
+        return _store
+
+
+def state_value(state: Mapping[str, Any], key: str, default: Any = None) -> Any:
+    """Returns `state[key]` (or `default`), loading it if it is a reference."""
+    if key not in state:
+        return default
+    return get_artifact_store().resolve(state[key])
+
+
+def state_instruction(template: str) -> Callable:
+    """
+    Returns an instruction provider for an instruction template. Like ADK's
+    templating, `{key}` is replaced with the state value (`{key?}` with an empty
+    string if it is missing), with references loaded from the artifact store.
+    Braces that don't name a state key, e.g. in JSON examples, are kept.
+    """
+
+    def instruction(context) -> str:
+        def replace(match: re.Match) -> str:
+            key = match.group().lstrip("{").rstrip("}").strip()
+            optional = key.endswith("?")
+            key = key.rstrip("?")
+            name = key.split(":", 1)[1] if key.startswith(_STATE_PREFIXES) else key
+            if not name.isidentifier():
+                return match.group()
+            if key in context.state:
+                return str(state_value(context.state, key))
+            if optional:
+                return ""
+            raise KeyError(f"Context variable not found: `{key}`.")
+
+        return _PLACEHOLDER_PATTERN.sub(replace, template)
+
+    return instruction
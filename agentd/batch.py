@@ -0,0 +1,240 @@
+"""
+Runs the pipeline for many topics without a user, e.g. for offline evaluations
+or to warm up caches. Sessions run concurrently on one event loop, questions
+are answered by an `AnswerPolicy` and every finished topic is written as one
+line of JSON.
+"""
+
+import asyncio
+import json
+import time
+from datetime import datetime
+from typing import IO, Dict, List, Optional
+
+from agentd.artifact_store import state_value
+from agentd.utils.log_utils import fields, get_logger
+
+from .agent import MASTER_REPORT_URL_KEY, AgentD
+from .answer_policy import AnswerPolicy
+from .token_usage import TokenUsage
+
+logger = get_logger(__name__)
+
+# topics running at the same time, like the API's batch runs
+DEFAULT_CONCURRENCY = 8
+
+
+def read_topics(path: str) -> List[Dict]:
+    """
+    Reads the topics of a JSONL file. A line is an object with a `topic`, or a
+    `title` and `body` (joined as the topic), an optional `id` (or `request_id`)
+    and an optional `answer_policy`. Blank lines are skipped.
+
+    Raises:
+        ValueError: if a line isn't a valid topic.
+    """
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"{path}:{line_number}: invalid JSON ({e}).")
+            if not isinstance(data, dict):
+                raise ValueError(f"{path}:{line_number}: expected an object.")
+
+            topic = data.get("topic")
+            if topic is None and data.get("title"):
+                topic = "\n\n".join(
+                    part for part in (data["title"], data.get("body")) if part
+                )
+            if not isinstance(topic, str) or not topic.strip():
+                raise ValueError(
+                    f"{path}:{line_number}: needs a non-empty 'topic' (or 'title')."
+                )
+
+            try:
+                answer_policy = (
+                    AnswerPolicy.from_dict(data["answer_policy"])
+                    if "answer_policy" in data
+                    else None
+                )
+            except ValueError as e:
+                raise ValueError(f"{path}:{line_number}: {e}")
+
+            items.append(
+                {
+                    "id": str(
+                        data.get("id")
+                        or data.get("request_id")
+                        or f"line-{line_number}"
+                    ),
+                    "topic": topic,
+                    "answer_policy": answer_policy,
+                }
+            )
+    return items
+
+
+def _output_keys(agent) -> List[str]:
+    """Returns the state keys the agents of the pipeline save their outputs to."""
+    keys = [agent.output_key] if getattr(agent, "output_key", None) else []
+    for sub_agent in agent.sub_agents:
+        keys.extend(_output_keys(sub_agent))
+    return keys
+
+
+async def run_topic(agentd: AgentD, item: Dict, answer_policy: AnswerPolicy) -> Dict:
+    """Runs the pipeline for one topic until it finishes, fails or has no answer."""
+    answer_policy = item.get("answer_policy") or answer_policy
+    token_usage = TokenUsage()
+    started_at = datetime.utcnow()
+    started = time.monotonic()
+    result = {
+        "id": item["id"],
+        "topic": item["topic"],
+        "pipeline_status": "completed",
+        "error": None,
+        "answers": [],
+        "files": [],
+    }
+    user_input_specs = None
+
+    def callback(event, event_type):
+        nonlocal user_input_specs
+        if event_type == AgentD.EventType.USER_INPUT_REQUEST:
+            user_input_specs = event
+        elif event_type == AgentD.EventType.FILE_URL:
+            result["files"].append(
+                {
+                    "url": event.get("url"),
+                    "name": event.get("name", "file"),
+                    "filetype": event.get("filetype", "txt"),
+                    "description": event.get("description", ""),
+                }
+            )
+        elif event_type == AgentD.EventType.CONTROL_SIGNAL:
+            result["pipeline_status"] = "failed"
+            result["error"] = str(event) or "An error occurred during processing."
+        elif event_type == AgentD.EventType.TOKEN_BUDGET_EXCEEDED:
+            result["pipeline_status"] = "failed"
+            result["error"] = (
+                f"Token budget exceeded: {event['total_tokens']} of"
+                f" {event['budget']} tokens used."
+            )
+
+    session = None
+    try:
+        session = await agentd.new_sesion(agentd.generate_user_id())
+        message = item["topic"]
+        while True:
+            user_input_specs = None
+            await agentd.continue_session(
+                message=message,
+                session=session,
+                callback=callback,
+                token_usage=token_usage,
+            )
+            if result["pipeline_status"] == "failed" or not user_input_specs:
+                break
+
+            answer = answer_policy.answer_for(user_input_specs, len(result["answers"]))
+            if answer is None:
+                result["pipeline_status"] = "failed"
+                result["error"] = "The answer policy has no answer for: " + (
+                    user_input_specs.get("description") or "the agent's question."
+                )
+                break
+            result["answers"].append(
+                {
+                    "agent_name": user_input_specs.get("agent_name"),
+                    "question": user_input_specs.get("description"),
+                    "answer": answer,
+                }
+            )
+            message = answer
+    except Exception as e:
+        logger.exception("Batch topic failed", extra=fields(id=item["id"]))
+        result["pipeline_status"] = "failed"
+        result["error"] = str(e)
+
+    outputs = {}
+    if session is not None:
+        # the runner saved the agents' outputs to the stored session
+        stored_session = await agentd.session_service.get_session(
+            app_name=session.app_name, user_id=session.user_id, session_id=session.id
+        )
+        state = stored_session.state if stored_session else {}
+        for key in _output_keys(agentd.runner.agent) + [MASTER_REPORT_URL_KEY]:
+            if key in state:
+                outputs[key] = state_value(state, key)
+
+    report_url = outputs.get(MASTER_REPORT_URL_KEY)
+    if report_url and all(file["url"] != report_url for file in result["files"]):
+        result["files"].append(
+            {
+                "url": report_url,
+                "name": "Master Report",
+                "filetype": "pdf",
+                "description": "Master report generated by AgentD.",
+            }
+        )
+
+    result.update(
+        outputs=outputs,
+        token_usage=token_usage.to_dict(),
+        started_at=started_at.isoformat(),
+        ended_at=datetime.utcnow().isoformat(),
+        duration_seconds=round(time.monotonic() - started, 3),
+    )
+    return result
+
+
+async def run_batch(
+    agentd: AgentD,
+    items: List[Dict],
+    output: IO[str],
+    concurrency: int = DEFAULT_CONCURRENCY,
+    answer_policy: Optional[AnswerPolicy] = None,
+) -> Dict[str, int]:
+    """
+    Runs every item, at most `concurrency` at a time, and writes each result to
+    `output` as one line of JSON as soon as it is done (so in the order items
+    finish).
+
+    Returns:
+        dict: The number of items per final pipeline status.
+    """
+    answer_policy = answer_policy or AnswerPolicy()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    statuses: Dict[str, int] = {}
+
+    async def run_item(index: int, item: Dict):
+        async with semaphore:
+            logger.info(
+                "Batch topic started",
+                extra=fields(id=item["id"], index=index, total=len(items)),
+            )
+            result = await run_topic(agentd, item, answer_policy)
+
+        statuses[result["pipeline_status"]] = (
+            statuses.get(result["pipeline_status"], 0) + 1
+        )
+        output.write(json.dumps(result, ensure_ascii=False, default=str) + "\n")
+        # a batch that is interrupted keeps the results written so far
+        output.flush()
+        logger.info(
+            "Batch topic finished",
+            extra=fields(
+                id=item["id"],
+                pipeline_status=result["pipeline_status"],
+                seconds=result["duration_seconds"],
+                done=sum(statuses.values()),
+                total=len(items),
+            ),
+        )
+
+    await asyncio.gather(*(run_item(i, item) for i, item in enumerate(items)))
+    return statuses
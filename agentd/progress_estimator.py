@@ -0,0 +1,240 @@
+"""
+Progress and ETA of a pipeline run, estimated from how long each agent took in
+earlier runs.
+"""
+
+import atexit
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Sequence
+
+from agentd.utils import get_generated_directory
+from agentd.utils.log_utils import fields, get_logger
+
+logger = get_logger(__name__)
+
+# where the recorded agent durations are kept, `generated/agent_durations.json` by default
+PROGRESS_HISTORY_PATH = os.getenv("PROGRESS_HISTORY_PATH", "")
+# durations kept per agent, older ones are dropped
+HISTORY_SIZE = 50
+# below this many recorded runs of an agent its default duration is used
+MIN_SAMPLES = 3
+# the history file is re-read this often, to pick up the runs of other processes
+RELOAD_INTERVAL_SECONDS = 60
+# recorded durations are written by a background thread, in batches this often
+WRITE_INTERVAL_SECONDS = 5
+
+# the agents of the pipeline in the order they run, each stage is a list of
+# branches that run in parallel, each branch a list of agents that run in order
+PIPELINE_STAGES = [
+    [["topic_analysis_agent"]],
+    [["problem_identification_agent"]],
+    [["solution_analysis_agent"]],
+    [["target_users_analysis_agent"]],
+    [["competitor_analysis_agent"]],
+    [["report_generation_agent"]],
+    [
+        ["idea_value_identifier_agent"],
+        ["technical_advisor_agent", "architecture_agent"],
+    ],
+]
+# seconds, used until an agent has a history
+DEFAULT_AGENT_SECONDS = {
+    "topic_analysis_agent": 15,
+    "problem_identification_agent": 30,
+    "solution_analysis_agent": 45,
+    "target_users_analysis_agent": 30,
+    "competitor_analysis_agent": 30,
+    "report_generation_agent": 60,
+    "idea_value_identifier_agent": 30,
+    "technical_advisor_agent": 30,
+    "architecture_agent": 30,
+}
+
+
+def percentile(values: Sequence[float], fraction: float) -> float:
+    """Returns the `fraction` percentile of `values`, interpolating between samples."""
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    lower, upper = math.floor(position), math.ceil(position)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+class ProgressEstimator:
+    """
+    Keeps the last `HISTORY_SIZE` durations of every agent in a small JSON file
+    and estimates a run's progress, weighted by the median duration of each
+    agent, and the seconds left until its agents are done.
+
+    The estimate covers the pipeline's agents, not the time waiting for answers.
+    The root agent (coordinating) and the optional social media agent don't
+    move the estimate.
+
+    Recorded durations are used right away and written to the file in batches
+    by a background thread, so recording never blocks an event loop on file I/O.
+    """
+
+    def __init__(self, path: str = None, stages: List[List[List[str]]] = None):
+        self.path = path or os.path.join(
+            get_generated_directory(), "agent_durations.json"
+        )
+        self.stages = PIPELINE_STAGES if stages is None else stages
+        self._lock = threading.Lock()
+        self._durations: Dict[str, List[float]] = {}
+        self._loaded_at = -math.inf
+        # durations recorded since the last write
+        self._pending: Dict[str, List[float]] = {}
+        self._write_lock = threading.Lock()
+        self._writer: Optional[threading.Thread] = None
+        self._positions = {
+            agent_name: (stage_index, branch_index, agent_index)
+            for stage_index, stage in enumerate(self.stages)
+            for branch_index, branch in enumerate(stage)
+            for agent_index, agent_name in enumerate(branch)
+        }
+
+    def _read_file(self) -> Dict[str, List[float]]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(
+                "Could not read the agent durations",
+                extra=fields(path=self.path, error=str(e)),
+            )
+            return {}
+
+    def _with_pending_locked(
+        self, durations: Dict[str, List[float]]
+    ) -> Dict[str, List[float]]:
+        """Returns `durations` with the durations that aren't written yet."""
+        merged = {agent: list(samples) for agent, samples in durations.items()}
+        for agent_name, samples in self._pending.items():
+            merged[agent_name] = (merged.get(agent_name, []) + samples)[-HISTORY_SIZE:]
+        return merged
+
+    def _durations_locked(self) -> Dict[str, List[float]]:
+        if time.monotonic() - self._loaded_at >= RELOAD_INTERVAL_SECONDS:
+            self._durations = self._with_pending_locked(self._read_file())
+            self._loaded_at = time.monotonic()
+        return self._durations
+
+    def record(self, agent_name: str, seconds: float):
+        """Adds a duration of an agent of the pipeline to the history."""
+        if agent_name not in self._positions:
+            return
+        with self._lock:
+            self._pending.setdefault(agent_name, []).append(round(seconds, 3))
+            samples = self._durations.setdefault(agent_name, [])
+            samples.append(round(seconds, 3))
+            del samples[:-HISTORY_SIZE]
+            if self._writer is None:
+                self._writer = threading.Thread(
+                    target=self._write_forever,
+                    name="progress-history-writer",
+                    daemon=True,
+                )
+                self._writer.start()
+                atexit.register(self.flush)
+
+    def _write_forever(self):
+        while True:
+            time.sleep(WRITE_INTERVAL_SECONDS)
+            self.flush()
+
+    def flush(self):
+        """Writes the durations recorded since the last write to the history file."""
+        with self._write_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            # merged into the latest file, so that processes don't drop each other's runs
+            durations = self._read_file()
+            for agent_name, samples in pending.items():
+                kept = durations.setdefault(agent_name, [])
+                kept.extend(samples)
+                del kept[:-HISTORY_SIZE]
+            with self._lock:
+                self._durations = self._with_pending_locked(durations)
+                self._loaded_at = time.monotonic()
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                temp_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    json.dump(durations, f)
+                os.replace(temp_path, self.path)
+            except OSError as e:
+                logger.warning(
+                    "Could not save the agent durations",
+                    extra=fields(path=self.path, error=str(e)),
+                )
+
+    def expected_seconds(self, agent_name: str, fraction: float = 0.5) -> float:
+        """Returns the `fraction` percentile of the agent's recorded durations."""
+        with self._lock:
+            samples = self._durations_locked().get(agent_name, [])
+        if len(samples) < MIN_SAMPLES:
+            return DEFAULT_AGENT_SECONDS.get(agent_name, 30)
+        return percentile(samples, fraction)
+
+    def estimate(self, agent_name: str, elapsed_seconds: float) -> Optional[Dict]:
+        """
+        Estimates the progress of a run whose agent `agent_name` has been working
+        for `elapsed_seconds`.
+
+        Returns:
+            dict: `progress` (0-99) and `eta_seconds`, the agent time left. None
+                for agents that don't belong to the pipeline's stages.
+        """
+        position = self._positions.get(agent_name)
+        if position is None:
+            return None
+        stage_index, branch_index, agent_index = position
+
+        stage_seconds = []
+        for stage in self.stages:
+            branch_seconds = [
+                sum(self.expected_seconds(name) for name in branch) for branch in stage
+            ]
+            # parallel branches, the stage takes as long as its slowest branch
+            stage_seconds.append(max(branch_seconds))
+
+        expected = self.expected_seconds(agent_name)
+        if elapsed_seconds > expected:
+            # running late, expect it to be done by a slow run's time
+            remaining = max(self.expected_seconds(agent_name, 0.9) - elapsed_seconds, 1)
+        else:
+            remaining = expected - elapsed_seconds
+
+        branch = self.stages[stage_index][branch_index]
+        stage_done = sum(self.expected_seconds(name) for name in branch[:agent_index])
+        stage_done += min(elapsed_seconds, expected)
+        # the rest of this branch, or of a slower parallel one
+        stage_left = max(stage_seconds[stage_index] - stage_done, remaining)
+
+        total = sum(stage_seconds)
+        done = sum(stage_seconds[:stage_index]) + stage_done
+        eta_seconds = stage_left + sum(stage_seconds[stage_index + 1 :])
+        return {
+            "progress": min(int(100 * done / total), 99) if total else 0,
+            "eta_seconds": round(eta_seconds),
+        }
+
+
+_estimator: Optional[ProgressEstimator] = None
+_estimator_lock = threading.Lock()
+
+
+def get_progress_estimator() -> ProgressEstimator:
+    global _estimator
+    with _estimator_lock:
+        if _estimator is None:
+            _estimator = ProgressEstimator(PROGRESS_HISTORY_PATH)
+        return _estimator
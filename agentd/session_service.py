@@ -0,0 +1,540 @@
+"""ADK session services for AgentD: in memory, or persisted in SQLite."""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+from google.adk.events import Event
+from google.adk.sessions import BaseSessionService, InMemorySessionService, Session
+from google.adk.sessions.base_session_service import (
+    GetSessionConfig,
+    ListSessionsResponse,
+)
+from google.adk.sessions.state import State
+
+from agentd.artifact_store import (
+    ARTIFACT_TTL_SECONDS,
+    ArtifactStore,
+    get_artifact_store,
+)
+from agentd.utils import get_generated_directory
+from agentd.utils.log_utils import fields, get_logger
+
+logger = get_logger(__name__)
+
+# sessions not updated for this long are deleted, with their events
+DEFAULT_SESSION_TTL_SECONDS = float(
+    os.getenv("AGENT_SESSION_TTL_SECONDS", str(7 * 24 * 60 * 60))
+)
+# expired sessions are looked for this often
+PURGE_INTERVAL_SECONDS = 60 * 60
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS adk_sessions (
+    app_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    state TEXT NOT NULL,
+    update_time REAL NOT NULL,
+    PRIMARY KEY (app_name, user_id, session_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS adk_sessions_update_time ON adk_sessions (update_time);
+CREATE TABLE IF NOT EXISTS adk_events (
+    seq INTEGER PRIMARY KEY,
+    app_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS adk_events_session
+    ON adk_events (app_name, user_id, session_id, seq);
+CREATE TABLE IF NOT EXISTS adk_app_states (
+    app_name TEXT PRIMARY KEY,
+    state TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS adk_user_states (
+    app_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    state TEXT NOT NULL,
+    PRIMARY KEY (app_name, user_id)
+) WITHOUT ROWID;
+"""
+
+
+def _encode_event(event: Event) -> bytes:
+    return zlib.compress(event.model_dump_json(exclude_none=True).encode("utf-8"))
+
+
+def _decode_event(data: bytes) -> Event:
+    return Event.model_validate_json(zlib.decompress(data))
+
+
+def _run_periodically(name: str, interval: float, function: Callable[[], None]):
+    """Calls `function` now and then every `interval` seconds, in a daemon thread."""
+
+    def run_forever():
+        while True:
+            try:
+                function()
+            except Exception:
+                logger.exception("Periodic task failed", extra=fields(task=name))
+            time.sleep(interval)
+
+    threading.Thread(target=run_forever, name=name, daemon=True).start()
+
+
+def _split_state_delta(state_delta: Dict[str, Any]):
+    """Splits a state delta into its app, user and session scoped keys."""
+    app_delta, user_delta, session_delta = {}, {}, {}
+    for key, value in state_delta.items():
+        if key.startswith(State.APP_PREFIX):
+            app_delta[key[len(State.APP_PREFIX) :]] = value
+        elif key.startswith(State.USER_PREFIX):
+            user_delta[key[len(State.USER_PREFIX) :]] = value
+        elif not key.startswith(State.TEMP_PREFIX):
+            session_delta[key] = value
+    return app_delta, user_delta, session_delta
+
+
+class SQLiteSessionService(BaseSessionService):
+    """
+    Keeps ADK sessions in a SQLite database, so that conversations survive a
+    restart and only the sessions being worked on are held in memory.
+
+    Events are stored as compressed JSON, one row each, next to a snapshot of
+    the session state that is updated with every state delta, so loading a
+    session never replays its events. App (`app:`) and user (`user:`) state is
+    stored once and merged into the sessions it belongs to, `temp:` state is not
+    stored. Sessions not updated for `ttl_seconds` are deleted by a background
+    thread every `purge_interval` seconds (0 = never).
+
+    The database is used from worker threads (`asyncio.to_thread`), so the
+    runner's event loop keeps serving other sessions while a call waits for
+    the write lock or the disk.
+    """
+
+    def __init__(
+        self,
+        db_path: str = None,
+        ttl_seconds: float = DEFAULT_SESSION_TTL_SECONDS,
+        purge_interval: float = PURGE_INTERVAL_SECONDS,
+    ):
+        if not db_path:
+            db_path = os.path.join(get_generated_directory(), "agent_sessions.db")
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        self._connection().executescript(_SQLITE_SCHEMA)
+        if ttl_seconds and purge_interval:
+            _run_periodically(
+                "agent-session-purge", purge_interval, self._purge_expired
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite connections can't be shared between threads, keep one per thread
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def _transaction(self, write: bool = True):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    @staticmethod
+    def _load_state(connection: sqlite3.Connection, query: str, params) -> Dict:
+        row = connection.execute(query, params).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def _merge_state(
+        self, connection: sqlite3.Connection, app_name: str, user_id: str, state: Dict
+    ) -> Dict:
+        app_state = self._load_state(
+            connection,
+            "SELECT state FROM adk_app_states WHERE app_name = ?",
+            (app_name,),
+        )
+        user_state = self._load_state(
+            connection,
+            "SELECT state FROM adk_user_states WHERE app_name = ? AND user_id = ?",
+            (app_name, user_id),
+        )
+        state = dict(state)
+        state.update(
+            {State.APP_PREFIX + key: value for key, value in app_state.items()}
+        )
+        state.update(
+            {State.USER_PREFIX + key: value for key, value in user_state.items()}
+        )
+        return state
+
+    async def create_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        state: Optional[Dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+    ) -> Session:
+        return await asyncio.to_thread(
+            self._create_session, app_name, user_id, state, session_id
+        )
+
+    def _create_session(
+        self,
+        app_name: str,
+        user_id: str,
+        state: Optional[Dict[str, Any]],
+        session_id: Optional[str],
+    ) -> Session:
+        session_id = (session_id or "").strip() or str(uuid.uuid4())
+        app_delta, user_delta, session_state = _split_state_delta(state or {})
+        update_time = time.time()
+        with self._transaction() as connection:
+            connection.execute(
+                "INSERT INTO adk_sessions"
+                " (app_name, user_id, session_id, state, update_time)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (app_name, user_id, session_id, json.dumps(session_state), update_time),
+            )
+            self._update_shared_state(
+                connection, app_name, user_id, app_delta, user_delta
+            )
+            merged_state = self._merge_state(
+                connection, app_name, user_id, session_state
+            )
+
+        return Session(
+            app_name=app_name,
+            user_id=user_id,
+            id=session_id,
+            state=merged_state,
+            last_update_time=update_time,
+        )
+
+    async def get_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        config: Optional[GetSessionConfig] = None,
+    ) -> Optional[Session]:
+        return await asyncio.to_thread(
+            self._get_session, app_name, user_id, session_id, config
+        )
+
+    def _get_session(
+        self,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        config: Optional[GetSessionConfig],
+    ) -> Optional[Session]:
+        key = (app_name, user_id, session_id)
+        query = (
+            "SELECT data FROM adk_events"
+            " WHERE app_name = ? AND user_id = ? AND session_id = ?"
+        )
+        params = key
+        if config and config.after_timestamp:
+            query += " AND timestamp >= ?"
+            params += (config.after_timestamp,)
+        if config and config.num_recent_events:
+            # the most recent ones, put back in order below
+            query += " ORDER BY seq DESC LIMIT ?"
+            params += (config.num_recent_events,)
+        else:
+            query += " ORDER BY seq"
+
+        with self._transaction(write=False) as connection:
+            row = connection.execute(
+                "SELECT state, update_time FROM adk_sessions"
+                " WHERE app_name = ? AND user_id = ? AND session_id = ?",
+                key,
+            ).fetchone()
+            if row is None:
+                return None
+            state = self._merge_state(connection, app_name, user_id, json.loads(row[0]))
+            event_rows = connection.execute(query, params).fetchall()
+
+        events = [_decode_event(data) for (data,) in event_rows]
+        if config and config.num_recent_events:
+            events.reverse()
+        return Session(
+            app_name=app_name,
+            user_id=user_id,
+            id=session_id,
+            state=state,
+            events=events,
+            last_update_time=row[1],
+        )
+
+    async def list_sessions(
+        self, *, app_name: str, user_id: str
+    ) -> ListSessionsResponse:
+        rows = await asyncio.to_thread(self._list_sessions, app_name, user_id)
+        # like ADK's own services, listed sessions come without events and state
+        return ListSessionsResponse(
+            sessions=[
+                Session(
+                    app_name=app_name,
+                    user_id=user_id,
+                    id=session_id,
+                    last_update_time=update_time,
+                )
+                for session_id, update_time in rows
+            ]
+        )
+
+    def _list_sessions(self, app_name: str, user_id: str):
+        return (
+            self._connection()
+            .execute(
+                "SELECT session_id, update_time FROM adk_sessions"
+                " WHERE app_name = ? AND user_id = ?",
+                (app_name, user_id),
+            )
+            .fetchall()
+        )
+
+    async def delete_session(
+        self, *, app_name: str, user_id: str, session_id: str
+    ) -> None:
+        await asyncio.to_thread(self._delete_session, app_name, user_id, session_id)
+
+    def _delete_session(self, app_name: str, user_id: str, session_id: str):
+        key = (app_name, user_id, session_id)
+        with self._transaction() as connection:
+            connection.execute(
+                "DELETE FROM adk_events"
+                " WHERE app_name = ? AND user_id = ? AND session_id = ?",
+                key,
+            )
+            connection.execute(
+                "DELETE FROM adk_sessions"
+                " WHERE app_name = ? AND user_id = ? AND session_id = ?",
+                key,
+            )
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        # updates the caller's session, partial events are not stored
+        await super().append_event(session=session, event=event)
+        if event.partial:
+            return event
+
+        if await asyncio.to_thread(self._store_event, session, event):
+            session.last_update_time = event.timestamp
+        return event
+
+    def _store_event(self, session: Session, event: Event) -> bool:
+        """Stores an event and its state delta, False if the session is unknown."""
+        key = (session.app_name, session.user_id, session.id)
+        app_delta, user_delta, session_delta = _split_state_delta(
+            (event.actions and event.actions.state_delta) or {}
+        )
+        with self._transaction() as connection:
+            row = connection.execute(
+                "SELECT state FROM adk_sessions"
+                " WHERE app_name = ? AND user_id = ? AND session_id = ?",
+                key,
+            ).fetchone()
+            if row is None:
+                logger.warning(
+                    "Event for an unknown session not stored",
+                    extra=fields(session_id=session.id, user_id=session.user_id),
+                )
+                return False
+
+            connection.execute(
+                "INSERT INTO adk_events"
+                " (app_name, user_id, session_id, timestamp, data)"
+                " VALUES (?, ?, ?, ?, ?)",
+                key + (event.timestamp, _encode_event(event)),
+            )
+            if session_delta:
+                state = json.loads(row[0])
+                state.update(session_delta)
+                connection.execute(
+                    "UPDATE adk_sessions SET state = ?, update_time = ?"
+                    " WHERE app_name = ? AND user_id = ? AND session_id = ?",
+                    (json.dumps(state), event.timestamp) + key,
+                )
+            else:
+                connection.execute(
+                    "UPDATE adk_sessions SET update_time = ?"
+                    " WHERE app_name = ? AND user_id = ? AND session_id = ?",
+                    (event.timestamp,) + key,
+                )
+            self._update_shared_state(
+                connection, session.app_name, session.user_id, app_delta, user_delta
+            )
+        return True
+
+    def _update_shared_state(
+        self,
+        connection: sqlite3.Connection,
+        app_name: str,
+        user_id: str,
+        app_delta: Dict,
+        user_delta: Dict,
+    ):
+        if app_delta:
+            state = self._load_state(
+                connection,
+                "SELECT state FROM adk_app_states WHERE app_name = ?",
+                (app_name,),
+            )
+            state.update(app_delta)
+            connection.execute(
+                "INSERT OR REPLACE INTO adk_app_states (app_name, state) VALUES (?, ?)",
+                (app_name, json.dumps(state)),
+            )
+        if user_delta:
+            state = self._load_state(
+                connection,
+                "SELECT state FROM adk_user_states WHERE app_name = ? AND user_id = ?",
+                (app_name, user_id),
+            )
+            state.update(user_delta)
+            connection.execute(
+                "INSERT OR REPLACE INTO adk_user_states (app_name, user_id, state)"
+                " VALUES (?, ?, ?)",
+                (app_name, user_id, json.dumps(state)),
+            )
+
+    def _purge_expired(self):
+        cutoff = time.time() - self.ttl_seconds
+        with self._transaction() as connection:
+            connection.execute(
+                "DELETE FROM adk_events WHERE (app_name, user_id, session_id) IN"
+                " (SELECT app_name, user_id, session_id FROM adk_sessions"
+                " WHERE update_time < ?)",
+                (cutoff,),
+            )
+            purged = connection.execute(
+                "DELETE FROM adk_sessions WHERE update_time < ?", (cutoff,)
+            ).rowcount
+        if purged:
+            logger.info("Expired agent sessions deleted", extra=fields(count=purged))
+
+
+class ArtifactOffloadingSessionService(BaseSessionService):
+    """
+    Wraps a session service so that large state values are written to an
+    artifact store, and the state deltas of events (and so the session state
+    and stored events) hold references to them. Read them with `state_value`.
+
+    Like expired sessions, artifacts unused for `ttl_seconds` are deleted by a
+    background thread every `sweep_interval` seconds (0 = never).
+    """
+
+    def __init__(
+        self,
+        session_service: BaseSessionService,
+        store: ArtifactStore,
+        ttl_seconds: float = ARTIFACT_TTL_SECONDS,
+        sweep_interval: float = PURGE_INTERVAL_SECONDS,
+    ):
+        self.session_service = session_service
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+        if ttl_seconds and sweep_interval:
+            _run_periodically("artifact-sweep", sweep_interval, self._sweep_artifacts)
+
+    def _sweep_artifacts(self):
+        deleted = self.store.sweep(self.ttl_seconds)
+        if deleted:
+            logger.info("Unused artifacts deleted", extra=fields(count=deleted))
+
+    async def create_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        state: Optional[Dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+    ) -> Session:
+        if state:
+            state = dict(state)
+            self.store.offload_state_delta(state)
+        return await self.session_service.create_session(
+            app_name=app_name, user_id=user_id, state=state, session_id=session_id
+        )
+
+    async def get_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        config: Optional[GetSessionConfig] = None,
+    ) -> Optional[Session]:
+        return await self.session_service.get_session(
+            app_name=app_name, user_id=user_id, session_id=session_id, config=config
+        )
+
+    async def list_sessions(
+        self, *, app_name: str, user_id: str
+    ) -> ListSessionsResponse:
+        return await self.session_service.list_sessions(
+            app_name=app_name, user_id=user_id
+        )
+
+    async def delete_session(
+        self, *, app_name: str, user_id: str, session_id: str
+    ) -> None:
+        # artifacts are shared by content, they are not deleted with a session
+        await self.session_service.delete_session(
+            app_name=app_name, user_id=user_id, session_id=session_id
+        )
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        if not event.partial and event.actions and event.actions.state_delta:
+            self.store.offload_state_delta(event.actions.state_delta)
+        return await self.session_service.append_event(session, event)
+
+
+def get_session_service() -> BaseSessionService:
+    """
+    Returns the session service selected by the `AGENT_SESSION_SERVICE` environment
+    variable: `memory` (default, lost on restart) or `sqlite` (file set by
+    `AGENT_SESSION_DB_PATH`). Large state values go to the artifact store unless
+    `ARTIFACT_MIN_SIZE` is 0.
+    """
+    backend = os.getenv("AGENT_SESSION_SERVICE", "memory").lower()
+    if backend == "memory":
+        session_service = InMemorySessionService()
+    elif backend == "sqlite":
+        session_service = SQLiteSessionService(os.getenv("AGENT_SESSION_DB_PATH"))
+    else:
+        raise ValueError(
+            f"Unknown AGENT_SESSION_SERVICE '{backend}', use 'memory' or 'sqlite'."
+        )
+
+    artifact_store = get_artifact_store()
+    if artifact_store.min_size > 0:
+        session_service = ArtifactOffloadingSessionService(
+            session_service, artifact_store
+        )
+    return session_service
@@ -7,12 +7,14 @@ Architecture Agent: Designs a suitable technical architecture with reasoning for
 from google.adk.agents import Agent
 from google.adk.tools import google_search
 
+from agentd.artifact_store import state_instruction
+
 from . import agent_constants
 
 architecture_agent = Agent(
     name=agent_constants.AGENT_NAME,
     model=agent_constants.MODEL,
-    instruction=agent_constants.AGENT_INSTRUCTION,
+    instruction=state_instruction(agent_constants.AGENT_INSTRUCTION),
     description=agent_constants.AGENT_DESCRIPTION,
     tools=[google_search],  # so that agent can access actual pricing information
     output_key="architecture_agent",
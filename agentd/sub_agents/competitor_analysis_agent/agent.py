@@ -8,13 +8,17 @@ from google.adk.agents import Agent
 from google.adk.agents.callback_context import CallbackContext
 from google.adk.tools import google_search
 
+from agentd.artifact_store import state_instruction, state_value
 from agentd.utils import extract_all_urls, resolve_redirect
+from agentd.utils.log_utils import fields, get_logger
 
 from . import agent_constants
 
+logger = get_logger(__name__)
+
 
 def after_agent_callback(callback_context: CallbackContext, *args, **kwargs):
-    output = callback_context.state.get("competitor_analysis", "")
+    output = state_value(callback_context.state, "competitor_analysis", "")
 
     urls = extract_all_urls(output)
     if not urls:
@@ -26,7 +30,7 @@ def after_agent_callback(callback_context: CallbackContext, *args, **kwargs):
             if resolved_url:
                 output = output.replace(url, resolved_url)
         except Exception as e:
-            print(f"Error resolving URL {url}: {e}")
+            logger.warning("Error resolving URL", extra=fields(url=url, error=str(e)))
 
     callback_context.state["competitor_analysis"] = output
 
@@ -34,7 +38,7 @@ def after_agent_callback(callback_context: CallbackContext, *args, **kwargs):
 competitor_analysis_agent = Agent(
     name=agent_constants.AGENT_NAME,
     model=agent_constants.MODEL,
-    instruction=agent_constants.AGENT_INSTRUCTION,
+    instruction=state_instruction(agent_constants.AGENT_INSTRUCTION),
     description=agent_constants.AGENT_DESCRIPTION,
     after_agent_callback=after_agent_callback,
     tools=[google_search],
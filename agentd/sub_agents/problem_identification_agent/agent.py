@@ -7,12 +7,14 @@ Problem Identification Agent: Researches and identifies prevalent problems, chal
 from google.adk.agents import Agent
 from google.adk.tools import google_search
 
+from agentd.artifact_store import state_instruction
+
 from . import agent_constants
 
 problem_identification_agent = Agent(
     name=agent_constants.AGENT_NAME,
     model=agent_constants.MODEL,
-    instruction=agent_constants.AGENT_INSTRUCTION,
+    instruction=state_instruction(agent_constants.AGENT_INSTRUCTION),
     description=agent_constants.AGENT_DESCRIPTION,
     tools=[google_search],
     output_key="problem_statements",
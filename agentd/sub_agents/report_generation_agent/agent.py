@@ -11,20 +11,24 @@ from google.adk.agents.callback_context import CallbackContext
 from google.adk.models import LlmResponse
 from google.genai import types
 
+from agentd.artifact_store import state_instruction, state_value
 from agentd.sub_agents.image_prompt_agent import image_prompt_agent_tool
 from agentd.utils import LinkInjectorAgent, create_and_upload_pdf, json_to_markdown
+from agentd.utils.log_utils import fields, get_logger
 
 from . import agent_constants
 
+logger = get_logger(__name__)
+
 
 def after_model_callback_modifier(
     callback_context: CallbackContext, llm_response: LlmResponse
 ):
     text = llm_response.content.parts[0].text
 
-    print("===" * 8)
-    print(f"[Callback] After model call for agent: {callback_context.agent_name}")
-    print("===" * 8)
+    logger.debug(
+        "After model callback", extra=fields(agent=callback_context.agent_name)
+    )
 
     if "report" not in text.lower():
         return None
@@ -38,16 +42,15 @@ def after_model_callback_modifier(
     report_content = report_content.replace("</DO_NOT_CHANGE>", "")
 
     target_users_analysis = json_to_markdown(
-        json.loads(callback_context.state["target_users_analysis"])
+        json.loads(state_value(callback_context.state, "target_users_analysis"))
     )
 
     if callback_context.state.get("users_analysis_image_urls", []):
         target_users_analysis += "\n\n### User Analysis Images\n"
         for image_url in callback_context.state["users_analysis_image_urls"]:
-            print(f"Adding image URL to report: {image_url}")
             target_users_analysis += f"![User Analysis Image]({image_url})\n"
     else:
-        print("No user analysis images found in state.")
+        logger.debug("No user analysis images found in state")
 
     key = "@[TARGET_USERS_PLACEHOLDER]@"
     if key in report_content:
@@ -55,8 +58,10 @@ def after_model_callback_modifier(
     else:
         landscape_text = report_content.lower().find("Competitive Landscape".lower())
         if landscape_text != -1:
-            print(
-                f"Key '{key}' not found in report content. Adding target users analysis before 'Competitive Landscape'."
+            logger.debug(
+                "Placeholder not found in report content, adding target users"
+                " analysis before 'Competitive Landscape'",
+                extra=fields(key=key),
             )
             report_content = (
                 report_content[:landscape_text]
@@ -64,12 +69,10 @@ def after_model_callback_modifier(
                 + report_content[landscape_text:]
             )
 
-    print("==== REPLACING Link Identifiers with URLs ====")
     # [2] Replace the Image Identifiers generated by the image prompt agent with actual image urls
     report_content = LinkInjectorAgent.replace_identifiers_with_urls(
         text=report_content, state=callback_context.state
     )
-    print("==== Link Identifiers replaced with URLs ====")
 
     return LlmResponse(
         content=types.Content(
@@ -93,10 +96,8 @@ def simple_after_agent_callback_modifier(
     # 4. Create and Upload the report to cloud storage and return the public URL
 
     agent_name = callback_context.agent_name
-    print("===" * 8)
-    print(f"[Callback] Before model call for agent: {agent_name}")
-    print("===" * 8)
-    report_content: str = callback_context.state["generated_report"]
+    logger.debug("After agent callback", extra=fields(agent=agent_name))
+    report_content: str = state_value(callback_context.state, "generated_report")
 
     try:
         # [4] Create and Upload the report to cloud storage and return the public URL
@@ -106,8 +107,7 @@ def simple_after_agent_callback_modifier(
             local_dir="reports",
             remote_dir="reports",
         )
-        print("==== Report generation completed successfully.==== ")
-        print(f"Public URL of the report: {public_url}")
+        logger.info("Report generated", extra=fields(url=public_url))
         callback_context.state["generated_report_url"] = public_url
 
         return types.Content(
@@ -121,8 +121,8 @@ def simple_after_agent_callback_modifier(
             ],
             role="model",
         )
-    except Exception as e:
-        print(f"Error during report generation: {e}")
+    except Exception:
+        logger.exception("Error during report generation")
         return types.Content(
             parts=[types.Part(text="An error occurred while generating the report.")],
             role="model",
@@ -132,7 +132,7 @@ def simple_after_agent_callback_modifier(
 report_generation_agent = Agent(
     name=agent_constants.AGENT_NAME,
     model=agent_constants.MODEL,
-    instruction=agent_constants.AGENT_INSTRUCTION,
+    instruction=state_instruction(agent_constants.AGENT_INSTRUCTION),
     description=agent_constants.AGENT_DESCRIPTION,
     after_agent_callback=simple_after_agent_callback_modifier,
     tools=[image_prompt_agent_tool],
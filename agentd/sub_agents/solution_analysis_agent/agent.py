@@ -9,23 +9,32 @@ from google.adk.agents.callback_context import CallbackContext
 from google.adk.models import LlmResponse
 from google.adk.tools import transfer_to_agent
 
+from agentd.artifact_store import state_instruction
+from agentd.utils.log_utils import fields, get_logger
+
 from . import agent_constants
 
+logger = get_logger(__name__)
+
 
 def simpler_after_model_modifier(
     callback_context: CallbackContext, llm_response: LlmResponse
 ):
     """A simpler after model callback that just returns the state as is."""
-    print("===" * 8)
-    print(f"[Callback] Before model call for agent: {callback_context.agent_name}")
-    print("===" * 8)
+    if llm_response.partial:
+        # ask and hand back to the root agent once, after the complete response
+        return None
+
+    logger.debug(
+        "After model callback", extra=fields(agent=callback_context.agent_name)
+    )
 
     callback_context.state["user_input_specs"] = {
         "required": True,
         "agent_name": agent_constants.AGENT_NAME,
         "description": "Please provide the number of the solution you would like to proceed with, or a new problem statement for analysis.",
     }
-    print("ADDED user input specs to state")
+    logger.debug("Added user input specs to state")
 
     from google.genai import types
 
@@ -56,7 +65,7 @@ def simpler_after_model_modifier(
 solution_analysis_agent = Agent(
     name=agent_constants.AGENT_NAME,
     model=agent_constants.MODEL,
-    instruction=agent_constants.AGENT_INSTRUCTION,
+    instruction=state_instruction(agent_constants.AGENT_INSTRUCTION),
     description=agent_constants.AGENT_DESCRIPTION,
     after_model_callback=simpler_after_model_modifier,
     tools=[transfer_to_agent],
@@ -11,11 +11,15 @@ from google.adk.agents.callback_context import CallbackContext
 from google.adk.tools import BaseTool, google_search
 from google.genai import types
 
+from agentd.artifact_store import state_instruction, state_value
 from agentd.tools import generate_diagrams
 from agentd.utils import extract_json_from_text
+from agentd.utils.log_utils import fields, get_logger
 
 from . import agent_constants
 
+logger = get_logger(__name__)
+
 
 def generate_diagrams_tool(data: str, *args, **kwargs) -> str:
     """
@@ -44,13 +48,14 @@ def generate_diagrams_tool(data: str, *args, **kwargs) -> str:
         image_public_urls = generate_diagrams(json_data)
         failure = False
     except Exception as e:
-        error_msg = f"Error generating diagrams: {str(e)}, Continue with the analysis."
-        print(error_msg)
+        logger.warning(
+            "Error generating diagrams, continuing with the analysis",
+            extra=fields(error=str(e)),
+        )
         failure = True
 
     if not json_data:
-        error_msg = "No valid JSON data found in the input. Cannot generate diagrams."
-        print(error_msg)
+        logger.warning("No valid JSON data found in the input, no diagrams generated")
         return None, [], True
 
     # remove diagram specific data since we dont require it post diagram generation
@@ -64,24 +69,24 @@ def generate_diagrams_tool(data: str, *args, **kwargs) -> str:
 
 def simple_after_model_modifier(callback_context: CallbackContext, *args, **kwargs):
     """Inspects/modifies the LLM request or skips the call."""
-    print("===" * 8)
-    print(f"[Callback] After model call for agent: {callback_context.agent_name}")
-    print("===" * 8)
+    logger.debug(
+        "After model callback", extra=fields(agent=callback_context.agent_name)
+    )
 
     callback_context.state["users_analysis_image_urls"] = []
 
     # generate diagram and remove non-required data
     post_image_generation_result = generate_diagrams_tool(
-        callback_context.state["target_users_analysis"]
+        state_value(callback_context.state, "target_users_analysis")
     )
     json_data, image_public_urls, failure = post_image_generation_result
 
     if not failure:
         # update the state with the generated image URLs
         callback_context.state["users_analysis_image_urls"] = image_public_urls
-        print("Diagrams generated successfully and state updated.")
+        logger.info("Diagrams generated", extra=fields(count=len(image_public_urls)))
     else:
-        print("Failed to generate diagrams.")
+        logger.warning("Failed to generate diagrams")
 
     # update the state with the modified JSON data if available
     if json_data:
@@ -95,7 +100,7 @@ def simple_after_model_modifier(callback_context: CallbackContext, *args, **kwar
 target_users_analysis_agent = Agent(
     name=agent_constants.AGENT_NAME,
     model=agent_constants.MODEL,
-    instruction=agent_constants.AGENT_INSTRUCTION,
+    instruction=state_instruction(agent_constants.AGENT_INSTRUCTION),
     description=agent_constants.AGENT_DESCRIPTION,
     after_agent_callback=simple_after_model_modifier,
     tools=[
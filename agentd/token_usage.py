@@ -0,0 +1,63 @@
+"""Token usage of a pipeline run, per agent, and the run's token budget."""
+
+import os
+from typing import Dict, Optional
+
+# tokens (prompt and output) a run may use before it is stopped, 0 = no budget
+DEFAULT_TOKEN_BUDGET = int(os.getenv("SESSION_TOKEN_BUDGET", "0"))
+
+
+class TokenUsage:
+    """
+    Adds up the `usage_metadata` of the model responses of one run, by the agent
+    that made the call. Pass the same instance to every `continue_session` of the
+    run so that the budget covers the whole conversation.
+    """
+
+    def __init__(self, budget: Optional[int] = DEFAULT_TOKEN_BUDGET):
+        self.budget = budget or None
+        # agent name -> {"calls", "prompt_tokens", "output_tokens", "total_tokens"}
+        self.agents: Dict[str, Dict[str, int]] = {}
+
+    def record(self, agent_name: str, usage_metadata) -> Dict[str, int]:
+        """
+        Adds the usage of one model response.
+
+        Returns:
+            dict: The tokens of this response, by type.
+        """
+        prompt_tokens = usage_metadata.prompt_token_count or 0
+        output_tokens = usage_metadata.candidates_token_count or 0
+        tokens = {
+            "prompt_tokens": prompt_tokens,
+            "output_tokens": output_tokens,
+            # includes tokens the model spent thinking
+            "total_tokens": usage_metadata.total_token_count
+            or prompt_tokens + output_tokens,
+        }
+
+        agent_usage = self.agents.setdefault(
+            agent_name,
+            {"calls": 0, "prompt_tokens": 0, "output_tokens": 0, "total_tokens": 0},
+        )
+        agent_usage["calls"] += 1
+        for key, value in tokens.items():
+            agent_usage[key] += value
+        return tokens
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(usage["total_tokens"] for usage in self.agents.values())
+
+    @property
+    def exceeded(self) -> bool:
+        return self.budget is not None and self.total_tokens > self.budget
+
+    def to_dict(self) -> Dict:
+        return {
+            "prompt_tokens": sum(u["prompt_tokens"] for u in self.agents.values()),
+            "output_tokens": sum(u["output_tokens"] for u in self.agents.values()),
+            "total_tokens": self.total_tokens,
+            "budget": self.budget,
+            "agents": {name: dict(usage) for name, usage in self.agents.items()},
+        }
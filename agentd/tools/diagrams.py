@@ -6,6 +6,9 @@ import matplotlib.pyplot as plt
 from wordcloud import WordCloud
 
 from agentd.utils import get_cloud_storage, get_generated_directory
+from agentd.utils.log_utils import fields, get_logger
+
+logger = get_logger(__name__)
 
 
 def gen_random_id():
@@ -43,32 +46,26 @@ def save_diagram_to_file(figure, filename):
             + str(type(figure))
         )
 
-    print(f"Diagram saved to {file_path}")
-
     # upload to cloud storage
-    print("Uploading diagram to cloud storage...")
     remote_file_path = os.path.join("diagrams", os.path.basename(file_path))
     if not remote_file_path.endswith(".png"):
         remote_file_path += ".png"
     get_cloud_storage().upload_file(local_path=file_path, remote_path=remote_file_path)
-    print("Diagram uploaded to cloud storage.")
     os.remove(file_path)  # Clean up local file after upload
     # generate public URL
-    print("Generating public URL for the diagram...")
     public_url = get_cloud_storage().get_file_url(remote_file_path)
-    print(f"Public URL for the diagram: {public_url}")
+    logger.debug("Diagram uploaded", extra=fields(file=filename, url=public_url))
 
     return public_url
 
 
 def generate_diagrams(visualization_data=None):
     if not visualization_data:
-        print("No visualization data provided. Skipping diagram generation.")
         raise ValueError("Visualization data is required to generate diagrams.")
 
     output_dir = os.path.join(get_generated_directory(), "diagrams")
     os.makedirs(output_dir, exist_ok=True)
-    print("Generating diagrams for visualization data...")
+    logger.debug("Generating diagrams")
 
     public_urls = {}
 
@@ -1,5 +1,6 @@
 """Tools for generating images using external APIs."""
 
+import asyncio
 import os
 from datetime import datetime
 from io import BytesIO
@@ -10,12 +11,18 @@ from google.genai import types
 from PIL import Image
 
 from agentd.utils import get_cloud_storage, get_generated_directory
+from agentd.utils.log_utils import fields, get_logger
+from agentd.utils.retry import call_with_retries_async
+
+logger = get_logger(__name__)
 
 SAVE_DIR = get_generated_directory()
 SAVE_DIR = os.path.join(SAVE_DIR, "generated_images")
 IMAGEN_DISABLED = True
 CLOUD_STORAGE_DISABLED = False
 CLOUD_STORAGE_IMAGES_DIR = "generated_images"
+# deadline of one image generation request, retried on timeouts and transient errors
+IMAGE_GENERATION_TIMEOUT_SECONDS = 90
 
 client = genai.Client()
 os.makedirs(SAVE_DIR, exist_ok=True)
@@ -34,12 +41,16 @@ def image_generation_gemini(description: str):
         model="gemini-2.0-flash-preview-image-generation",
         contents=description,
         config=types.GenerateContentConfig(
+            # also ends the request's thread once the tool has given up on it
+            http_options=types.HttpOptions(
+                timeout=int(IMAGE_GENERATION_TIMEOUT_SECONDS * 1000)
+            ),
             response_modalities=[
                 # NOTE: uncommenting "TEXT" you will get: models/gemini-2.0-flash-preview-image-generation accepts the following combination of response modalities: IMAGE, TEXT
                 # so it is best to keep it
                 "TEXT",
                 "IMAGE",
-            ]
+            ],
         ),
     )
     file_name = _generate_file_name(prefix="GEMINI", extension="png")
@@ -47,7 +58,7 @@ def image_generation_gemini(description: str):
 
     for part in response.candidates[0].content.parts:
         if part.text is not None:
-            print(part.text)
+            logger.debug("Image model text", extra=fields(text=part.text))
         elif part.inline_data is not None:
             image = Image.open(BytesIO((part.inline_data.data)))
             image.save(file_path)
@@ -67,6 +78,9 @@ def image_generation_imagen(description: str):
         prompt=description,
         config=types.GenerateImagesConfig(
             number_of_images=1,
+            http_options=types.HttpOptions(
+                timeout=int(IMAGE_GENERATION_TIMEOUT_SECONDS * 1000)
+            ),
         ),
     )
     file_name = _generate_file_name(prefix="IMAGEN", extension="png")
@@ -82,7 +96,7 @@ def image_generation_imagen(description: str):
 SELECTED_IMAGE_GENERATION_METHOD: Callable[[str], str] = image_generation_gemini
 
 
-def generate_image_tool(description: str):
+async def generate_image_tool(description: str):
     # wrapper for the image generation function, since the agent should be independent of the specific image generation method used.
     """
     Generates an image using AI based on the provided description.
@@ -95,26 +109,28 @@ def generate_image_tool(description: str):
     # return "https://picsum.photos/200/300"
 
     try:
-        print("=== GENERATING IMAGE ===")
-        image_path = SELECTED_IMAGE_GENERATION_METHOD(description)
-        print(f"Image generated and saved at: {image_path}")
-        print("=== IMAGE GENERATED ===")
+        # the blocking calls run in threads, other pipelines keep running meanwhile
+        image_path = await call_with_retries_async(
+            "generate_image",
+            lambda: asyncio.to_thread(SELECTED_IMAGE_GENERATION_METHOD, description),
+            timeout=IMAGE_GENERATION_TIMEOUT_SECONDS,
+        )
 
         # using the image_path uploaded the image to the cloud storage
-        print("Uploading image to cloud storage...")
         remote_file_path = os.path.join(
             CLOUD_STORAGE_IMAGES_DIR, os.path.basename(image_path)
         )
-        get_cloud_storage().upload_file(
+        await asyncio.to_thread(
+            get_cloud_storage().upload_file,
             local_path=image_path,
             remote_path=remote_file_path,
         )
-        print("Image uploaded to cloud storage.")
         image_url = get_cloud_storage().get_file_url(remote_file_path)
+        logger.info("Image generated", extra=fields(url=image_url))
 
         # add a directory prefix to the image path so that when the image url is used,
         # the DIR prefix is can be replced with the actual project directory path.
         return image_url
-    except Exception as e:
-        print(f"Error generating image: {e}")
+    except Exception:
+        logger.exception("Error generating image")
         return "[Image generation failed]"
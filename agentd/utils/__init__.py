@@ -16,9 +16,12 @@ from .link_utils import (
     restore_urls_from_placeholders,
 )
 from .links_injector_agent import LinkInjectorAgent
+from .log_utils import fields, get_logger
 
 dotenv.load_dotenv()
 
+logger = get_logger(__name__)
+
 
 def extract_json_from_text(text):
     """
@@ -109,21 +112,17 @@ def _save_to_file(file_path: str, pdf_bytes: io.BytesIO):
         file_path += ".pdf"
     with open(file_path, "wb") as f:
         f.write(pdf_bytes.read())
-    print(f"Saved locally as {file_path}")
+    logger.debug("Saved PDF locally", extra=fields(file_path=file_path))
     return file_path
 
 
 def _save_to_cloud(local_file_path: str, remote_file_dir: str = "pdfs") -> str:
     """Uploads a file to Cloud Storage and returns the public URL."""
     remote_file_path = os.path.join(remote_file_dir, os.path.basename(local_file_path))
-    print(f"Uploading PDF to cloud storage at {remote_file_path}...")
     get_cloud_storage().upload_file(
         local_path=local_file_path, remote_path=remote_file_path
     )
-    print("PDF uploaded to cloud storage.")
-    print("Generating public URL for the PDF...")
     public_url = get_cloud_storage().get_file_url(remote_file_path)
-    print(f"Public URL for the PDF: {public_url}")
 
     return public_url
 
@@ -205,11 +204,13 @@ def create_and_upload_pdf(
         # Upload to cloud
         public_url = _save_to_cloud(file_path, remote_file_dir=remote_dir)
 
-        print(f"PDF uploaded to: {public_url}")
+        logger.info("PDF uploaded", extra=fields(title=pdf_title, url=public_url))
         return public_url
 
-    except Exception as e:
-        print(f"Error generating or uploading PDF: {e}")
+    except Exception:
+        logger.exception(
+            "Error generating or uploading PDF", extra=fields(title=pdf_title)
+        )
         return ""
 
 
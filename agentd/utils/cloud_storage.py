@@ -7,6 +7,10 @@ from google.cloud import storage
 from google.oauth2 import service_account
 
 from .cloud_storage_base import CloudStorage
+from .log_utils import fields, get_logger
+from .metrics import STORAGE_DURATION
+
+logger = get_logger(__name__)
 
 DEFAULT_EXPIRATION_MINUTES = 30
 
@@ -37,40 +41,37 @@ class GCPStorage(CloudStorage):
             self.client = storage.Client()
         self.bucket = self.client.bucket(bucket_name=bucket_name)
 
-    def log(self, message: str) -> None:
+    def log(self, message: str, **kwargs) -> None:
         """
-        Log messages to the console boldly
+        Logs a storage operation, at DEBUG level since they happen on every upload.
         """
-        print(f"====== [STORAGE] {message} ======")
+        logger.debug(message, extra=fields(bucket=self.bucket_name, **kwargs))
 
     def upload_file(self, local_path: str, remote_path: str) -> None:
-        self.log("UPLOADING FILE")
         blob = self.bucket.blob(remote_path)
-        blob.upload_from_filename(local_path)
-        print(f"[#] Uploaded {local_path} to {remote_path}")
-        self.log("UPLOAD COMPLETED")
+        with STORAGE_DURATION.time(operation="upload"):
+            blob.upload_from_filename(local_path)
+        self.log("Uploaded file", local_path=local_path, remote_path=remote_path)
 
     def download_file(self, remote_path: str, local_path: str) -> None:
-        self.log("DOWNLOADING FILE")
         blob = self.bucket.blob(remote_path)
         if local_path.count("/") > 1:
             os.makedirs(os.path.dirname(local_path), exist_ok=True)
-        blob.download_to_filename(local_path)
-        print(f"[#] Downloaded {remote_path} to {local_path}")
-        self.log("DOWNLOAD COMPLETED")
+        with STORAGE_DURATION.time(operation="download"):
+            blob.download_to_filename(local_path)
+        self.log("Downloaded file", remote_path=remote_path, local_path=local_path)
 
     def delete_file(self, remote_path: str) -> None:
-        self.log("DELETING FILE")
         blob = self.bucket.blob(remote_path)
         blob.delete()
-        print(f"[#] Deleted {remote_path}")
-        self.log("DELETE COMPLETED")
+        self.log("Deleted file", remote_path=remote_path)
 
     def list_files(self, prefix: Optional[str] = None) -> List[str]:
-        self.log("LISTING FILES")
-        blobs = self.client.list_blobs(self.bucket_name, prefix=prefix)
-        self.log("LISTING FILES COMPLETED")
-        return [blob.name for blob in blobs]
+        with STORAGE_DURATION.time(operation="list"):
+            blobs = self.client.list_blobs(self.bucket_name, prefix=prefix)
+            names = [blob.name for blob in blobs]
+        self.log("Listed files", prefix=prefix, count=len(names))
+        return names
 
     def get_file_url(self, remote_path):
         blob = self.bucket.blob(remote_path)
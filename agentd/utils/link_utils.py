@@ -4,6 +4,15 @@ from typing import Any, Dict, List, Union
 
 import requests
 
+from .log_utils import fields, get_logger
+from .retry import call_with_retries
+
+logger = get_logger(__name__)
+
+# deadline of one redirect lookup, it blocks the agent callback that makes it
+RESOLVE_REDIRECT_TIMEOUT_SECONDS = 10
+RESOLVE_REDIRECT_MAX_ATTEMPTS = 2
+
 # A reasonably comprehensive regex for common URL formats.
 # It captures http/https, optional www, domain, path, query parameters, and fragments.
 URL_REGEX = r"https?:\/\/(?:www\.)?[-a-zA-Z0-9@:%._\+~#=]{1,256}\.[a-zA-Z0-9()]{1,6}\b(?:[-a-zA-Z0-9()@:%_\+.~#?&/=]*)"
@@ -205,8 +214,14 @@ def restore_urls_from_placeholders(
 def resolve_redirect(url):
     """Returns the final URL after following redirects."""
     try:
-        response = requests.head(url, allow_redirects=True)
+        response = call_with_retries(
+            "resolve_redirect",
+            lambda: requests.head(
+                url, allow_redirects=True, timeout=RESOLVE_REDIRECT_TIMEOUT_SECONDS
+            ),
+            max_attempts=RESOLVE_REDIRECT_MAX_ATTEMPTS,
+        )
         return response.url
     except requests.RequestException as e:
-        print(f"Error resolving URL {url}: {e}")
+        logger.warning("Error resolving URL", extra=fields(url=url, error=str(e)))
         return None
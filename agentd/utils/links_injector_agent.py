@@ -11,11 +11,14 @@ from google.adk.tools.tool_context import ToolContext
 from google.genai import types
 
 from .link_utils import extract_and_replace_urls, restore_urls_from_placeholders
+from .log_utils import fields, get_logger
 
+logger = get_logger(__name__)
 
-def log(message: str, *args, **kwargs):
-    """Logging method for the LinkInjectorAgent."""
-    print(f"============ [LinkInjectorAgent] {message} ======", *args, **kwargs)
+
+def log(message: str, **kwargs):
+    """Logging method for the LinkInjectorAgent, payloads are passed as `kwargs`."""
+    logger.debug(message, extra=fields(**kwargs))
 
 
 class LinkInjectorAgent(Agent):
@@ -61,17 +64,21 @@ class LinkInjectorAgent(Agent):
                 tool_response = tool_response["result"]
 
         # extract all urls from the tool response
-        log(f"EXTRACTING URLs FROM TOOL RESPONSE of '{tool_name}' TOOL")
+        log("Extracting URLs from tool response", tool=tool_name)
         modified_data = LinkInjectorAgent.replace_urls_with_identifiers(tool_response)
         links_map = modified_data["map"]
         data = modified_data["data"]
 
         if not links_map:
-            log("URLs NOT FOUND IN TOOL RESPONSE")
+            log("No URLs found in tool response", tool=tool_name)
             return None
         else:
-            log(f"URLs FOUND IN TOOL RESPONSE: {links_map}")
-            log(f"Modified data: {data}")
+            log(
+                "URLs found in tool response",
+                tool=tool_name,
+                links_map=links_map,
+                modified_data=data,
+            )
             if "links_map" in tool_context.state:
                 log("Links map already exists in state, merging with new links map.")
                 existing_map = tool_context.state["links_map"]
@@ -99,11 +106,16 @@ class LinkInjectorAgent(Agent):
         """
         Injects links into the output of the agent, using the links map stored in the state.
         """
-        log("AFTER MODEL CALLBACK MODIFIER CALLED")
+        log("After model callback modifier called")
+
+        if llm_response.partial:
+            # links may be split across streamed chunks, they are injected once
+            # into the complete response
+            return None
 
         links_map = callback_context.state.get("links_map", {})
         if not links_map:
-            log("NO LINKS MAP FOUND IN STATE")
+            log("No links map found in state")
             return None
 
         original_text = ""
@@ -115,7 +127,8 @@ class LinkInjectorAgent(Agent):
                 original_text = llm_response.content.parts[0].text
             elif llm_response.content.parts[0].function_call:
                 log(
-                    f"Inspected response: Contains function call '{llm_response.content.parts[0].function_call.name}'. No text modification."
+                    "Inspected response: contains a function call, no text modification.",
+                    function=llm_response.content.parts[0].function_call.name,
                 )
                 return None  # Don't modify tool calls in this example
             else:
@@ -123,28 +136,29 @@ class LinkInjectorAgent(Agent):
                 return None
         elif llm_response.error_message:
             log(
-                f"Inspected response: Contains error '{llm_response.error_message}'. No modification."
+                "Inspected response: contains an error, no modification.",
+                error=llm_response.error_message,
             )
             return None
         else:
             log("Inspected response: Empty LlmResponse.")
             return None  # Nothing to modify
 
-        log(f"Original text: {original_text}")
-
         # Restore URLs in the model output
         model_output = original_text
         modified_text = LinkInjectorAgent.replace_identifiers_with_urls(
             text=model_output, links_map=links_map, state=None
         )
 
-        log("LINKS INJECTED INTO MODEL OUTPUT")
-
         # Update the model output with restored URLs
         modified_parts = [copy.deepcopy(part) for part in llm_response.content.parts]
         modified_parts[0].text = modified_text  # Update the text in the copied part
 
-        log(f"Modified text: {modified_text}")
+        log(
+            "Links injected into model output",
+            original_text=original_text,
+            modified_text=modified_text,
+        )
 
         new_response = LlmResponse(
             content=types.Content(role="model", parts=modified_parts),
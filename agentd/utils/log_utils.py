@@ -0,0 +1,149 @@
+"""
+Logging for agentd and the API server: leveled per-module loggers, one line per
+event, with payload fields truncated so that reports and tool responses don't
+end up in the logs in full.
+
+Records are handed to a queue and written by a background thread, so logging
+from a pipeline never waits on stdout.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+# DEBUG adds tool arguments, tool responses and state values to the log lines
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# `json` (one object per line) or `text`
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+# longer field values (and messages) are cut to this many characters
+LOG_MAX_FIELD_LENGTH = int(os.getenv("LOG_MAX_FIELD_LENGTH", "500"))
+# records waiting for the writer thread, newer ones are dropped once it is full
+LOG_QUEUE_SIZE = 10000
+
+ROOT_LOGGER_NAME = "agentd"
+
+_configure_lock = threading.Lock()
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def truncate(value: Any, max_length: int = LOG_MAX_FIELD_LENGTH) -> Any:
+    """Returns `value` with strings (and containers, as JSON) cut to `max_length`."""
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if not isinstance(value, str):
+        try:
+            value = json.dumps(value, default=str, ensure_ascii=False)
+        except (TypeError, ValueError):
+            value = str(value)
+    if len(value) <= max_length:
+        return value
+    return f"{value[:max_length]}...(+{len(value) - max_length} chars)"
+
+
+def fields(**kwargs) -> Dict[str, Dict[str, Any]]:
+    """
+    Structured fields of a log record, e.g.
+    `logger.info("Tool call", extra=fields(tool=name, args=args))`.
+    """
+    return {"fields": kwargs}
+
+
+class StructuredFormatter(logging.Formatter):
+    """Formats a record as one JSON object, or as one `key=value` text line."""
+
+    def __init__(self, output_format: str = "json", max_field_length: int = None):
+        super().__init__()
+        self.output_format = output_format
+        self.max_field_length = max_field_length or LOG_MAX_FIELD_LENGTH
+
+    def format(self, record: logging.LogRecord) -> str:
+        record_fields = {
+            key: truncate(value, self.max_field_length)
+            for key, value in getattr(record, "fields", {}).items()
+        }
+        message = truncate(record.getMessage(), self.max_field_length)
+        if record.exc_info:
+            record_fields["exception"] = self.formatException(record.exc_info)
+
+        created_at = datetime.fromtimestamp(record.created, timezone.utc)
+        if self.output_format == "text":
+            line = (
+                f"{created_at.isoformat(timespec='milliseconds')} {record.levelname}"
+                f" {record.name}: {message}"
+            )
+            for key, value in record_fields.items():
+                line += f" {key}={json.dumps(value, ensure_ascii=False)}"
+            return line
+
+        return json.dumps(
+            {
+                "ts": created_at.isoformat(timespec="milliseconds"),
+                "level": record.levelname,
+                "logger": record.name,
+                "msg": message,
+                **record_fields,
+            },
+            default=str,
+            ensure_ascii=False,
+        )
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """A QueueHandler that drops records instead of blocking when the queue is full."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # formatting (and truncating) happens on the writer thread
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+def configure_logging(
+    level: str = LOG_LEVEL, output_format: str = LOG_FORMAT, stream=None
+):
+    """
+    Sends all `agentd` loggers to `stream` (stderr by default) through a background
+    writer thread. Calling it again only changes the level.
+    """
+    global _listener
+
+    root_logger = logging.getLogger(ROOT_LOGGER_NAME)
+    root_logger.setLevel(level)
+    with _configure_lock:
+        if _listener is not None:
+            return
+
+        stream_handler = logging.StreamHandler(stream or sys.stderr)
+        stream_handler.setFormatter(StructuredFormatter(output_format))
+        log_queue = queue.Queue(LOG_QUEUE_SIZE)
+        _listener = logging.handlers.QueueListener(log_queue, stream_handler)
+        _listener.start()
+        # write out what is still queued when the process exits
+        atexit.register(_listener.stop)
+
+        root_logger.addHandler(_DroppingQueueHandler(log_queue))
+        # the records are written once, not again by the root logger's handlers
+        root_logger.propagate = False
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Returns the logger for a module, e.g. `get_logger(__name__)`. Modules outside
+    the `agentd` package get a logger under it, so one configuration covers them.
+    """
+    if name != ROOT_LOGGER_NAME and not name.startswith(ROOT_LOGGER_NAME + "."):
+        name = f"{ROOT_LOGGER_NAME}.{name}"
+    return logging.getLogger(name)
@@ -0,0 +1,408 @@
+"""In-process metrics registry rendered in the Prometheus text exposition format."""
+
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# seconds, from a fast API call up to a slow LLM or tool call
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# seconds, for whole pipeline phases (agent runs, waiting for the user)
+PHASE_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 900, 1200, 1800, 3600)
+# tokens of one model request, the prompt grows with the conversation
+TOKEN_BUCKETS = (256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536, 131072, 262144)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+class _Metric(ABC):
+    """Base class of the metric types, which render their own samples."""
+
+    kind = ""
+
+    def __init__(self, name: str, description: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> Tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f"Metric '{self.name}' expects labels {self.labelnames}, got {tuple(labels)}."
+            )
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        lines.extend(self._render_samples())
+        return lines
+
+    @abstractmethod
+    def _render_samples(self) -> List[str]:
+        """Returns the sample lines of the metric, without HELP and TYPE."""
+
+
+class Counter(_Metric):
+    """A value that only goes up, e.g. the number of handled requests."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, description, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Gauge(_Metric):
+    """
+    A value that goes up and down. Either `set` it, or give it a function that is
+    called on every scrape (returning a value, or a dict of label tuples to values).
+    """
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labelnames: Sequence[str] = (),
+        function: Optional[Callable] = None,
+    ):
+        super().__init__(name, description, labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self.function = function
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function: Callable):
+        self.function = function
+
+    def _render_samples(self) -> List[str]:
+        if self.function is not None:
+            values = self.function()
+            if not isinstance(values, dict):
+                values = {(): values}
+        else:
+            with self._lock:
+                values = dict(self._values)
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Histogram(_Metric):
+    """Counts observations (e.g. latencies) in cumulative buckets."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, description, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # label values -> [bucket counts..., sum]
+        self._values: Dict[Tuple, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = [0] * (len(self.buckets) + 1)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    values[index] += 1
+                    break
+            values[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the duration of the `with` block, also when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            values = {key: list(counts) for key, counts in self._values.items()}
+
+        lines = []
+        bucket_labelnames = self.labelnames + ("le",)
+        for key, counts in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(
+                    bucket_labelnames, key + (_format_value(bound),)
+                )
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(counts[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Holds metrics by name. Asking for an existing name returns the existing
+    metric, so modules can declare the metrics they use independently.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _get_or_create(self, metric_class, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = metric_class(name, *args, **kwargs)
+            elif not isinstance(metric, metric_class):
+                raise ValueError(f"Metric '{name}' is already a {metric.kind}.")
+            return metric
+
+    def counter(
+        self, name: str, description: str, labelnames: Sequence[str] = ()
+    ) -> Counter:
+        return self._get_or_create(Counter, name, description, labelnames)
+
+    def gauge(
+        self,
+        name: str,
+        description: str,
+        labelnames: Sequence[str] = (),
+        function: Optional[Callable] = None,
+    ) -> Gauge:
+        gauge = self._get_or_create(Gauge, name, description, labelnames)
+        if function is not None:
+            gauge.set_function(function)
+        return gauge
+
+    def histogram(
+        self,
+        name: str,
+        description: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._get_or_create(Histogram, name, description, labelnames, buckets)
+
+    def render(self) -> str:
+        """Returns every metric in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class SlidingWindowCounter:
+    """Counts events that happened in the last `window_seconds`."""
+
+    def __init__(self, window_seconds: float):
+        self.window_seconds = window_seconds
+        self._lock = threading.Lock()
+        self._times = deque()
+
+    def _prune_locked(self, now: float):
+        while self._times and self._times[0] <= now - self.window_seconds:
+            self._times.popleft()
+
+    def record(self):
+        now = time.monotonic()
+        with self._lock:
+            self._prune_locked(now)
+            self._times.append(now)
+
+    def count(self) -> int:
+        with self._lock:
+            self._prune_locked(time.monotonic())
+            return len(self._times)
+
+    def seconds_until_below(self, limit: int) -> float:
+        """Returns how long until fewer than `limit` events are left in the window."""
+        now = time.monotonic()
+        with self._lock:
+            self._prune_locked(now)
+            if len(self._times) < limit:
+                return 0
+            # the oldest events that have to leave the window first
+            return self._times[len(self._times) - limit] + self.window_seconds - now
+
+
+REGISTRY = MetricsRegistry()
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+AGENT_DURATION = REGISTRY.histogram(
+    "agentd_agent_duration_seconds",
+    "Time spent in an agent, from the previous agent's last event to its own last event.",
+    ["agent"],
+)
+TOOL_DURATION = REGISTRY.histogram(
+    "agentd_tool_duration_seconds",
+    "Time from a tool call request to its result.",
+    ["tool"],
+)
+STORAGE_DURATION = REGISTRY.histogram(
+    "agentd_storage_operation_duration_seconds",
+    "Latency of cloud storage operations.",
+    ["operation"],
+)
+LLM_ERRORS = REGISTRY.counter(
+    "agentd_llm_errors_total",
+    "Errors returned by the LLM API per status code.",
+    ["code"],
+)
+# LLM quota errors (HTTP 429) of the last minute, used for admission control
+LLM_RATE_LIMITS = SlidingWindowCounter(60)
+REGISTRY.gauge(
+    "agentd_llm_rate_limits_last_minute",
+    "LLM API 429 responses in the last minute.",
+    function=LLM_RATE_LIMITS.count,
+)
+
+CALL_RETRIES = REGISTRY.counter(
+    "agentd_call_retries_total",
+    "Retried model and tool calls per operation and reason: status code, timeout or connection.",
+    ["operation", "reason"],
+)
+CALL_FAILURES = REGISTRY.counter(
+    "agentd_call_failures_total",
+    "Model and tool calls that failed for good per operation and reason, `fatal` ones aren't retried.",
+    ["operation", "reason"],
+)
+
+LLM_TOKENS = REGISTRY.counter(
+    "agentd_llm_tokens_total",
+    "Tokens used by model calls per agent and type: prompt, output and total.",
+    ["agent", "type"],
+)
+LLM_PROMPT_TOKENS = REGISTRY.histogram(
+    "agentd_llm_prompt_tokens",
+    "Prompt tokens of one model call.",
+    ["agent"],
+    buckets=TOKEN_BUCKETS,
+)
+
+
+def record_llm_error(code):
+    """Records an error returned by the LLM API."""
+    LLM_ERRORS.inc(code=code)
+    if code == 429:
+        LLM_RATE_LIMITS.record()
+
+
+def record_token_usage(agent: str, tokens: Dict[str, int]):
+    """Records the tokens of one model call, see `TokenUsage.record`."""
+    LLM_PROMPT_TOKENS.observe(tokens["prompt_tokens"], agent=agent)
+    LLM_TOKENS.inc(tokens["prompt_tokens"], agent=agent, type="prompt")
+    LLM_TOKENS.inc(tokens["output_tokens"], agent=agent, type="output")
+    LLM_TOKENS.inc(tokens["total_tokens"], agent=agent, type="total")
+
+
+class AgentEventTimer:
+    """
+    Derives per-agent and per-tool latencies from the events of one agent run.
+    Call `observe(event)` for every event and `finish()` once the run ends.
+    `on_agent_finished(agent, seconds)` is also called with each agent's duration.
+
+    Agents of a parallel stage take turns emitting events, so every agent is timed
+    from when it took over (the time of the event before its first one) to its last
+    event, and recorded once when the run ends. Streamed chunks (partial events)
+    are skipped, the complete response follows them.
+    """
+
+    def __init__(
+        self, on_agent_finished: Optional[Callable[[str, float], None]] = None
+    ):
+        self.on_agent_finished = on_agent_finished
+        self._last_event_time = time.perf_counter()
+        # agent -> [started, last event], in the order the agents started
+        self._agents: Dict[str, List[float]] = {}
+        self._tool_calls: Dict[str, float] = {}
+
+    def observe(self, event):
+        if event.partial:
+            return
+        now = time.perf_counter()
+        if event.author not in self._agents:
+            # the agent took over once the previous event was out
+            self._agents[event.author] = [self._last_event_time, now]
+        else:
+            self._agents[event.author][1] = now
+        self._last_event_time = now
+
+        for call in event.get_function_calls():
+            self._tool_calls[call.id] = now
+        for response in event.get_function_responses():
+            started = self._tool_calls.pop(response.id, None)
+            if started is not None:
+                TOOL_DURATION.observe(now - started, tool=response.name)
+
+    def agent_seconds(self, agent: str) -> float:
+        """Seconds `agent` has been working, since its turn started."""
+        if agent in self._agents:
+            started = self._agents[agent][0]
+        else:
+            started = self._last_event_time
+        return time.perf_counter() - started
+
+    def finish(self):
+        agents, self._agents = self._agents, {}
+        for agent, (started, last_event_time) in agents.items():
+            if agent == "user":
+                continue
+            seconds = last_event_time - started
+            AGENT_DURATION.observe(seconds, agent=agent)
+            if self.on_agent_finished is not None:
+                self.on_agent_finished(agent, seconds)
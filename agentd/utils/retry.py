@@ -0,0 +1,193 @@
+"""
+Deadlines and retries for calls to external services: model calls and the
+tools that call other APIs (image generation, URL lookups).
+
+Errors are either retryable (timeouts, connection errors and 408, 429 and 5xx
+responses) or fatal (e.g. an invalid request or missing permissions). Retryable
+errors are retried after exponentially growing delays with full jitter, so runs
+hitting the same quota don't retry in lockstep.
+"""
+
+import asyncio
+import os
+import random
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import httpx
+import requests
+from google.adk.models import Gemini, LLMRegistry
+from google.adk.tools.agent_tool import AgentTool
+from google.genai import errors
+
+from .log_utils import fields, get_logger
+from .metrics import CALL_FAILURES, CALL_RETRIES, record_llm_error
+
+logger = get_logger(__name__)
+
+# attempts per call, the first one included
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "4"))
+# the delay before retry n is random, up to base * 2^(n - 1) and at most the max
+RETRY_BASE_DELAY_SECONDS = float(os.getenv("RETRY_BASE_DELAY_SECONDS", "1"))
+RETRY_MAX_DELAY_SECONDS = float(os.getenv("RETRY_MAX_DELAY_SECONDS", "30"))
+# deadline of one model call, for the whole response when it is streamed
+LLM_CALL_TIMEOUT_SECONDS = float(os.getenv("LLM_CALL_TIMEOUT_SECONDS", "120"))
+
+RETRYABLE_STATUS_CODES = frozenset((408, 429, 500, 502, 503, 504))
+
+T = TypeVar("T")
+
+
+def retry_reason(error: BaseException) -> Optional[str]:
+    """
+    Returns why a call that raised `error` is worth retrying: the status code,
+    `timeout` or `connection`. None if the error is fatal.
+    """
+    if isinstance(error, errors.APIError):
+        return str(error.code) if error.code in RETRYABLE_STATUS_CODES else None
+    if isinstance(
+        error,
+        (asyncio.TimeoutError, TimeoutError, requests.Timeout, httpx.TimeoutException),
+    ):
+        return "timeout"
+    if isinstance(error, (requests.ConnectionError, httpx.TransportError)):
+        return "connection"
+    return None
+
+
+def backoff_delay(attempt: int) -> float:
+    """Returns the seconds to wait after failed attempt number `attempt` (1-based)."""
+    ceiling = RETRY_BASE_DELAY_SECONDS * 2 ** (attempt - 1)
+    return random.uniform(0, min(ceiling, RETRY_MAX_DELAY_SECONDS))
+
+
+def _next_delay(
+    operation: str, error: BaseException, attempt: int, max_attempts: int
+) -> Optional[float]:
+    """Records a failed attempt, returns the delay before the next one or None to give up."""
+    reason = retry_reason(error)
+    if reason is None or attempt >= max_attempts:
+        CALL_FAILURES.inc(operation=operation, reason=reason or "fatal")
+        return None
+
+    CALL_RETRIES.inc(operation=operation, reason=reason)
+    delay = backoff_delay(attempt)
+    logger.warning(
+        "Retrying call",
+        extra=fields(
+            operation=operation,
+            attempt=attempt,
+            reason=reason,
+            delay=round(delay, 2),
+            error=str(error) or type(error).__name__,
+        ),
+    )
+    return delay
+
+
+def call_with_retries(
+    operation: str, func: Callable[[], T], max_attempts: int = RETRY_MAX_ATTEMPTS
+) -> T:
+    """
+    Calls `func` until it succeeds, raises a fatal error or runs out of attempts.
+    Waits between attempts by blocking the thread, async code should use
+    `call_with_retries_async`. `func` enforces its own deadline (e.g. a request
+    timeout).
+    """
+    attempt = 1
+    while True:
+        try:
+            return func()
+        except Exception as e:
+            delay = _next_delay(operation, e, attempt, max_attempts)
+            if delay is None:
+                raise
+        time.sleep(delay)
+        attempt += 1
+
+
+async def call_with_retries_async(
+    operation: str,
+    func: Callable[[], Awaitable[T]],
+    timeout: Optional[float] = None,
+    max_attempts: int = RETRY_MAX_ATTEMPTS,
+) -> T:
+    """
+    Awaits `func()` until it succeeds, raises a fatal error or runs out of
+    attempts. Each attempt is cancelled after `timeout` seconds.
+    """
+    attempt = 1
+    while True:
+        try:
+            return await asyncio.wait_for(func(), timeout)
+        except Exception as e:
+            delay = _next_delay(operation, e, attempt, max_attempts)
+            if delay is None:
+                raise
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+class RetryingGemini(Gemini):
+    """
+    Gemini with a deadline per model call and retries of retryable errors.
+
+    A streamed response is only retried until its first chunk is passed on,
+    text the user has already seen can't be taken back.
+    """
+
+    timeout: float = LLM_CALL_TIMEOUT_SECONDS
+    max_attempts: int = RETRY_MAX_ATTEMPTS
+
+    async def generate_content_async(self, llm_request, stream: bool = False):
+        attempt = 1
+        while True:
+            responses = super().generate_content_async(llm_request, stream)
+            deadline = time.monotonic() + self.timeout
+            passed_on = False
+            try:
+                while True:
+                    try:
+                        response = await asyncio.wait_for(
+                            responses.__anext__(), deadline - time.monotonic()
+                        )
+                    except StopAsyncIteration:
+                        return
+                    passed_on = True
+                    yield response
+            except Exception as e:
+                if isinstance(e, errors.APIError):
+                    record_llm_error(e.code)
+                delay = _next_delay(
+                    self.model,
+                    e,
+                    attempt,
+                    attempt if passed_on else self.max_attempts,
+                )
+                if delay is None:
+                    raise
+            finally:
+                await responses.aclose()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+def use_retrying_models(agent):
+    """
+    Replaces the Gemini model names of `agent`, its sub agents and the agents of
+    its agent tools with `RetryingGemini` models.
+    """
+    model = getattr(agent, "model", None)
+    if isinstance(model, str) and model:
+        try:
+            model_class = LLMRegistry.resolve(model)
+        except ValueError:
+            model_class = None
+        if model_class is not None and issubclass(model_class, Gemini):
+            agent.model = RetryingGemini(model=model)
+
+    for tool in getattr(agent, "tools", None) or []:
+        if isinstance(tool, AgentTool):
+            use_retrying_models(tool.agent)
+    for sub_agent in agent.sub_agents:
+        use_retrying_models(sub_agent)
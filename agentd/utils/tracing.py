@@ -0,0 +1,268 @@
+"""
+Tracing for pipeline runs: one trace per run, written to
+`<TRACE_DIR>/<request_id>.jsonl` in the OpenTelemetry (OTLP/JSON) format so it
+can be loaded into any OTLP viewer as a waterfall.
+
+ADK already opens spans for each agent run (`agent_run [name]`), model call
+(`call_llm`) and tool call (`execute_tool {name}`). This module adds the
+pipeline span they hang off, spans for the agent callbacks, and the exporter.
+Tracing is off unless TRACE_DIR is set.
+"""
+
+import contextlib
+import contextvars
+import functools
+import inspect
+import json
+import os
+import re
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence
+
+from opentelemetry import trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import ReadableSpan, SpanProcessor, TracerProvider
+from opentelemetry.sdk.trace.export import (
+    BatchSpanProcessor,
+    SpanExporter,
+    SpanExportResult,
+)
+
+from .log_utils import get_logger, truncate
+
+logger = get_logger(__name__)
+
+# directory the traces are written to, tracing is off when empty
+TRACE_DIR = os.getenv("TRACE_DIR", "")
+# model requests and responses are recorded as span attributes, cut to this length
+TRACE_MAX_ATTRIBUTE_LENGTH = int(os.getenv("TRACE_MAX_ATTRIBUTE_LENGTH", "2000"))
+
+SERVICE_NAME = "agentd"
+REQUEST_ID_ATTRIBUTE = "agentd.request_id"
+CALLBACK_FIELDS = (
+    "before_agent_callback",
+    "after_agent_callback",
+    "before_model_callback",
+    "after_model_callback",
+    "before_tool_callback",
+    "after_tool_callback",
+)
+
+# the run the current task works on, spans started under it are tagged with it
+REQUEST_ID: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "agentd_request_id", default=None
+)
+
+tracer = trace.get_tracer(SERVICE_NAME)
+
+_configure_lock = threading.Lock()
+_configured = False
+
+
+class RequestIdSpanProcessor(SpanProcessor):
+    """Tags every span with the `request_id` of the run it is started in."""
+
+    def on_start(self, span, parent_context=None):
+        request_id = REQUEST_ID.get()
+        if request_id:
+            span.set_attribute(REQUEST_ID_ATTRIBUTE, request_id)
+
+
+def _any_value(value) -> Dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [_any_value(item) for item in value]}}
+    return {"stringValue": truncate(str(value), TRACE_MAX_ATTRIBUTE_LENGTH)}
+
+
+def _attributes(attributes) -> List[Dict]:
+    return [
+        {"key": key, "value": _any_value(value)}
+        for key, value in (attributes or {}).items()
+    ]
+
+
+def _encode_span(span: ReadableSpan) -> Dict:
+    return {
+        "traceId": format(span.context.trace_id, "032x"),
+        "spanId": format(span.context.span_id, "016x"),
+        "parentSpanId": format(span.parent.span_id, "016x") if span.parent else "",
+        "name": span.name,
+        # OTLP kinds start at 1 (INTERNAL), the SDK's at 0
+        "kind": span.kind.value + 1,
+        "startTimeUnixNano": str(span.start_time),
+        "endTimeUnixNano": str(span.end_time),
+        "attributes": _attributes(span.attributes),
+        "events": [
+            {
+                "timeUnixNano": str(event.timestamp),
+                "name": event.name,
+                "attributes": _attributes(event.attributes),
+            }
+            for event in span.events
+        ],
+        "status": {
+            "code": span.status.status_code.value,
+            "message": span.status.description or "",
+        },
+    }
+
+
+def encode_spans(spans: Sequence[ReadableSpan]) -> Dict:
+    """Encodes spans as an OTLP/JSON `ExportTraceServiceRequest`."""
+    scopes = defaultdict(list)
+    for span in spans:
+        scope = span.instrumentation_scope
+        scopes[(scope.name, scope.version) if scope else ("", None)].append(span)
+
+    resource = spans[0].resource if spans else Resource.create()
+    return {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": _attributes(resource.attributes)},
+                "scopeSpans": [
+                    {
+                        "scope": {"name": name, "version": version or ""},
+                        "spans": [_encode_span(span) for span in scope_spans],
+                    }
+                    for (name, version), scope_spans in scopes.items()
+                ],
+            }
+        ]
+    }
+
+
+class FileSpanExporter(SpanExporter):
+    """
+    Appends the spans of each run to `<directory>/<request_id>.jsonl`, one
+    OTLP/JSON request per exported batch. Spans outside of a run are not kept.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path_for(self, request_id: str) -> str:
+        return os.path.join(
+            self.directory, re.sub(r"[^A-Za-z0-9_.-]", "_", request_id) + ".jsonl"
+        )
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        spans_by_request = defaultdict(list)
+        for span in spans:
+            request_id = (span.attributes or {}).get(REQUEST_ID_ATTRIBUTE)
+            if request_id:
+                spans_by_request[request_id].append(span)
+
+        try:
+            for request_id, request_spans in spans_by_request.items():
+                line = json.dumps(encode_spans(request_spans), ensure_ascii=False)
+                with open(self.path_for(request_id), "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+        except OSError:
+            logger.exception("Could not write trace spans")
+            return SpanExportResult.FAILURE
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        pass
+
+
+def configure_tracing(trace_dir: str = TRACE_DIR) -> bool:
+    """
+    Writes the spans of pipeline runs to `trace_dir`. Uses the global tracer
+    provider if one is already set up, otherwise installs one. Calling it again
+    does nothing.
+
+    Returns:
+        bool: True if tracing is on.
+    """
+    global _configured
+
+    if not trace_dir:
+        return False
+    with _configure_lock:
+        if _configured:
+            return True
+
+        provider = trace.get_tracer_provider()
+        if not isinstance(provider, TracerProvider):
+            provider = TracerProvider(
+                resource=Resource.create({"service.name": SERVICE_NAME})
+            )
+            trace.set_tracer_provider(provider)
+        provider.add_span_processor(RequestIdSpanProcessor())
+        provider.add_span_processor(BatchSpanProcessor(FileSpanExporter(trace_dir)))
+        _configured = True
+
+    logger.info("Tracing pipeline runs to %s", trace_dir)
+    return True
+
+
+def _traced_callback(callback, agent_name: str, field: str):
+    if getattr(callback, "__agentd_traced__", False):
+        return callback
+
+    span_name = f"callback {field} [{agent_name}]"
+    attributes = {
+        "agentd.agent": agent_name,
+        "agentd.callback": getattr(callback, "__name__", type(callback).__name__),
+    }
+    if inspect.iscoroutinefunction(callback):
+
+        async def traced(*args, **kwargs):
+            with tracer.start_as_current_span(span_name, attributes=attributes):
+                return await callback(*args, **kwargs)
+
+    else:
+
+        def traced(*args, **kwargs):
+            with tracer.start_as_current_span(span_name, attributes=attributes):
+                return callback(*args, **kwargs)
+
+    traced = functools.wraps(callback)(traced)
+    traced.__agentd_traced__ = True
+    return traced
+
+
+def trace_callbacks(agent):
+    """Wraps the callbacks of `agent` and its sub agents in spans."""
+    for field in CALLBACK_FIELDS:
+        callbacks = getattr(agent, field, None)
+        if not callbacks:
+            continue
+        if isinstance(callbacks, list):
+            traced = [_traced_callback(c, agent.name, field) for c in callbacks]
+        else:
+            traced = _traced_callback(callbacks, agent.name, field)
+        setattr(agent, field, traced)
+
+    for sub_agent in agent.sub_agents:
+        trace_callbacks(sub_agent)
+
+
+@contextlib.contextmanager
+def pipeline_span(request_id: str, **attributes):
+    """
+    Opens the root span of a run. Spans started inside it, in this task or the
+    tasks it creates, belong to the run's trace and file.
+    """
+    token = REQUEST_ID.set(request_id)
+    try:
+        with tracer.start_as_current_span(
+            "pipeline_run",
+            attributes={
+                f"agentd.{key}": value
+                for key, value in attributes.items()
+                if value is not None
+            },
+        ) as span:
+            yield span
+    finally:
+        REQUEST_ID.reset(token)
@@ -0,0 +1,78 @@
+"""Load-aware admission control for new pipeline runs."""
+
+import math
+import os
+from typing import Tuple
+
+from agentd.utils.metrics import LLM_RATE_LIMITS, SlidingWindowCounter
+
+from .pipeline_executor import PipelineExecutor
+
+# new runs are rejected once this many pipelines are waiting for a slot
+DEFAULT_MAX_QUEUE = int(os.getenv("PIPELINE_MAX_QUEUE", "64"))
+# new runs are rejected while the LLM API returned this many 429s in the last minute
+DEFAULT_MAX_LLM_RATE_LIMITS = int(os.getenv("PIPELINE_MAX_LLM_429_PER_MINUTE", "10"))
+
+# Retry-After used before any pipeline has finished, and its bounds (seconds)
+DEFAULT_RETRY_AFTER_SECONDS = 30
+MIN_RETRY_AFTER_SECONDS = 1
+MAX_RETRY_AFTER_SECONDS = 300
+
+
+def _clamp_retry_after(seconds: float) -> int:
+    return int(
+        min(max(math.ceil(seconds), MIN_RETRY_AFTER_SECONDS), MAX_RETRY_AFTER_SECONDS)
+    )
+
+
+class AdmissionController:
+    """
+    Decides whether a new pipeline run is accepted.
+
+    Runs are rejected when the executor queue is full, or when the LLM API keeps
+    answering with 429: new sessions would only compete for the same quota and
+    slow down the sessions that are already running.
+    """
+
+    def __init__(
+        self,
+        executor: PipelineExecutor,
+        max_queue: int = DEFAULT_MAX_QUEUE,
+        max_llm_rate_limits: int = DEFAULT_MAX_LLM_RATE_LIMITS,
+        llm_rate_limits: SlidingWindowCounter = LLM_RATE_LIMITS,
+    ):
+        self.executor = executor
+        self.max_queue = max_queue
+        self.max_llm_rate_limits = max_llm_rate_limits
+        self.llm_rate_limits = llm_rate_limits
+
+    def check(self) -> Tuple[bool, str, int]:
+        """
+        Returns:
+            tuple: (admitted, message, retry_after) where `retry_after` is the number
+            of seconds a rejected client should wait before retrying.
+        """
+        rate_limited_for = self.llm_rate_limits.seconds_until_below(
+            self.max_llm_rate_limits
+        )
+        if rate_limited_for > 0:
+            return (
+                False,
+                "The AI service is rate limiting requests, please retry later.",
+                _clamp_retry_after(rate_limited_for),
+            )
+
+        queue_length = self.executor.queue_length
+        if queue_length >= self.max_queue:
+            # wait until enough running pipelines finished to make room
+            excess = queue_length - self.max_queue + 1
+            wait = self.executor.estimate_wait_seconds(excess)
+            return (
+                False,
+                "Too many pipelines are queued, please retry later.",
+                _clamp_retry_after(
+                    DEFAULT_RETRY_AFTER_SECONDS if wait is None else wait
+                ),
+            )
+
+        return True, "", 0
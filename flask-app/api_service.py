@@ -0,0 +1,1050 @@
+"""
+Framework independent implementation of the `/api` endpoints: the shared session
+store, the pipeline worker and the request handling used by both the Flask
+blueprint (`routes.py`) and the ASGI app (`asgi.py`).
+
+Handlers return `(body, status_code, headers)`, the servers only adapt requests
+and responses and decide how to wait (blocking thread or event loop).
+"""
+
+import asyncio
+import hashlib
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from google.adk.events import Event
+
+from agentd import AgentD, AnswerPolicy, TokenUsage
+from agentd.utils import get_cloud_storage
+from agentd.utils.log_utils import fields, get_logger
+from agentd.utils.metrics import PHASE_BUCKETS, REGISTRY
+from agentd.utils.tracing import pipeline_span
+
+from .admission import AdmissionController
+from .batch_runner import DEFAULT_BATCH_MAX_CONCURRENCY, BatchRun, format_ndjson
+from .input_channel import UserInputChannel
+from .pipeline_executor import PipelineExecutor
+from .session_events import PIPELINE_STATUS_EVENT, format_sse
+from .session_journal import SessionJournal
+from .session_store import TERMINAL_STATUSES, get_session_store
+from .webhooks import (
+    CANCELLED_EVENT,
+    COMPLETED_EVENT,
+    FAILED_EVENT,
+    FILE_CREATED_EVENT,
+    INPUT_REQUIRED_EVENT,
+    WebhookDispatcher,
+    validate_callback_url,
+)
+
+logger = get_logger(__name__)
+
+# (body, status_code, headers), body is None for responses without content
+ApiResult = Tuple[Optional[Dict], int, Dict[str, str]]
+
+SESSION_STORE = get_session_store()
+SESSION_JOURNAL = SessionJournal()
+# channels of the pipelines running in this process
+INPUT_CHANNELS: Dict[str, UserInputChannel] = {}
+
+# a session waiting for the user longer than this is failed
+USER_INPUT_TIMEOUT_SECONDS = 60 * 30
+# expiry only touches sessions that are due, so it can run often
+CLEAN_UP_INTERVAL_SECONDS = 60
+# idle SSE connections get a comment line this often so proxies keep them open
+SSE_HEARTBEAT_SECONDS = 15
+# partial model output is published at most this often, chunks in between are joined
+TEXT_DELTA_INTERVAL_SECONDS = 0.25
+# cancellations by other processes are looked up in a shared store at most this often
+CANCEL_CHECK_INTERVAL_SECONDS = 1.0
+# upper bound for `?wait=` on /status long-polls
+STATUS_LONG_POLL_MAX_SECONDS = 30
+# a repeated `Idempotency-Key` returns the original request for this long
+IDEMPOTENCY_KEY_TTL_SECONDS = 60 * 60 * 24
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+# runs for the same (normalized) topic within this many seconds share one
+# pipeline, 0 disables topic deduplication
+RUN_DEDUP_WINDOW_SECONDS = float(os.getenv("RUN_DEDUP_WINDOW_SECONDS", "0"))
+MAX_BATCH_SIZE = 500
+
+AGENTD_INSTANCE = AgentD()
+PIPELINE_EXECUTOR = PipelineExecutor()
+ADMISSION_CONTROLLER = AdmissionController(PIPELINE_EXECUTOR)
+WEBHOOK_DISPATCHER = WebhookDispatcher()
+PROCESS_START_TIME = time.time()
+
+PIPELINE_PHASE_DURATION = REGISTRY.histogram(
+    "agentd_pipeline_phase_duration_seconds",
+    "Time pipelines spend per phase: queued, agent, waiting_for_input and total.",
+    ["phase"],
+    buckets=PHASE_BUCKETS,
+)
+HTTP_REQUESTS = REGISTRY.counter(
+    "agentd_http_requests_total",
+    "HTTP requests handled per route and status code.",
+    ["method", "route", "status"],
+)
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "agentd_http_request_duration_seconds",
+    "Time to produce an HTTP response per route (streamed bodies not included).",
+    ["method", "route"],
+)
+PIPELINES_REJECTED = REGISTRY.counter(
+    "agentd_pipelines_rejected_total",
+    "Pipeline runs rejected with 429 by admission control.",
+)
+PIPELINES_FINISHED = REGISTRY.counter(
+    "agentd_pipelines_finished_total",
+    "Finished pipelines per final pipeline status.",
+    ["pipeline_status"],
+)
+REGISTRY.gauge(
+    "agentd_pipeline_queue_depth",
+    "Pipelines waiting for a free executor slot.",
+    function=lambda: PIPELINE_EXECUTOR.queue_length,
+)
+REGISTRY.gauge(
+    "agentd_pipelines_in_flight",
+    "Pipelines running in this process, not counting those waiting for input.",
+    function=lambda: PIPELINE_EXECUTOR.in_flight,
+)
+REGISTRY.gauge(
+    "agentd_pipelines_idle",
+    "Pipelines of this process waiting for input, without an executor slot.",
+    function=lambda: PIPELINE_EXECUTOR.idle,
+)
+REGISTRY.gauge(
+    "agentd_webhook_queue_depth",
+    "Webhook deliveries waiting to be sent, retries included.",
+    function=lambda: WEBHOOK_DISPATCHER.queue_length,
+)
+REGISTRY.gauge(
+    "agentd_sessions",
+    "Sessions in the session store per pipeline status.",
+    ["pipeline_status"],
+    function=lambda: {
+        (pipeline_status,): count
+        for pipeline_status, count in SESSION_STORE.count_by_status().items()
+    },
+)
+CLEAN_UP_INFO = {
+    "last_cleanup": datetime.now(timezone.utc).isoformat(),
+    "cleanup_count": 0,
+}
+
+
+def timestamp():
+    return datetime.utcnow().isoformat()
+
+
+def validate_run_request(data):
+    topic = data.get("topic")
+    if not topic or not isinstance(topic, str) or not topic.strip():
+        return False, "Field 'topic' must be a non-empty string."
+    return True, ""
+
+
+async def real_pipeline_worker(
+    request_id,
+    topic,
+    queued_at=None,
+    answer_policy: Optional[AnswerPolicy] = None,
+    callback_url: Optional[str] = None,
+):
+    # the agent, model, tool and callback spans of the run, including the time
+    # spent waiting for input, form one trace under the `pipeline_run` span
+    with pipeline_span(request_id, topic=topic, unattended=answer_policy is not None):
+        await _run_pipeline(request_id, topic, queued_at, answer_policy, callback_url)
+
+
+async def _run_pipeline(
+    request_id,
+    topic,
+    queued_at=None,
+    answer_policy: Optional[AnswerPolicy] = None,
+    callback_url: Optional[str] = None,
+):
+    # 1. create user and session
+    # 2. run
+    # questions are answered by `answer_policy` if given, otherwise by the user
+    # input requests, files and the outcome are also POSTed to `callback_url`
+    # /cancel raises CancelledError in here, at the next await or store check
+
+    started_at = time.monotonic()
+    if queued_at is not None:
+        PIPELINE_PHASE_DURATION.observe(started_at - queued_at, phase="queued")
+
+    input_channel = UserInputChannel(asyncio.get_running_loop())
+    INPUT_CHANNELS[request_id] = input_channel
+    pipeline_status = "queued"
+    user_input_specs = {}
+    policy_answers = 0
+    # one budget for all agent runs of the pipeline
+    token_usage = TokenUsage()
+
+    def update_session_status(event_type: str = PIPELINE_STATUS_EVENT, **kwargs):
+        nonlocal pipeline_status
+        kwargs.setdefault("update_timestamp", timestamp())
+        append_agent_update = kwargs.pop("apppend_agent_update", None)
+        append_file = kwargs.pop("append_file", None)
+        pipeline_status = kwargs.get("pipeline_status", pipeline_status)
+        # the store publishes the change to stream subscribers as one event
+        version = SESSION_STORE.update(
+            request_id,
+            event_type,
+            kwargs,
+            agent_update=append_agent_update,
+            file=append_file,
+        )
+        SESSION_JOURNAL.append(
+            request_id,
+            version,
+            event_type,
+            kwargs,
+            agent_update=append_agent_update,
+            file=append_file,
+        )
+
+    def notify(event_type: str, data: Dict):
+        if callback_url:
+            # only queues the delivery, a slow receiver never blocks the pipeline
+            WEBHOOK_DISPATCHER.send(callback_url, event_type, request_id, data)
+
+    # when the store was last checked for a cancellation
+    cancel_checked_at = None
+
+    def raise_if_cancelled():
+        # a pipeline run by this process is cancelled through the executor, this
+        # catches /cancel requests handled by other server processes
+        nonlocal cancel_checked_at
+        if not SESSION_STORE.shared:
+            return
+        now = time.monotonic()
+        if (
+            cancel_checked_at is not None
+            and now - cancel_checked_at < CANCEL_CHECK_INTERVAL_SECONDS
+        ):
+            return
+        cancel_checked_at = now
+        session = SESSION_STORE.get(request_id, include_history=False)
+        if session and session["pipeline_status"] == "cancelled":
+            raise asyncio.CancelledError()
+
+    def poll_input() -> Optional[str]:
+        raise_if_cancelled()
+        return SESSION_STORE.pop_input(request_id)
+
+    # streamed text not yet published, and when it was last published
+    pending_delta = []
+    delta_published_at = 0.0
+
+    def callback(event: Event, eventType: AgentD.EventType):
+        nonlocal user_input_specs, delta_published_at
+        if eventType != AgentD.EventType.TEXT_DELTA:
+            raise_if_cancelled()
+
+        if eventType == AgentD.EventType.TEXT_DELTA:
+            pending_delta.append(event["text"])
+            now = time.monotonic()
+            if now - delta_published_at >= TEXT_DELTA_INTERVAL_SECONDS:
+                # only streamed to subscribers, the complete message is what's kept
+                SESSION_STORE.publish(
+                    request_id,
+                    eventType,
+                    {
+                        "status": "Generating response",
+                        "text_delta": {
+                            "agent_name": event["agent_name"],
+                            "text": "".join(pending_delta),
+                        },
+                    },
+                )
+                pending_delta.clear()
+                delta_published_at = now
+
+        elif eventType == AgentD.EventType.TEXT_MESSAGE:
+            message = "\n".join(event)
+            # the complete message replaces the chunks streamed before it
+            pending_delta.clear()
+            delta_published_at = 0.0
+            update_session_status(
+                event_type=eventType,
+                status="Generating response",
+                update=message,
+                apppend_agent_update=message,
+                text_delta=None,
+            )
+
+        elif eventType == AgentD.EventType.TOOL_CALL_REQUEST:
+            tool_calls = AGENTD_INSTANCE.parse_tool_call_event(event)
+            message = "Agent is executing tools:\n" "\n".join(
+                f"- {tool_call['name']}"  #: {tool_call['args']}"
+                for tool_call in tool_calls
+            )
+            update_session_status(
+                event_type=eventType,
+                status="Executing tools",
+                update=message,
+                apppend_agent_update=message,
+            )
+
+        elif eventType == AgentD.EventType.TOOL_RESULT:
+            tool_results = AGENTD_INSTANCE.parse_tool_result_event(event)
+            message = ""
+            for tool_result in tool_results:
+                message += f"Tool `{tool_result['name']}` execution completed\n"
+
+            update_session_status(
+                event_type=eventType,
+                status="Processing tool results",
+                update=message,
+                apppend_agent_update=message,
+            )
+
+        elif eventType == AgentD.EventType.CONTROL_SIGNAL:
+            # something went wrong
+            update_session_status(
+                event_type=eventType,
+                status="Failed",
+                pipeline_status="failed",
+                error="An error occurred during processing.",
+                update="An error occurred during processing.",
+                end_timestamp=timestamp(),
+            )
+
+        elif eventType == AgentD.EventType.FILE_URL:
+            file_url = event.get("url")
+            description = event.get("description", "")
+            name = event.get("name", "file")
+            filetype = event.get("filetype", "txt")
+
+            notify(
+                FILE_CREATED_EVENT,
+                {
+                    "url": file_url,
+                    "name": name,
+                    "filetype": filetype,
+                    "description": description,
+                },
+            )
+            update_session_status(
+                event_type=eventType,
+                status="New file created",
+                update=f"File `{name}` ({filetype}) created: {file_url}",
+                apppend_agent_update=f"File created:\n[Download {name}]({file_url}) : {description}",
+                append_file={
+                    "url": file_url,
+                    "name": name,
+                    "filetype": filetype,
+                    "description": description,
+                },
+            )
+
+        elif eventType == AgentD.EventType.PROGRESS_UPDATE:
+            # stored as a time, so that it stays right between two updates
+            eta = datetime.utcnow() + timedelta(seconds=event["eta_seconds"])
+            update_session_status(
+                event_type=eventType,
+                progress=event["progress"],
+                eta=eta.isoformat(),
+            )
+
+        elif eventType == AgentD.EventType.USER_INPUT_REQUEST:
+            user_input_specs = event
+            if pipeline_status != "waiting_for_input":
+                # agents may repeat the request within a turn
+                notify(INPUT_REQUIRED_EVENT, {"user_input_specs": user_input_specs})
+            message = (
+                # f"Agent '{user_input_specs.get('agent_name', 'Unknown')}' is requesting your input:\n"
+                f"{user_input_specs.get('description', '')}\n"
+            )
+            # before the status change, so that an answer accepted right after it
+            # always finds the channel waiting
+            input_channel.request_input()
+            update_session_status(
+                event_type=eventType,
+                pipeline_status="waiting_for_input",
+                status="Waiting for input",
+                update=message,
+                user_input_specs=user_input_specs,
+            )
+
+        elif eventType == AgentD.EventType.TOKEN_USAGE:
+            update_session_status(event_type=eventType, token_usage=event)
+
+        elif eventType == AgentD.EventType.TOKEN_BUDGET_EXCEEDED:
+            # the agents were stopped, files created so far stay available
+            message = (
+                f"Token budget exceeded: {event['total_tokens']} of"
+                f" {event['budget']} tokens used."
+            )
+            update_session_status(
+                event_type=eventType,
+                status="Failed",
+                pipeline_status="failed",
+                error=message,
+                update=message,
+                end_timestamp=timestamp(),
+            )
+
+    try:
+        # it may have been cancelled while it was queued
+        raise_if_cancelled()
+        user_id = AGENTD_INSTANCE.generate_user_id()
+        new_session = await AGENTD_INSTANCE.new_sesion(user_id)
+        update_session_status(
+            pipeline_status="running",
+            status="In Progress",
+            update="Pipeline started.",
+            _session_id=new_session.id,
+            _user_id=user_id,
+            progress=0,
+        )
+
+        message = f"{topic}"
+        while True:
+            with PIPELINE_PHASE_DURATION.time(phase="agent"):
+                await AGENTD_INSTANCE.continue_session(
+                    message=message,
+                    session=new_session,
+                    callback=callback,
+                    token_usage=token_usage,
+                )
+
+            if pipeline_status != "waiting_for_input":
+                break
+
+            if answer_policy is not None:
+                answer = answer_policy.answer_for(user_input_specs, policy_answers)
+                if answer is None:
+                    # nobody is watching an unattended run, don't wait for them
+                    message = "The answer policy has no answer for: " + (
+                        user_input_specs.get("description") or "the agent's question."
+                    )
+                    update_session_status(
+                        pipeline_status="failed",
+                        status="Failed",
+                        error=message,
+                        update=message,
+                        end_timestamp=timestamp(),
+                    )
+                    break
+                policy_answers += 1
+                # same path as an answer from /answer, so it is stored and journaled
+                body, status_code, _ = submit_answer(request_id, {"answer": answer})
+                if status_code != 200:
+                    # nothing else would answer, don't wait for the input timeout
+                    message = (
+                        "The answer policy's answer was rejected: "
+                        + body["error"]["message"]
+                    )
+                    logger.error(
+                        "Policy answer rejected",
+                        extra=fields(
+                            request_id=request_id,
+                            status_code=status_code,
+                            error=body["error"]["message"],
+                        ),
+                    )
+                    update_session_status(
+                        pipeline_status="failed",
+                        status="Failed",
+                        error=message,
+                        update=message,
+                        end_timestamp=timestamp(),
+                    )
+                    break
+
+            # park until /answer delivers the user's input (no CPU used while waiting),
+            # answers and cancellations sent to other server processes are picked
+            # up from a shared store, which is only polled when there is one
+            if answer_policy is None:
+                # a user may take minutes, their slot runs other pipelines meanwhile
+                PIPELINE_EXECUTOR.release_slot(request_id)
+            try:
+                with PIPELINE_PHASE_DURATION.time(phase="waiting_for_input"):
+                    message = await input_channel.wait_for_input(
+                        timeout=USER_INPUT_TIMEOUT_SECONDS,
+                        poll=poll_input,
+                        poll_interval=1.0 if SESSION_STORE.shared else None,
+                    )
+            except asyncio.TimeoutError:
+                update_session_status(
+                    pipeline_status="failed",
+                    status="Failed",
+                    error="Timed out waiting for user input.",
+                    update="Timed out waiting for user input.",
+                    end_timestamp=timestamp(),
+                )
+                break
+
+            update_session_status(
+                pipeline_status="running",
+                status="In Progress",
+                update="Processing your answer",
+            )
+            await PIPELINE_EXECUTOR.acquire_slot(request_id)
+
+        if not pipeline_status == "failed":
+            update_session_status(
+                pipeline_status="completed",
+                status="Completed",
+                progress=100,
+                end_timestamp=timestamp(),
+            )
+    except asyncio.CancelledError:
+        # by /cancel, or by the server shutting down
+        update_session_status(
+            pipeline_status="cancelled",
+            status="Cancelled",
+            update="Pipeline cancelled.",
+            end_timestamp=timestamp(),
+        )
+        raise
+    except Exception as e:
+        update_session_status(
+            pipeline_status="failed",
+            error=str(e),
+            update="An error occurred during processing.",
+            end_timestamp=timestamp(),
+        )
+    finally:
+        input_channel.close()
+        INPUT_CHANNELS.pop(request_id, None)
+        PIPELINE_PHASE_DURATION.observe(time.monotonic() - started_at, phase="total")
+        PIPELINES_FINISHED.inc(pipeline_status=pipeline_status)
+        if pipeline_status in TERMINAL_STATUSES:
+            session = SESSION_STORE.get(request_id) or {}
+            notify(
+                {"completed": COMPLETED_EVENT, "cancelled": CANCELLED_EVENT}.get(
+                    pipeline_status, FAILED_EVENT
+                ),
+                {
+                    "pipeline_status": pipeline_status,
+                    "error": session.get("error"),
+                    "files": session.get("agent_files", []),
+                    "ended_at": session.get("end_timestamp"),
+                    "token_usage": token_usage.to_dict(),
+                },
+            )
+        # uploads the rest of the journal in the background
+        SESSION_JOURNAL.close_session(request_id)
+
+
+def find_session(request_id, include_history=True):
+    """
+    Returns the session from the store. Sessions that already left the store
+    (expired, or run by a server that has restarted) are rebuilt from their journal.
+    """
+    session = SESSION_STORE.get(request_id, include_history=include_history)
+    if session is not None:
+        return session
+    if not _is_request_id(request_id):
+        # not an id this server hands out, there is no journal to look for
+        return None
+
+    try:
+        journaled = SESSION_JOURNAL.load(request_id)
+    except Exception as e:
+        logger.warning(
+            "Could not load journal",
+            extra=fields(request_id=request_id, error=str(e)),
+        )
+        return None
+    if journaled is None:
+        return None
+
+    session, events = journaled
+    SESSION_STORE.restore(request_id, session, events)
+    return SESSION_STORE.get(request_id, include_history=include_history)
+
+
+def _is_request_id(request_id: str) -> bool:
+    try:
+        return str(uuid.UUID(request_id)) == request_id
+    except ValueError:
+        return False
+
+
+def error_result(message: str, status_code: int) -> ApiResult:
+    return {"error": {"message": message, "status": status_code}}, status_code, {}
+
+
+def _request_keys(topic: str, idempotency_key: Optional[str]) -> Dict[str, float]:
+    """Returns the deduplication keys of a run request and how long each is kept."""
+    keys = {}
+    if idempotency_key:
+        keys[f"idempotency:{idempotency_key}"] = IDEMPOTENCY_KEY_TTL_SECONDS
+    if RUN_DEDUP_WINDOW_SECONDS > 0:
+        normalized_topic = " ".join(topic.lower().split())
+        topic_hash = hashlib.sha256(normalized_topic.encode("utf-8")).hexdigest()
+        keys[f"topic:{topic_hash}"] = RUN_DEDUP_WINDOW_SECONDS
+    return keys
+
+
+def _deduplicated_result(request_id: str) -> ApiResult:
+    response = {
+        "status": "success",
+        "message": "Pipeline already started.",
+        "request_id": request_id,
+        "deduplicated": True,
+    }
+    return response, 200, {}
+
+
+def start_pipeline(
+    data: Optional[Dict], idempotency_key: Optional[str] = None
+) -> ApiResult:
+    """
+    Validates a run request and queues its pipeline. A request repeating an
+    `Idempotency-Key` (or a recent topic, see `RUN_DEDUP_WINDOW_SECONDS`) gets
+    the earlier request id instead of a new pipeline.
+    """
+    if not data:
+        return error_result("Invalid or missing JSON body.", 400)
+
+    valid, message = validate_run_request(data)
+    if not valid:
+        return error_result(message, 400)
+
+    callback_url = data.get("callback_url")
+    if callback_url is not None:
+        valid, message = validate_callback_url(callback_url)
+        if not valid:
+            return error_result(message, 400)
+
+    if idempotency_key is not None and not (
+        0 < len(idempotency_key) <= MAX_IDEMPOTENCY_KEY_LENGTH
+    ):
+        return error_result(
+            f"Header 'Idempotency-Key' must be 1 to {MAX_IDEMPOTENCY_KEY_LENGTH}"
+            " characters long.",
+            400,
+        )
+
+    request_keys = _request_keys(data["topic"], idempotency_key)
+    for key in request_keys:
+        # retries attach to the earlier run, even when new runs are rejected
+        existing_request_id = SESSION_STORE.find_request_key(key)
+        if existing_request_id:
+            return _deduplicated_result(existing_request_id)
+
+    admitted, message, retry_after = ADMISSION_CONTROLLER.check()
+    if not admitted:
+        PIPELINES_REJECTED.inc()
+        body, status_code, headers = error_result(message, 429)
+        headers["Retry-After"] = str(retry_after)
+        return body, status_code, headers
+
+    topic = data["topic"]
+
+    request_id = str(uuid.uuid4())
+    if request_keys:
+        # a concurrent duplicate may have claimed the keys since the lookup
+        owner_request_id = SESSION_STORE.claim_request_keys(request_id, request_keys)
+        if owner_request_id != request_id:
+            return _deduplicated_result(owner_request_id)
+
+    _create_session(request_id, topic)
+
+    queued_at = time.monotonic()
+    queue_position = PIPELINE_EXECUTOR.submit(
+        request_id,
+        lambda: real_pipeline_worker(
+            request_id, topic, queued_at, callback_url=callback_url
+        ),
+    )
+
+    response = {
+        "status": "success",
+        "message": "Pipeline started.",
+        "request_id": request_id,
+        # 0 when the pipeline started right away
+        "queue_position": queue_position,
+        "estimated_wait_seconds": PIPELINE_EXECUTOR.estimate_wait_seconds(
+            queue_position
+        ),
+    }
+    return response, 202, {}
+
+
+def _create_session(request_id: str, topic: str):
+    session = {
+        "topic": topic,
+        "pipeline_status": "queued",
+        "status": "In Progress",
+        "start_timestamp": timestamp(),
+        "end_timestamp": None,
+        "update_timestamp": timestamp(),
+        "update": None,
+        "error": None,
+        "progress": 0,
+        "eta": None,
+        "token_usage": None,
+    }
+    SESSION_STORE.create(request_id, session)
+    SESSION_JOURNAL.append(request_id, 0, "created", session)
+
+
+def start_batch(data: Optional[Dict]) -> Tuple[Optional[BatchRun], Optional[ApiResult]]:
+    """
+    Validates a batch request and starts its pipelines, at most `max_concurrency`
+    of them at a time. Questions are answered by the request's `answer_policy`.
+
+    Returns:
+        tuple: (batch, error), stream the batch with `read_batch`.
+    """
+    if not data:
+        return None, error_result("Invalid or missing JSON body.", 400)
+
+    topics = data.get("topics")
+    if not isinstance(topics, list) or not 0 < len(topics) <= MAX_BATCH_SIZE:
+        return None, error_result(
+            f"Field 'topics' must be a list of 1 to {MAX_BATCH_SIZE} topics.", 400
+        )
+    for topic in topics:
+        valid, _ = validate_run_request({"topic": topic})
+        if not valid:
+            return None, error_result(
+                "Field 'topics' must only contain non-empty strings.", 400
+            )
+
+    max_concurrency = data.get("max_concurrency", DEFAULT_BATCH_MAX_CONCURRENCY)
+    if (
+        not isinstance(max_concurrency, int)
+        or isinstance(max_concurrency, bool)
+        or not 0 < max_concurrency <= PIPELINE_EXECUTOR.max_in_flight
+    ):
+        return None, error_result(
+            "Field 'max_concurrency' must be an integer from 1 to"
+            f" {PIPELINE_EXECUTOR.max_in_flight}.",
+            400,
+        )
+
+    try:
+        answer_policy = AnswerPolicy.from_dict(data.get("answer_policy"))
+    except ValueError as e:
+        return None, error_result(str(e), 400)
+
+    # items are fed to the executor gradually, so the batch is only checked once
+    admitted, message, retry_after = ADMISSION_CONTROLLER.check()
+    if not admitted:
+        PIPELINES_REJECTED.inc()
+        body, status_code, headers = error_result(message, 429)
+        headers["Retry-After"] = str(retry_after)
+        return None, (body, status_code, headers)
+
+    items = []
+    for topic in topics:
+        request_id = str(uuid.uuid4())
+        _create_session(request_id, topic)
+        items.append({"request_id": request_id, "topic": topic})
+
+    def submit_item(index: int, on_finished):
+        request_id, topic = items[index]["request_id"], items[index]["topic"]
+        queued_at = time.monotonic()
+
+        async def run_item():
+            try:
+                await real_pipeline_worker(request_id, topic, queued_at, answer_policy)
+            finally:
+                on_finished(_batch_item_result(request_id, topic))
+
+        PIPELINE_EXECUTOR.submit(request_id, run_item)
+
+    batch = BatchRun(items, submit_item, max_concurrency)
+    batch.start()
+    return batch, None
+
+
+def _batch_item_result(request_id: str, topic: str) -> Dict:
+    session = SESSION_STORE.get(request_id) or {}
+    return {
+        "request_id": request_id,
+        "topic": topic,
+        "pipeline_status": session.get("pipeline_status", "failed"),
+        "error": session.get("error"),
+        "files": session.get("agent_files", []),
+        "started_at": session.get("start_timestamp"),
+        "ended_at": session.get("end_timestamp"),
+        "token_usage": session.get("token_usage"),
+    }
+
+
+NDJSON_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+# sent on idle batch streams, like the SSE keep-alive comment
+NDJSON_KEEP_ALIVE = '{"type": "heartbeat"}\n'
+
+
+def read_batch(batch: BatchRun, cursor: int) -> Tuple[List[str], int, bool]:
+    """
+    Returns the NDJSON lines for the batch events after `cursor`.
+
+    Returns:
+        tuple: (lines, new cursor, finished), `finished` once the summary is read.
+    """
+    lines = []
+    for event in batch.results.wait_for_events(cursor, timeout=0):
+        lines.append(format_ndjson(event))
+        cursor = event[0]
+    return lines, cursor, batch.finished and cursor == batch.results.last_event_id
+
+
+def submit_answer(request_id: str, data: Optional[Dict]) -> ApiResult:
+    """Hands the user's answer to a pipeline that is waiting for input."""
+    session = SESSION_STORE.get(request_id, include_history=False)
+    if not session:
+        return error_result("Session not found.", 404)
+
+    if session["pipeline_status"] != "waiting_for_input":
+        return error_result("This session is not expecting input at the moment.", 400)
+
+    data = data or {}
+    answer = data.get("answer")
+    if not answer or not isinstance(answer, str) or not answer.strip():
+        return error_result("Field 'answer' must be a non-empty string.", 400)
+
+    if not SESSION_STORE.submit_input(request_id, answer):
+        # already answered for this turn
+        return error_result("This session is not expecting input at the moment.", 400)
+
+    # wake the pipeline right away if it runs in this process,
+    # otherwise its process picks the answer up from the store
+    input_channel = INPUT_CHANNELS.get(request_id)
+    if input_channel:
+        input_channel.submit(answer)
+
+    return {"status": "success", "message": "Answer is being processed."}, 200, {}
+
+
+def cancel_pipeline(request_id: str) -> ApiResult:
+    """
+    Stops a queued or running pipeline, including one waiting for input. Its
+    session ends as `cancelled` and its executor slot is freed.
+    """
+    session = SESSION_STORE.get(request_id, include_history=False)
+    if not session:
+        return error_result("Session not found.", 404)
+
+    if session["pipeline_status"] in TERMINAL_STATUSES:
+        return error_result("This session has already finished.", 409)
+
+    # a pipeline of this process records the cancellation itself
+    if not PIPELINE_EXECUTOR.cancel(request_id):
+        # run by another server process, which stops at its next store check
+        SESSION_STORE.update(
+            request_id,
+            PIPELINE_STATUS_EVENT,
+            {
+                "pipeline_status": "cancelled",
+                "status": "Cancelled",
+                "update": "Pipeline cancelled.",
+                "update_timestamp": timestamp(),
+                "end_timestamp": timestamp(),
+            },
+        )
+
+    return {"status": "success", "message": "Pipeline is being cancelled."}, 202, {}
+
+
+def _version_etag(version: int) -> str:
+    return f'W/"v{version}"'
+
+
+def _parse_version_etag(if_none_match: Optional[str]) -> Optional[int]:
+    """Returns the version of the first `v<version>` ETag the client sent, if any."""
+    for etag in (if_none_match or "").split(","):
+        etag = etag.strip()
+        if etag.startswith("W/"):
+            etag = etag[2:]
+        etag = etag.strip('"')
+        if etag.startswith("v") and etag[1:].isdigit():
+            return int(etag[1:])
+    return None
+
+
+def parse_status_query(
+    request_id: str, args: Mapping[str, str], if_none_match: Optional[str]
+) -> Tuple[Optional[Dict], Optional[ApiResult]]:
+    """
+    Parses a /status request.
+
+    Returns:
+        tuple: (query, error). `query` holds `since`, `wait` (seconds to long-poll,
+        0 for none), `etag_version` (from `If-None-Match`) and `known_version`
+        (the version the client already has).
+    """
+    if not find_session(request_id, include_history=False):
+        return None, error_result("Session not found.", 404)
+
+    try:
+        since = args.get("since")
+        since = int(since) if since is not None else None
+        wait = min(float(args.get("wait", 0)), STATUS_LONG_POLL_MAX_SECONDS)
+    except ValueError:
+        return None, error_result(
+            "Query params 'since' and 'wait' must be numbers.", 400
+        )
+
+    etag_version = _parse_version_etag(if_none_match)
+    known_version = since if since is not None else etag_version
+    if known_version is None:
+        # nothing to wait against
+        wait = 0
+    query = {
+        "since": since,
+        "wait": wait,
+        "etag_version": etag_version,
+        "known_version": known_version,
+    }
+    return query, None
+
+
+def get_status(request_id: str, query: Dict) -> ApiResult:
+    """
+    Returns the session status, or a 304 when the client's ETag still matches the
+    session version. Call it once any long-poll wait of `query` is over.
+    """
+    since = query["since"]
+    session = SESSION_STORE.get(request_id, include_history=since is None)
+    if not session:
+        return error_result("Session not found.", 404)
+
+    version = session["version"]
+    headers = {"ETag": _version_etag(version), "Cache-Control": "no-cache"}
+    if query["etag_version"] == version:
+        return None, 304, headers
+
+    if since is None:
+        agent_updates = session["agent_updates"]
+    else:
+        agent_updates = [
+            data["agent_update"]
+            for event_version, _, data in SESSION_STORE.get_events(request_id, since)
+            if "agent_update" in data and event_version <= version
+        ]
+
+    response = {
+        "status": "success",
+        "request_id": request_id,
+        "version": version,
+        "since": since,
+        "pipeline_status": session["pipeline_status"],
+        "updated_at": session["update_timestamp"],
+        "progress": session["progress"],
+        # agent time left, only estimated while the agents are working
+        "eta": session.get("eta") if session["pipeline_status"] == "running" else None,
+        "update": session["update"],
+        "agent_updates": agent_updates,
+        "error": session.get("error"),
+        "started_at": session["start_timestamp"],
+        "ended_at": session["end_timestamp"],
+        "token_usage": session.get("token_usage"),
+    }
+    return response, 200, headers
+
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+SSE_KEEP_ALIVE = ": keep-alive\n\n"
+
+
+def parse_stream_request(
+    request_id: str, args: Mapping[str, str], last_event_id: Optional[str]
+) -> Tuple[Optional[int], Optional[ApiResult]]:
+    """
+    Parses a /stream request. Clients resume with the `Last-Event-ID` header
+    (or `?last_event_id=`).
+
+    Returns:
+        tuple: (cursor, error), the cursor is the last event id the client has.
+    """
+    if not find_session(request_id, include_history=False):
+        return None, error_result("Session not found.", 404)
+
+    last_event_id = last_event_id or args.get("last_event_id", "0")
+    try:
+        return int(last_event_id), None
+    except ValueError:
+        return None, error_result("Last-Event-ID must be an integer.", 400)
+
+
+def read_stream(request_id: str, cursor: int) -> Tuple[List[str], int, bool]:
+    """
+    Returns the SSE messages for the events after `cursor`.
+
+    Returns:
+        tuple: (messages, new cursor, finished), `finished` once the session is
+        over (or gone) and the client has every event.
+    """
+    messages = []
+    for event in SESSION_STORE.get_events(request_id, cursor):
+        messages.append(format_sse(event))
+        cursor = event[0]
+
+    session = SESSION_STORE.get(request_id, include_history=False)
+    finished = not session or (
+        session["pipeline_status"] in TERMINAL_STATUSES and cursor >= session["version"]
+    )
+    return messages, cursor, finished
+
+
+def get_pipeline_counts() -> ApiResult:
+    counts = SESSION_STORE.count_by_status()
+    piplines_status = {
+        "queued_pipelines": counts["queued"],
+        "running_pipelines": counts["running"],
+        "completed_pipelines": counts["completed"],
+        "failed_pipelines": counts["failed"],
+        "cancelled_pipelines": counts["cancelled"],
+        "waiting_for_input_pipelines": counts["waiting_for_input"],
+    }
+
+    response = {
+        "status": "success",
+        "data": piplines_status,
+    }
+    return response, 200, {}
+
+
+def get_health() -> ApiResult:
+    uptime_seconds = int(time.time() - PROCESS_START_TIME)
+    response = {
+        "status": "ok",
+        "last_cleanup": CLEAN_UP_INFO["last_cleanup"],
+        "cleanup_count": CLEAN_UP_INFO["cleanup_count"],
+        "active_sessions": SESSION_STORE.count(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "uptime": str(timedelta(seconds=uptime_seconds)),
+        "uptime_seconds": uptime_seconds,
+    }
+    return response, 200, {}
+
+
+def check_storage() -> ApiResult:
+    try:
+        get_cloud_storage().get_file_url("index.html")
+        return {"status": "ok", "message": "Database is accessible."}, 200, {}
+    except Exception as e:
+        return error_result(f"Database check failed: {str(e)}", 500)
+
+
+def clear_old_sessions():
+    CLEAN_UP_INFO["last_cleanup"] = datetime.now(timezone.utc).isoformat()
+    CLEAN_UP_INFO["cleanup_count"] += 1
+    # remove sessions whose TTL passed (helps in reducing memory usage)
+    cleared = SESSION_STORE.expire()
+
+    if cleared:
+        logger.info("Expired sessions cleared", extra=fields(count=cleared))
+    # schedule next
+    timer = threading.Timer(CLEAN_UP_INTERVAL_SECONDS, clear_old_sessions)
+    timer.daemon = True
+    timer.start()
+
+
+clear_old_sessions()
@@ -1,22 +1,56 @@
-import os
+import time
 
-from flask import Flask, jsonify, send_from_directory
+from flask import Flask, Response, g, jsonify, request, send_file
 from flask_cors import CORS
 
+from .api_service import HTTP_REQUEST_DURATION, HTTP_REQUESTS
 from .routes import api
+from .static_assets import STATIC_FOLDER, StaticAssets
 
 
 def create_app():
-    app = Flask(__name__, static_folder="static", static_url_path="/")
+    # the build is served from the asset manifest by `serve_react`
+    app = Flask(__name__, static_folder=None)
     CORS(app)
+    static_assets = StaticAssets(STATIC_FOLDER)
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started_at = time.perf_counter()
+
+    @app.after_request
+    def record_request_metrics(response):
+        # label by route pattern, not by path, to keep the number of series bounded
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        started_at = g.get("request_started_at")
+        if started_at is not None:
+            HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - started_at, method=request.method, route=route
+            )
+        HTTP_REQUESTS.inc(
+            method=request.method, route=route, status=response.status_code
+        )
+        return response
 
     @app.route("/", defaults={"path": ""})
     @app.route("/<path:path>")
     def serve_react(path):
-        if path != "" and os.path.exists(app.static_folder + "/" + path):
-            return send_from_directory(app.static_folder, path)
+        # unknown paths are client-side routes of the React app
+        asset = static_assets.get(path) or static_assets.index
+        if asset is None:
+            # the React app is not built
+            return jsonify({"error": "Not found"}), 404
+
+        status_code, headers, body = asset.respond(
+            request.headers.get("Accept-Encoding"), request.headers.get("If-None-Match")
+        )
+        if status_code == 200 and body is None:
+            response = send_file(asset.file_path, conditional=False)
         else:
-            return send_from_directory(app.static_folder, "index.html")
+            response = Response(body)
+        response.status_code = status_code
+        response.headers.update(headers)
+        return response
 
     @app.errorhandler(404)
     def not_found(e):
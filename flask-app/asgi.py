@@ -0,0 +1,268 @@
+"""
+ASGI app serving the same `/api` routes as the Flask app, e.g.
+`uvicorn flask-app.asgi:app --host 0.0.0.0 --port 8080`.
+
+Long-polls and SSE streams wait on the server's event loop, so idle connections
+don't hold a worker thread each. Pipelines keep running on the executor's own
+event loop threads: their agents still do blocking work (PDF rendering, uploads,
+file and sqlite writes) that would stall every request on the server's loop.
+For the same reason handlers run the `api_service` calls that touch the session
+store, the journal or the network in a worker thread (`asyncio.to_thread`).
+"""
+
+import asyncio
+import time
+
+from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from agentd.utils.metrics import PROMETHEUS_CONTENT_TYPE, REGISTRY
+
+from . import api_service
+from .api_service import (
+    HTTP_REQUEST_DURATION,
+    HTTP_REQUESTS,
+    NDJSON_CONTENT_TYPE,
+    NDJSON_HEADERS,
+    NDJSON_KEEP_ALIVE,
+    SESSION_STORE,
+    SSE_HEADERS,
+    SSE_HEARTBEAT_SECONDS,
+    SSE_KEEP_ALIVE,
+)
+from .static_assets import STATIC_FOLDER, StaticAssets
+
+STATIC_ASSETS = StaticAssets(STATIC_FOLDER)
+
+
+def to_response(result: api_service.ApiResult) -> Response:
+    body, status_code, headers = result
+    if body is None:
+        return Response(status_code=status_code, headers=headers)
+    return JSONResponse(body, status_code=status_code, headers=headers)
+
+
+async def _json_body(request: Request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+async def run_pipeline(request: Request):
+    return to_response(
+        await asyncio.to_thread(
+            api_service.start_pipeline,
+            await _json_body(request),
+            request.headers.get("Idempotency-Key"),
+        )
+    )
+
+
+async def run_batch(request: Request):
+    """Same as the Flask `/run/batch`, the stream waits on the event loop."""
+    batch, error = await asyncio.to_thread(
+        api_service.start_batch, await _json_body(request)
+    )
+    if error:
+        return to_response(error)
+
+    async def generate(cursor):
+        while True:
+            lines, cursor, finished = api_service.read_batch(batch, cursor)
+            for line in lines:
+                yield line
+            if finished:
+                break
+            if not await batch.wait_for_results_async(
+                cursor, timeout=SSE_HEARTBEAT_SECONDS
+            ):
+                yield NDJSON_KEEP_ALIVE
+
+    return StreamingResponse(
+        generate(0), media_type=NDJSON_CONTENT_TYPE, headers=NDJSON_HEADERS
+    )
+
+
+async def provide_solution_choice(request: Request):
+    request_id = request.path_params["request_id"]
+    return to_response(
+        await asyncio.to_thread(
+            api_service.submit_answer, request_id, await _json_body(request)
+        )
+    )
+
+
+async def cancel_pipeline(request: Request):
+    request_id = request.path_params["request_id"]
+    return to_response(await asyncio.to_thread(api_service.cancel_pipeline, request_id))
+
+
+async def get_request_status(request: Request):
+    """Same as the Flask `/status`, long-polls wait on the event loop."""
+    request_id = request.path_params["request_id"]
+    # may rebuild the session from its journal in cloud storage
+    query, error = await asyncio.to_thread(
+        api_service.parse_status_query,
+        request_id,
+        request.query_params,
+        request.headers.get("If-None-Match"),
+    )
+    if error:
+        return to_response(error)
+
+    if query["wait"] > 0:
+        await SESSION_STORE.wait_for_change_async(
+            request_id, query["known_version"], timeout=query["wait"]
+        )
+    return to_response(
+        await asyncio.to_thread(api_service.get_status, request_id, query)
+    )
+
+
+async def stream_request_events(request: Request):
+    """Same as the Flask `/stream`, streams wait on the event loop."""
+    request_id = request.path_params["request_id"]
+    cursor, error = await asyncio.to_thread(
+        api_service.parse_stream_request,
+        request_id,
+        request.query_params,
+        request.headers.get("Last-Event-ID"),
+    )
+    if error:
+        return to_response(error)
+
+    async def generate(cursor):
+        while True:
+            messages, cursor, finished = await asyncio.to_thread(
+                api_service.read_stream, request_id, cursor
+            )
+            for message in messages:
+                yield message
+            if finished:
+                break
+            if not await SESSION_STORE.wait_for_change_async(
+                request_id, cursor, timeout=SSE_HEARTBEAT_SECONDS
+            ):
+                yield SSE_KEEP_ALIVE
+
+    return StreamingResponse(
+        generate(cursor), media_type="text/event-stream", headers=SSE_HEADERS
+    )
+
+
+async def get_status(request: Request):
+    return to_response(await asyncio.to_thread(api_service.get_pipeline_counts))
+
+
+async def api_index(request: Request):
+    return JSONResponse({"status": "ok"})
+
+
+async def get_metrics(request: Request):
+    return Response(
+        REGISTRY.render(), headers={"Content-Type": PROMETHEUS_CONTENT_TYPE}
+    )
+
+
+async def health_check(request: Request):
+    return to_response(await asyncio.to_thread(api_service.get_health))
+
+
+async def db_check(request: Request):
+    return to_response(await asyncio.to_thread(api_service.check_storage))
+
+
+async def serve_react(request: Request):
+    # unknown paths are client-side routes of the React app
+    asset = (
+        STATIC_ASSETS.get(request.path_params.get("path", "")) or STATIC_ASSETS.index
+    )
+    if asset is None:
+        # the React app is not built
+        raise HTTPException(status_code=404)
+
+    status_code, headers, body = asset.respond(
+        request.headers.get("Accept-Encoding"), request.headers.get("If-None-Match")
+    )
+    if status_code == 200 and body is None:
+        return FileResponse(asset.file_path, headers=headers)
+    return Response(body, status_code=status_code, headers=headers)
+
+
+async def not_found(request: Request, exc: HTTPException):
+    if exc.status_code == 404:
+        return JSONResponse({"error": "Not found"}, status_code=404)
+    return JSONResponse({"error": exc.detail}, status_code=exc.status_code)
+
+
+class RequestMetricsMiddleware:
+    """Records the same per-route request metrics as the Flask app."""
+
+    def __init__(self, app, routes):
+        self.app = app
+        self.route_patterns = {route.endpoint: route.path for route in routes}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started_at = time.perf_counter()
+
+        async def send_with_metrics(message):
+            if message["type"] == "http.response.start":
+                # the router stored the matched endpoint in the scope
+                route = self.route_patterns.get(scope.get("endpoint"), "unmatched")
+                HTTP_REQUEST_DURATION.observe(
+                    time.perf_counter() - started_at,
+                    method=scope["method"],
+                    route=route,
+                )
+                HTTP_REQUESTS.inc(
+                    method=scope["method"], route=route, status=message["status"]
+                )
+            await send(message)
+
+        await self.app(scope, receive, send_with_metrics)
+
+
+ROUTES = [
+    Route("/api/run", run_pipeline, methods=["POST"]),
+    Route("/api/run/batch", run_batch, methods=["POST"]),
+    Route("/api/answer/{request_id}", provide_solution_choice, methods=["POST"]),
+    Route("/api/cancel/{request_id}", cancel_pipeline, methods=["POST"]),
+    Route("/api/status/{request_id}", get_request_status, methods=["GET"]),
+    Route("/api/stream/{request_id}", stream_request_events, methods=["GET"]),
+    Route("/api/api-status", get_status, methods=["GET"]),
+    Route("/api/", api_index, methods=["GET"]),
+    Route("/api/metrics", get_metrics, methods=["GET"]),
+    Route("/api/health", health_check, methods=["GET"]),
+    Route("/api/db-check", db_check, methods=["GET"]),
+    Route("/", serve_react, methods=["GET"]),
+    Route("/{path:path}", serve_react, methods=["GET"]),
+]
+
+
+def create_app() -> Starlette:
+    return Starlette(
+        routes=ROUTES,
+        middleware=[
+            Middleware(RequestMetricsMiddleware, routes=ROUTES),
+            Middleware(
+                CORSMiddleware,
+                allow_origins=["*"],
+                allow_methods=["*"],
+                allow_headers=["*"],
+            ),
+        ],
+        exception_handlers={HTTPException: not_found},
+    )
+
+
+app = create_app()
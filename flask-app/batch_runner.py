@@ -0,0 +1,116 @@
+"""Runs many pipelines for one batch request under a shared concurrency limit."""
+
+import json
+import os
+import threading
+import uuid
+from typing import Callable, Dict, List
+
+from .session_events import SessionEvent, SessionEventLog
+
+# pipelines of a single batch running at the same time, so that one batch
+# doesn't take every executor slot from interactive runs
+DEFAULT_BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+
+BATCH_STARTED_EVENT = "batch"
+BATCH_ITEM_EVENT = "item"
+BATCH_FINISHED_EVENT = "summary"
+
+
+class BatchRun:
+    """
+    The items of one batch and the results of those that finished.
+
+    Items are submitted to the pipeline executor `max_concurrency` at a time, each
+    finished item submits the next one. Results are appended to an event log, so
+    a reader can stream them in the order they finish (sync or async).
+
+    Args:
+        items: `{"request_id", "topic"}` of every item, in batch order.
+        submit: Queues an item's pipeline, `submit(index, on_finished)`. The
+            pipeline must call `on_finished(result)` once it is over.
+        max_concurrency: Items of this batch in the executor at the same time.
+    """
+
+    def __init__(
+        self,
+        items: List[Dict],
+        submit: Callable[[int, Callable[[Dict], None]], None],
+        max_concurrency: int = DEFAULT_BATCH_MAX_CONCURRENCY,
+    ):
+        self.batch_id = str(uuid.uuid4())
+        self.items = items
+        self.max_concurrency = max(1, max_concurrency)
+        # a "batch" event, "item" events in the order items finish, then a "summary"
+        self.results = SessionEventLog()
+        self._submit = submit
+        self._lock = threading.Lock()
+        self._next_index = 0
+        self._pipeline_statuses: Dict[str, int] = {}
+
+    def start(self):
+        self.results.append(
+            BATCH_STARTED_EVENT,
+            {
+                "batch_id": self.batch_id,
+                "total": len(self.items),
+                "max_concurrency": self.max_concurrency,
+                # clients that lose the stream can still poll each item's /status
+                "items": [
+                    {"index": index, **item} for index, item in enumerate(self.items)
+                ],
+            },
+        )
+        for _ in range(min(self.max_concurrency, len(self.items))):
+            self._submit_next()
+
+    def _submit_next(self):
+        with self._lock:
+            if self._next_index >= len(self.items):
+                return
+            index = self._next_index
+            self._next_index += 1
+
+        def on_finished(result: Dict):
+            self._record(index, result)
+            self._submit_next()
+
+        self._submit(index, on_finished)
+
+    def _record(self, index: int, result: Dict):
+        pipeline_status = result.get("pipeline_status")
+        with self._lock:
+            self._pipeline_statuses[pipeline_status] = (
+                self._pipeline_statuses.get(pipeline_status, 0) + 1
+            )
+            finished = sum(self._pipeline_statuses.values()) == len(self.items)
+            summary = dict(self._pipeline_statuses)
+
+        self.results.append(BATCH_ITEM_EVENT, {"index": index, **result})
+        if finished:
+            self.results.append(
+                BATCH_FINISHED_EVENT,
+                {
+                    "batch_id": self.batch_id,
+                    "total": len(self.items),
+                    "pipeline_statuses": summary,
+                },
+            )
+
+    @property
+    def finished(self) -> bool:
+        return self.results.last_event_id == len(self.items) + 2
+
+    def wait_for_results(self, cursor: int, timeout: float) -> List[SessionEvent]:
+        return self.results.wait_for_events(cursor, timeout)
+
+    async def wait_for_results_async(
+        self, cursor: int, timeout: float
+    ) -> List[SessionEvent]:
+        return await self.results.wait_for_events_async(cursor, timeout)
+
+
+def format_ndjson(event: SessionEvent) -> str:
+    """Formats a batch event as one line of newline-delimited JSON."""
+    _, event_type, data = event
+    return json.dumps({"type": event_type, **data}) + "\n"
@@ -0,0 +1,165 @@
+"""Awaitable per-session channel used to hand user answers to a waiting pipeline."""
+
+import asyncio
+import threading
+import time
+from typing import Callable, Optional
+
+
+class TurnState:
+    """Enum for whose turn it is in a pipeline session."""
+
+    AGENT = "agent"
+    WAITING_FOR_USER = "waiting_for_user"
+    USER_ANSWERED = "user_answered"
+    CLOSED = "closed"
+
+
+class InputChannelClosed(Exception):
+    """Raised when a closed channel is used."""
+
+
+def _resolve(future: asyncio.Future, value):
+    if not future.done():
+        future.set_result(value)
+
+
+def _cancel(future: asyncio.Future):
+    if not future.done():
+        future.cancel()
+
+
+class UserInputChannel:
+    """
+    Hands user input from the API threads to a pipeline coroutine.
+
+    The pipeline calls `request_input()` when an agent asks a question and then
+    awaits `wait_for_input()`. The API calls `submit()` from any thread.
+    A waiting pipeline is parked on an asyncio Future, so it costs no CPU.
+
+    Answers received by another server process can't resolve the Future, for
+    those `wait_for_input()` also checks a `poll` function, at growing intervals.
+
+    Turn transitions:
+        AGENT            -> WAITING_FOR_USER  (request_input)
+        WAITING_FOR_USER -> USER_ANSWERED     (submit)
+        USER_ANSWERED    -> AGENT             (wait_for_input returns)
+        any              -> CLOSED            (close)
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self._lock = threading.Lock()
+        self._state = TurnState.AGENT
+        self._future: Optional[asyncio.Future] = None
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def request_input(self):
+        """
+        Marks the session as waiting for the user. Must be called on the loop thread.
+        Repeated requests within the same turn are ignored.
+        """
+        with self._lock:
+            if self._state == TurnState.CLOSED:
+                raise InputChannelClosed("Input channel is closed.")
+            if self._state != TurnState.AGENT:
+                return
+            self._state = TurnState.WAITING_FOR_USER
+            self._future = self._loop.create_future()
+
+    def submit(self, answer: str) -> bool:
+        """
+        Delivers the user's answer. Safe to call from any thread.
+
+        Returns:
+            bool: False if the channel is not waiting for input (e.g. already answered).
+        """
+        with self._lock:
+            if self._state != TurnState.WAITING_FOR_USER:
+                return False
+            self._state = TurnState.USER_ANSWERED
+            future = self._future
+
+        self._loop.call_soon_threadsafe(_resolve, future, answer)
+        return True
+
+    async def wait_for_input(
+        self,
+        timeout: Optional[float] = None,
+        poll: Optional[Callable[[], Optional[str]]] = None,
+        poll_interval: Optional[float] = 1.0,
+        max_poll_interval: float = 10.0,
+    ) -> str:
+        """
+        Waits until the user answers the pending request.
+
+        Args:
+            timeout: Maximum seconds to wait, None to wait forever.
+            poll: Optional function returning the answer if one was stored elsewhere
+                (e.g. the session store), or None. It is called when the wait starts
+                and is also the source of the answer when `submit()` wakes the
+                channel up.
+            poll_interval: Seconds before the next `poll` call, doubled after every
+                call up to `max_poll_interval`. None to only poll when woken up, if
+                every answer comes through `submit()`.
+            max_poll_interval: The longest interval between two `poll` calls.
+
+        Raises:
+            asyncio.TimeoutError: if no answer arrives within `timeout` seconds.
+            InputChannelClosed: if the channel is closed while waiting.
+        """
+        with self._lock:
+            if self._state == TurnState.CLOSED:
+                raise InputChannelClosed("Input channel is closed.")
+            if self._future is None:
+                raise RuntimeError("Input was not requested for this turn.")
+            future = self._future
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        interval = poll_interval
+        try:
+            while True:
+                answer = poll() if poll else None
+                if answer is not None:
+                    break
+                if future.done():
+                    answer = future.result()
+                    break
+
+                wait_time = None
+                if poll and interval is not None:
+                    wait_time = interval
+                    interval = min(interval * 2, max_poll_interval)
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise asyncio.TimeoutError()
+                    wait_time = (
+                        remaining if wait_time is None else min(wait_time, remaining)
+                    )
+
+                # shield so that an elapsed poll interval doesn't cancel the future
+                await asyncio.wait({asyncio.shield(future)}, timeout=wait_time)
+        except asyncio.CancelledError:
+            if self._state == TurnState.CLOSED:
+                raise InputChannelClosed("Input channel is closed.")
+            raise
+
+        with self._lock:
+            if self._state != TurnState.CLOSED:
+                self._state = TurnState.AGENT
+                self._future = None
+        return answer
+
+    def close(self):
+        """Closes the channel and wakes up any waiting coroutine."""
+        with self._lock:
+            self._state = TurnState.CLOSED
+            future = self._future
+            self._future = None
+
+        if future is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(_cancel, future)
@@ -0,0 +1,257 @@
+"""Shared executor that runs pipeline coroutines on a few long-lived event loops."""
+
+import asyncio
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from agentd.utils.log_utils import fields, get_logger
+
+logger = get_logger(__name__)
+
+# maximum number of pipelines running agents at the same time, the rest wait in the
+# queue (pipelines waiting for a user's answer give up their slot meanwhile)
+DEFAULT_MAX_IN_FLIGHT = int(os.getenv("PIPELINE_MAX_IN_FLIGHT", "32"))
+# number of event loop threads, more than one keeps a blocking tool
+# (PDF rendering, uploads) from stalling every running pipeline
+DEFAULT_EVENT_LOOPS = int(os.getenv("PIPELINE_EVENT_LOOPS", "4"))
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class _EventLoopThread:
+    """An event loop running forever in a daemon thread."""
+
+    def __init__(self, name: str):
+        self.loop = asyncio.new_event_loop()
+        self.in_flight = 0
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+
+class PipelineExecutor:
+    """
+    Runs pipeline coroutines with admission control.
+
+    At most `max_in_flight` pipelines run at once, spread over `num_loops` event
+    loop threads. Everything else waits in a FIFO queue, so a burst of requests
+    only grows the queue, not the number of threads or event loops.
+
+    A job that waits for something slow and cheap (a user's answer) gives its slot
+    to the queue with `release_slot()` and takes one back with `acquire_slot()`.
+    Jobs taking back a slot go before the queued ones.
+
+    `cancel()` raises `asyncio.CancelledError` in a job at its next `await`, the
+    job's coroutine is expected to clean up and let it propagate.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+        num_loops: int = DEFAULT_EVENT_LOOPS,
+    ):
+        if max_in_flight < 1 or num_loops < 1:
+            raise ValueError("max_in_flight and num_loops must be at least 1.")
+
+        self.max_in_flight = max_in_flight
+        self.num_loops = num_loops
+        self._lock = threading.Lock()
+        self._queue: "OrderedDict[str, Callable[[], Awaitable]]" = OrderedDict()
+        self._running: Dict[str, asyncio.Future] = {}
+        # tasks of the running jobs that have started on their loop
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._cancelled: Set[str] = set()
+        # running jobs that released their slot, and those waiting to get one back
+        self._idle: Set[str] = set()
+        self._resuming: "OrderedDict[str, asyncio.Future]" = OrderedDict()
+        # when each running job (re)took its slot
+        self._slot_taken_at: Dict[str, float] = {}
+        self._loops: List[_EventLoopThread] = []
+        self._ids = itertools.count()
+        # moving average of how long a pipeline holds its slot
+        self._average_run_seconds: Optional[float] = None
+
+    @property
+    def queue_length(self) -> int:
+        return len(self._queue)
+
+    @property
+    def in_flight(self) -> int:
+        """Running jobs holding a slot, those that released theirs don't count."""
+        return len(self._running) - len(self._idle)
+
+    @property
+    def idle(self) -> int:
+        """Running jobs that released their slot."""
+        return len(self._idle)
+
+    @property
+    def average_run_seconds(self) -> Optional[float]:
+        """Recent average time a pipeline holds its slot, None before the first one ends."""
+        return self._average_run_seconds
+
+    def estimate_wait_seconds(self, queue_position: int) -> Optional[float]:
+        """
+        Estimates how long the job at `queue_position` (1-based) waits for a slot,
+        assuming slots free up at the recent average rate. None without history.
+        """
+        if queue_position <= 0:
+            return 0
+        if self._average_run_seconds is None:
+            return None
+        batches = -(-queue_position // self.max_in_flight)
+        return round(batches * self._average_run_seconds, 1)
+
+    def submit(self, job_id: str, coro_factory: Callable[[], Awaitable]) -> int:
+        """
+        Queues a pipeline. `coro_factory` is called once a slot is free and must
+        return the coroutine to run.
+
+        Returns:
+            int: The job's position in the queue (0 if it started right away).
+        """
+        with self._lock:
+            if job_id in self._queue or job_id in self._running:
+                raise ValueError(f"Job '{job_id}' is already submitted.")
+            self._queue[job_id] = coro_factory
+            self._dispatch_locked()
+            return self._queue_position_locked(job_id)
+
+    def queue_position(self, job_id: str) -> Optional[int]:
+        """Returns the 1-based queue position, 0 if running, None if unknown."""
+        with self._lock:
+            return self._queue_position_locked(job_id)
+
+    def _queue_position_locked(self, job_id: str) -> Optional[int]:
+        if job_id in self._running:
+            return 0
+        for position, queued_id in enumerate(self._queue, start=1):
+            if queued_id == job_id:
+                return position
+        return None
+
+    def release_slot(self, job_id: str):
+        """Gives the slot of a running job to the next job in line."""
+        with self._lock:
+            if job_id not in self._running or job_id in self._idle:
+                return
+            self._idle.add(job_id)
+            self._record_slot_time_locked(job_id)
+            self._dispatch_locked()
+
+    async def acquire_slot(self, job_id: str):
+        """Waits until a job that released its slot has one again."""
+        with self._lock:
+            if job_id not in self._idle:
+                return
+            if self.in_flight < self.max_in_flight and not self._resuming:
+                self._take_slot_locked(job_id)
+                return
+            future = asyncio.get_running_loop().create_future()
+            self._resuming[job_id] = future
+        # on cancellation `_run` forgets the job, the slot is never taken
+        await future
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancels a job. A queued job is started right away, outside of the
+        `max_in_flight` limit, so that it is cancelled like a running one and
+        its coroutine can clean up (it never gets further than its first `await`).
+
+        Returns:
+            bool: False if the job is not queued or running in this executor.
+        """
+        with self._lock:
+            if job_id in self._queue:
+                self._cancelled.add(job_id)
+                self._start_locked(job_id, self._queue.pop(job_id))
+                return True
+            if job_id not in self._running:
+                return False
+            self._cancelled.add(job_id)
+            task = self._tasks.get(job_id)
+
+        # otherwise the job hasn't started on its loop yet, `_run` cancels it
+        if task is not None:
+            task.get_loop().call_soon_threadsafe(task.cancel)
+        return True
+
+    def _dispatch_locked(self):
+        while self.in_flight < self.max_in_flight:
+            if self._resuming:
+                job_id, future = self._resuming.popitem(last=False)
+                self._take_slot_locked(job_id)
+                future.get_loop().call_soon_threadsafe(_resolve, future)
+            elif self._queue:
+                self._start_locked(*self._queue.popitem(last=False))
+            else:
+                break
+
+    def _take_slot_locked(self, job_id: str):
+        self._idle.discard(job_id)
+        self._slot_taken_at[job_id] = time.monotonic()
+
+    def _record_slot_time_locked(self, job_id: str):
+        """Adds how long a job held its slot to the moving average."""
+        taken_at = self._slot_taken_at.pop(job_id, None)
+        if taken_at is None or job_id in self._cancelled:
+            # cut short, it would skew the wait estimates
+            return
+        run_seconds = time.monotonic() - taken_at
+        if self._average_run_seconds is None:
+            self._average_run_seconds = run_seconds
+        else:
+            self._average_run_seconds += 0.2 * (run_seconds - self._average_run_seconds)
+
+    def _start_locked(self, job_id: str, coro_factory: Callable[[], Awaitable]):
+        event_loop = self._least_loaded_loop_locked()
+        event_loop.in_flight += 1
+        self._running[job_id] = asyncio.run_coroutine_threadsafe(
+            self._run(job_id, coro_factory, event_loop), event_loop.loop
+        )
+
+    def _least_loaded_loop_locked(self) -> _EventLoopThread:
+        if len(self._loops) < self.num_loops:
+            # loops are started lazily so that forked workers own their threads
+            event_loop = _EventLoopThread(f"pipeline-loop-{next(self._ids)}")
+            self._loops.append(event_loop)
+            return event_loop
+        return min(self._loops, key=lambda event_loop: event_loop.in_flight)
+
+    async def _run(
+        self,
+        job_id: str,
+        coro_factory: Callable[[], Awaitable],
+        event_loop: _EventLoopThread,
+    ):
+        task = asyncio.current_task()
+        with self._lock:
+            self._tasks[job_id] = task
+            self._slot_taken_at[job_id] = time.monotonic()
+            if job_id in self._cancelled:
+                task.cancel()
+        try:
+            await coro_factory()
+        except Exception:
+            # nobody waits on the job's future, the error would go unnoticed
+            logger.exception("Pipeline job failed", extra=fields(job_id=job_id))
+        finally:
+            with self._lock:
+                self._record_slot_time_locked(job_id)
+                self._running.pop(job_id, None)
+                self._tasks.pop(job_id, None)
+                self._idle.discard(job_id)
+                self._resuming.pop(job_id, None)
+                self._cancelled.discard(job_id)
+                event_loop.in_flight -= 1
+                self._dispatch_locked()
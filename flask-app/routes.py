@@ -3,349 +3,140 @@
 # CURRENTLY, THIS IS NO AUTHENTICATION ASPECT TO THIS API.
 # IT IS EXPECTED THAT USERS WILL NOT INPUT SENSITIVE DATA.
 # ============================================================
-import asyncio
-import io
-import json
-import os
-import tempfile
-import threading
-import time
-import uuid
-from dataclasses import dataclass
-from datetime import datetime, timezone
-from typing import Dict, Optional
-
-from flask import Blueprint, jsonify, request, send_file
-from google.adk.events import Event
-
-from agentd import AgentD
-from agentd.utils import get_cloud_storage
-
-from .utils import error_response
+from flask import Blueprint, Response, jsonify, request, stream_with_context
 
-api = Blueprint("api", __name__)
-
-SESSIONS: Dict[str, Dict] = {}
-
-AGENTD_INSTANCE = AgentD()
-CLEAN_UP_INFO = {
-    "last_cleanup": datetime.now(timezone.utc).isoformat(),
-    "cleanup_count": 0,
-}
-
-
-def timestamp():
-    return datetime.utcnow().isoformat()
-
-
-def validate_run_request(data):
-    topic = data.get("topic")
-    if not topic or not isinstance(topic, str) or not topic.strip():
-        return False, "Field 'topic' must be a non-empty string."
-    return True, ""
-
-
-async def real_pipeline_worker(request_id, topic):
-    # 1. create user and session
-    # 2. run
+from agentd.utils.metrics import PROMETHEUS_CONTENT_TYPE, REGISTRY
 
-    user_id = AGENTD_INSTANCE.generate_user_id()
-    new_session = await AGENTD_INSTANCE.new_sesion(user_id)
+from . import api_service
+from .api_service import (
+    NDJSON_CONTENT_TYPE,
+    NDJSON_HEADERS,
+    NDJSON_KEEP_ALIVE,
+    SESSION_STORE,
+    SSE_HEADERS,
+    SSE_HEARTBEAT_SECONDS,
+    SSE_KEEP_ALIVE,
+)
 
-    SESSIONS[request_id].update(
-        {
-            "pipeline_status": "running",
-            "status": "In Progress",
-            "update_timestamp": timestamp(),
-            "update": "Pipeline started.",
-            "_session_id": new_session.id,
-            "_user_id": user_id,
-            "progress": 0,
-        }
-    )
-
-    def update_session_status(**kwargs):
-        kwargs.setdefault("update_timestamp", timestamp())
-        append_agent_update = kwargs.pop("apppend_agent_update", None)
-        append_file = kwargs.pop("append_file", None)
-        if append_agent_update:
-            agent_prev_updates = SESSIONS[request_id].get("agent_updates", [])
-            agent_prev_updates.append(append_agent_update)
-            SESSIONS[request_id]["agent_updates"] = agent_prev_updates
-        if append_file:
-            agent_prev_files = SESSIONS[request_id].get("agent_files", [])
-            agent_prev_files.append(append_file)
-            SESSIONS[request_id]["agent_files"] = agent_prev_files
-        SESSIONS[request_id].update(**kwargs)
-
-    def callback(event: Event, eventType: AgentD.EventType):
-        if eventType == AgentD.EventType.TEXT_MESSAGE:
-            message = "\n".join(event)
-            update_session_status(
-                status="Generating response",
-                update=message,
-                apppend_agent_update=message,
-            )
-
-        elif eventType == AgentD.EventType.TOOL_CALL_REQUEST:
-            tool_calls = AGENTD_INSTANCE.parse_tool_call_event(event)
-            message = "Agent is executing tools:\n" "\n".join(
-                f"- {tool_call['name']}"  #: {tool_call['args']}"
-                for tool_call in tool_calls
-            )
-            update_session_status(
-                status="Executing tools",
-                update=message,
-                apppend_agent_update=message,
-            )
-
-        elif eventType == AgentD.EventType.TOOL_RESULT:
-            tool_results = AGENTD_INSTANCE.parse_tool_result_event(event)
-            message = ""
-            for tool_result in tool_results:
-                message += f"Tool `{tool_result['name']}` execution completed\n"
-
-            update_session_status(
-                status="Processing tool results",
-                update=message,
-                apppend_agent_update=message,
-            )
-
-        elif eventType == AgentD.EventType.CONTROL_SIGNAL:
-            # something went wrong
-            update_session_status(
-                status="Failed",
-                pipeline_status="failed",
-                error="An error occurred during processing.",
-                update="An error occurred during processing.",
-                end_timestamp=timestamp(),
-            )
-
-        elif eventType == AgentD.EventType.FILE_URL:
-            file_url = event.get("url")
-            description = event.get("description", "")
-            name = event.get("name", "file")
-            filetype = event.get("filetype", "txt")
-
-            update_session_status(
-                status="New file created",
-                update=f"File `{name}` ({filetype}) created: {file_url}",
-                apppend_agent_update=f"File created:\n[Download {name}]({file_url}) : {description}",
-                append_file={
-                    "url": file_url,
-                    "name": name,
-                    "filetype": filetype,
-                    "description": description,
-                },
-            )
-
-        elif eventType == AgentD.EventType.PROGRESS_UPDATE:
-            progress: int = int(event)
-            print(f"======> Progress update: {progress}%")
-            update_session_status(
-                progress=progress,
-            )
-
-        elif eventType == AgentD.EventType.USER_INPUT_REQUEST:
-            user_input_specs: dict = event
-            message = (
-                # f"Agent '{user_input_specs.get('agent_name', 'Unknown')}' is requesting your input:\n"
-                f"{user_input_specs.get('description', '')}\n"
-            )
-            update_session_status(
-                pipeline_status="waiting_for_input",
-                status="Waiting for input",
-                update=message,
-                user_input_specs=user_input_specs,
-            )
-
-    try:
-
-        async def loop(message: str):
-            await AGENTD_INSTANCE.continue_session(
-                message=message,
-                session=new_session,
-                callback=callback,
-            )
-
-            while SESSIONS[request_id]["pipeline_status"] == "waiting_for_input":
-                if SESSIONS[request_id].get("user_input"):
-                    SESSIONS[request_id]["pipeline_status"] = "running"
-                    SESSIONS[request_id]["status"] = "In Progress"
-                    SESSIONS[request_id]["update"] = "Processing your answer"
-                    SESSIONS[request_id]["progress"] = 72
-                    user_input = SESSIONS[request_id]["user_input"]
-                    SESSIONS[request_id]["user_input"] = None
-                    await loop(user_input)
-                    break
-                continue
-
-        await loop(f"{topic}")
-
-        if not SESSIONS[request_id]["pipeline_status"] == "failed":
-            update_session_status(
-                pipeline_status="completed",
-                status="Completed",
-                end_timestamp=timestamp(),
-            )
-    except Exception as e:
-        SESSIONS[request_id].update(
-            {
-                "pipeline_status": "failed",
-                "error": str(e),
-                "update": "An error occurred during processing.",
-                "end_timestamp": timestamp(),
-            }
-        )
-
-    with tempfile.NamedTemporaryFile(
-        mode="w+", delete=True, suffix=".json"
-    ) as temp_file:
-        json.dump(SESSIONS[request_id], temp_file)
-        temp_file.flush()
-        temp_file_path = temp_file.name
-        get_cloud_storage().upload_file(
-            local_path=temp_file_path,
-            remote_path=f"agentd-sessions/{request_id}_{user_id}.json",
-        )
+api = Blueprint("api", __name__)
 
 
-def thread_worker(request_id, topic):
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    loop.run_until_complete(real_pipeline_worker(request_id, topic))
-    loop.close()
+def to_response(result: api_service.ApiResult) -> Response:
+    body, status_code, headers = result
+    response = jsonify(body) if body is not None else Response()
+    response.status_code = status_code
+    response.headers.update(headers)
+    return response
 
 
 @api.route("/run", methods=["POST"])
 def run_pipeline():
-    data = request.get_json()
-    if not data:
-        return error_response("Invalid or missing JSON body.", 400)
-
-    valid, message = validate_run_request(data)
-    if not valid:
-        return error_response(message, 400)
-
-    topic = data["topic"]
-
-    request_id = str(uuid.uuid4())
-
-    SESSIONS[request_id] = {
-        "topic": topic,
-        "pipeline_status": "queued",
-        "status": "In Progress",
-        "start_timestamp": timestamp(),
-        "end_timestamp": None,
-        "update_timestamp": timestamp(),
-        "update": None,
-        "agent_updates": [],
-        "error": None,
-        "progress": 0,
-    }
+    return to_response(
+        api_service.start_pipeline(
+            request.get_json(silent=True), request.headers.get("Idempotency-Key")
+        )
+    )
 
-    threading.Thread(target=thread_worker, args=(request_id, topic)).start()
 
-    response = {
-        "status": "success",
-        "message": f"Pipeline started.",
-        "request_id": request_id,
-    }
-    return jsonify(response), 202
+@api.route("/run/batch", methods=["POST"])
+def run_batch():
+    """
+    Runs pipelines for many topics, answering agent questions with the request's
+    `answer_policy`. Streams results as newline-delimited JSON: a `batch` line with
+    every item's request id, an `item` line per finished item, then a `summary`.
+    """
+    batch, error = api_service.start_batch(request.get_json(silent=True))
+    if error:
+        return to_response(error)
+
+    def generate(cursor):
+        while True:
+            lines, cursor, finished = api_service.read_batch(batch, cursor)
+            yield from lines
+            if finished:
+                break
+            if not batch.wait_for_results(cursor, timeout=SSE_HEARTBEAT_SECONDS):
+                yield NDJSON_KEEP_ALIVE
+
+    return Response(
+        stream_with_context(generate(0)),
+        mimetype=NDJSON_CONTENT_TYPE,
+        headers=NDJSON_HEADERS,
+    )
 
 
 @api.route("/answer/<request_id>", methods=["POST"])
 def provide_solution_choice(request_id):
-    session = SESSIONS.get(request_id)
-    if not session:
-        return error_response("Session not found.", 404)
-
-    if session["pipeline_status"] != "waiting_for_input":
-        return error_response("This session is not expecting input at the moment.", 400)
-
-    data = request.get_json()
-    answer = data.get("answer")
-
-    SESSIONS[request_id]["user_input"] = answer
-
-    return (
-        jsonify(
-            {
-                "status": "success",
-                "message": "Answer is being processed.",
-            }
-        ),
-        200,
+    return to_response(
+        api_service.submit_answer(request_id, request.get_json(silent=True))
     )
 
 
+@api.route("/cancel/<request_id>", methods=["POST"])
+def cancel_pipeline(request_id):
+    """Stops a queued or running pipeline, its session ends as `cancelled`."""
+    return to_response(api_service.cancel_pipeline(request_id))
+
+
 @api.route("/status/<request_id>", methods=["GET"])
 def get_request_status(request_id):
-    session = SESSIONS.get(request_id)
-    if not session:
-        return error_response("Session not found.", 404)
-
-    return (
-        jsonify(
-            {
-                "status": "success",
-                "request_id": request_id,
-                "pipeline_status": session["pipeline_status"],
-                "updated_at": session["update_timestamp"],
-                "progress": session["progress"],
-                "update": session["update"],
-                "agent_updates": session.get("agent_updates", []),
-                "error": session.get("error"),
-                "started_at": session["start_timestamp"],
-                "ended_at": session["end_timestamp"],
-            }
-        ),
-        200,
+    """
+    Returns the session status.
+
+    Query params:
+        since: only return `agent_updates` added after this version.
+        wait: if nothing changed after `since` (or the `If-None-Match` version),
+            hold the request up to this many seconds until something does.
+
+    Responds with 304 when the `If-None-Match` ETag still matches the session version.
+    """
+    query, error = api_service.parse_status_query(
+        request_id, request.args, request.headers.get("If-None-Match")
+    )
+    if error:
+        return to_response(error)
+
+    if query["wait"] > 0:
+        # long-poll: returns as soon as a newer version exists
+        SESSION_STORE.wait_for_change(
+            request_id, query["known_version"], timeout=query["wait"]
+        )
+    return to_response(api_service.get_status(request_id, query))
+
+
+@api.route("/stream/<request_id>", methods=["GET"])
+def stream_request_events(request_id):
+    """
+    Streams pipeline events as Server-Sent Events.
+    Clients resume with the `Last-Event-ID` header (or `?last_event_id=`).
+    """
+    cursor, error = api_service.parse_stream_request(
+        request_id, request.args, request.headers.get("Last-Event-ID")
+    )
+    if error:
+        return to_response(error)
+
+    def generate(cursor):
+        while True:
+            messages, cursor, finished = api_service.read_stream(request_id, cursor)
+            yield from messages
+            if finished:
+                break
+            if not SESSION_STORE.wait_for_change(
+                request_id, cursor, timeout=SSE_HEARTBEAT_SECONDS
+            ):
+                yield SSE_KEEP_ALIVE
+
+    return Response(
+        stream_with_context(generate(cursor)),
+        mimetype="text/event-stream",
+        headers=SSE_HEADERS,
     )
 
 
 @api.route("/api-status", methods=["GET"])
 def get_status():
-    piplines_status = {
-        "queued_pipelines": [],
-        "running_pipelines": [],
-        "completed_pipelines": [],
-        "failed_pipelines": [],
-        "waiting_for_input_pipelines": [],
-    }
-
-    if not SESSIONS:
-        return (
-            jsonify(
-                {
-                    "status": "success",
-                    "data": {key: 0 for key in piplines_status.keys()},
-                }
-            ),
-            200,
-        )
-
-    for request_id, session in SESSIONS.items():
-        if session["pipeline_status"] == "queued":
-            piplines_status["queued_pipelines"].append(request_id)
-        if session["pipeline_status"] == "running":
-            piplines_status["running_pipelines"].append(request_id)
-        elif session["pipeline_status"] == "completed":
-            piplines_status["completed_pipelines"].append(request_id)
-        elif session["pipeline_status"] == "failed":
-            piplines_status["failed_pipelines"].append(request_id)
-        elif session["pipeline_status"] == "waiting_for_input":
-            piplines_status["waiting_for_input_pipelines"].append(request_id)
-
-    # convert to counts (security reasons)
-    for key in piplines_status:
-        piplines_status[key] = len(piplines_status[key])
-
-    response = {
-        "status": "success",
-        "data": piplines_status,
-    }
-    return jsonify(response), 200
+    return to_response(api_service.get_pipeline_counts())
 
 
 @api.route("/", methods=["GET"])
@@ -353,57 +144,17 @@ def api_index():
     return jsonify({"status": "ok"}), 200
 
 
+@api.route("/metrics", methods=["GET"])
+def get_metrics():
+    """Returns the metrics of this process in the Prometheus text format."""
+    return Response(REGISTRY.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+
 @api.route("/health", methods=["GET"])
 def health_check():
-    uptime = os.popen("uptime -p").read().strip()
-    return (
-        jsonify(
-            {
-                "status": "ok",
-                "last_cleanup": CLEAN_UP_INFO["last_cleanup"],
-                "cleanup_count": CLEAN_UP_INFO["cleanup_count"],
-                "active_sessions": len(SESSIONS),
-                "timestamp": datetime.now(timezone.utc).isoformat(),
-                "uptime": uptime,
-            }
-        ),
-        200,
-    )
+    return to_response(api_service.get_health())
 
 
 @api.route("/db-check", methods=["GET"])
 def db_check():
-    try:
-        get_cloud_storage().get_file_url("index.html")
-        return jsonify({"status": "ok", "message": "Database is accessible."}), 200
-    except Exception as e:
-        return error_response(f"Database check failed: {str(e)}", 500)
-
-
-def clear_old_sessions():
-    global SESSIONS
-    now = time.time()
-    CLEAN_UP_INFO["last_cleanup"] = datetime.now(timezone.utc).isoformat()
-    CLEAN_UP_INFO["cleanup_count"] += 1
-    # remove sessions that ended > 10 minutes ago (helps in reducing memory usage)
-    cleared = 0
-    for request_id, session in SESSIONS.items():
-        if session["pipeline_status"] != "running":
-            session_last_update = datetime.fromisoformat(session["update_timestamp"])
-            if session["pipeline_status"] == "waiting_for_input":
-                # if waiting for more than 30 minutes, clear it
-                if (now - session_last_update.timestamp()) > 60 * 30:
-                    del SESSIONS[request_id]
-                    cleared += 1
-            else:
-                # last update more than 10 minutes ago, clear it
-                if (now - session_last_update.timestamp()) > 60 * 10:
-                    del SESSIONS[request_id]
-                    cleared += 1
-
-    print(f"====> {cleared} sessions cleared.")
-    # schedule next
-    threading.Timer(60 * 5, clear_old_sessions).start()
-
-
-clear_old_sessions()
+    return to_response(api_service.check_storage())
@@ -0,0 +1,122 @@
+"""Per-session event log backing the Server-Sent Events stream."""
+
+import asyncio
+import bisect
+import json
+import threading
+from typing import Any, List, Optional, Tuple
+
+# (event_id, event_type, data)
+SessionEvent = Tuple[int, str, Any]
+
+# event type for pipeline lifecycle changes that are not tied to an AgentD callback
+PIPELINE_STATUS_EVENT = "pipeline_status"
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class SessionEventLog:
+    """
+    An append-only, thread-safe list of events for a single pipeline session.
+
+    Event ids start at 1 and increase by one, so a reader can resume from any
+    id it has already seen (`Last-Event-ID`). A restored log keeps the ids of
+    the original events, which may have gaps (events that were never journaled).
+    A transient event (e.g. a chunk of streamed text) is only kept until the
+    next event replaces it, its id is then a gap in the log.
+    Readers block on a condition variable until new events arrive, async readers
+    on a Future that is resolved on their own event loop.
+    """
+
+    def __init__(self):
+        self._events: List[SessionEvent] = []
+        # the event ids, in order, to find where a reader resumes
+        self._event_ids: List[int] = []
+        self._transient: Optional[SessionEvent] = None
+        self._condition = threading.Condition()
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    @property
+    def last_event_id(self) -> int:
+        if self._transient is not None:
+            return self._transient[0]
+        return self._event_ids[-1] if self._event_ids else 0
+
+    def append(
+        self, event_type: str, data: Any, event_id: int = None, transient: bool = False
+    ) -> int:
+        """
+        Appends an event and wakes up all readers. Returns the new event id, the
+        next one unless `event_id` (above the last one) is given. A `transient`
+        event is only returned to readers until the next event is appended.
+        """
+        with self._condition:
+            if event_id is None:
+                event_id = self.last_event_id + 1
+            elif event_id <= self.last_event_id:
+                raise ValueError(
+                    f"Event id {event_id} is not after {self.last_event_id}."
+                )
+            if transient:
+                self._transient = (event_id, event_type, data)
+            else:
+                self._transient = None
+                self._events.append((event_id, event_type, data))
+                self._event_ids.append(event_id)
+            self._condition.notify_all()
+            async_waiters, self._async_waiters = self._async_waiters, []
+
+        for loop, future in async_waiters:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(_wake, future)
+        return event_id
+
+    def wait_for_events(self, last_event_id: int, timeout: float) -> List[SessionEvent]:
+        """
+        Returns the events after `last_event_id`, waiting up to `timeout` seconds for
+        at least one to arrive. Returns an empty list on timeout.
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self.last_event_id > last_event_id, timeout=timeout
+            )
+            return self._events_after_locked(last_event_id)
+
+    async def wait_for_events_async(
+        self, last_event_id: int, timeout: float
+    ) -> List[SessionEvent]:
+        """Like `wait_for_events`, but waits without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        waiter = (loop, future)
+        with self._condition:
+            if self.last_event_id > last_event_id:
+                return self._events_after_locked(last_event_id)
+            self._async_waiters.append(waiter)
+
+        try:
+            await asyncio.wait_for(future, timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._condition:
+                if waiter in self._async_waiters:
+                    self._async_waiters.remove(waiter)
+
+        with self._condition:
+            return self._events_after_locked(last_event_id)
+
+    def _events_after_locked(self, last_event_id: int) -> List[SessionEvent]:
+        events = self._events[bisect.bisect_right(self._event_ids, last_event_id) :]
+        if self._transient is not None and self._transient[0] > last_event_id:
+            events.append(self._transient)
+        return events
+
+
+def format_sse(event: SessionEvent) -> str:
+    """Formats an event as a Server-Sent Events message."""
+    event_id, event_type, data = event
+    return f"id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data)}\n\n"
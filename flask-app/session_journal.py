@@ -0,0 +1,296 @@
+"""Append-only journal of session changes with batched write-behind uploads."""
+
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+from agentd.utils import get_cloud_storage, get_generated_directory
+from agentd.utils.log_utils import fields, get_logger
+
+from .session_events import SessionEvent
+from .session_store import HISTORY_FIELDS, TERMINAL_STATUSES, build_event_data
+
+logger = get_logger(__name__)
+
+JOURNAL_REMOTE_DIR = "agentd-sessions"
+# seconds between two upload batches
+DEFAULT_FLUSH_INTERVAL = float(os.getenv("SESSION_JOURNAL_FLUSH_SECONDS", "10"))
+# a session found in neither the local nor the uploaded journals isn't looked up
+# in cloud storage again for this long
+MISSING_SESSION_TTL_SECONDS = float(
+    os.getenv("SESSION_JOURNAL_MISSING_TTL_SECONDS", "60")
+)
+MAX_MISSING_SESSIONS = 10000
+# a local journal of an unfinished session, left by an earlier process, that
+# hasn't changed for this long is uploaded and removed like a finished one
+# (longer than a pipeline waits for user input)
+STALE_JOURNAL_SECONDS = 60 * 60
+
+
+def replay(records: List[Dict]) -> Tuple[Dict, List[SessionEvent]]:
+    """
+    Rebuilds a session and its events from its journal records.
+
+    Returns:
+        tuple: (session, events) in the shapes returned by the session store.
+    """
+    session = {key: [] for key in HISTORY_FIELDS}
+    events: List[SessionEvent] = []
+    for record in records:
+        if record["v"] <= session.get("version", -1):
+            # uploaded twice, e.g. by two processes sharing the journal directory
+            continue
+        changes = record.get("c", {})
+        session.update(changes)
+        if record.get("u"):
+            session["agent_updates"].append(record["u"])
+        if record.get("f"):
+            session["agent_files"].append(record["f"])
+        session["version"] = record["v"]
+        if record["v"] > 0:
+            events.append(
+                (
+                    record["v"],
+                    record["t"],
+                    build_event_data(changes, record.get("u"), record.get("f")),
+                )
+            )
+
+    if session.get("pipeline_status") not in TERMINAL_STATUSES:
+        # the journal ends mid-run, the process running it is gone
+        session["pipeline_status"] = "failed"
+        session["error"] = "The pipeline was interrupted."
+    return session, events
+
+
+class SessionJournal:
+    """
+    Records every session change as one compact JSON line in a local per-session
+    file (`<request_id>.jsonl`), so nothing is lost if the process dies.
+
+    A background thread uploads the bytes appended since the previous upload as
+    a new segment, `agentd-sessions/<request_id>/<offset>.jsonl`, every
+    `flush_interval` seconds. Pipelines never wait for cloud storage.
+    Once a finished session is fully uploaded its local file is removed
+    (unless `keep_local`), reads then fall back to the uploaded segments.
+
+    The uploaded offset is kept next to the journal (`<request_id>.offset`), so
+    journals left by an earlier process are uploaded on start without repeating
+    segments. Ids found nowhere are remembered for `MISSING_SESSION_TTL_SECONDS`,
+    so unknown ids don't list cloud storage on every request.
+    """
+
+    def __init__(
+        self,
+        directory: str = None,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        keep_local: bool = False,
+    ):
+        if not directory:
+            directory = os.path.join(get_generated_directory(), "session-journal")
+        os.makedirs(directory, exist_ok=True)
+
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.keep_local = keep_local
+        self._lock = threading.Lock()
+        self._dirty: Set[str] = set()
+        self._closed: Set[str] = set()
+        self._uploaded_offsets: Dict[str, int] = {}
+        # request_id -> when it may be looked up again, oldest first
+        self._missing: "OrderedDict[str, float]" = OrderedDict()
+        self._wakeup = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        self._recover()
+
+    def _path(self, request_id: str) -> str:
+        return os.path.join(self.directory, f"{request_id}.jsonl")
+
+    def _offset_path(self, request_id: str) -> str:
+        return os.path.join(self.directory, f"{request_id}.offset")
+
+    def _recover(self):
+        """Schedules the upload of the journals an earlier process didn't finish."""
+        now = time.time()
+        for path in glob.glob(os.path.join(self.directory, "*.jsonl")):
+            request_id = os.path.basename(path)[: -len(".jsonl")]
+            # journals that are still written to may belong to another worker
+            stale = now - os.path.getmtime(path) > STALE_JOURNAL_SECONDS
+            if not stale and os.path.getsize(path) <= self._uploaded_offset(request_id):
+                continue
+            self._dirty.add(request_id)
+            if stale:
+                self._closed.add(request_id)
+        if self._dirty:
+            logger.info(
+                "Uploading journals of an earlier process",
+                extra=fields(sessions=len(self._dirty)),
+            )
+            self._start_flusher_locked()
+
+    def append(
+        self,
+        request_id: str,
+        version: int,
+        event_type: str,
+        changes: Dict,
+        agent_update: Optional[str] = None,
+        file: Optional[Dict] = None,
+    ):
+        """Appends one session change to the session's journal."""
+        record = {"v": version, "t": event_type, "ts": time.time(), "c": changes}
+        if agent_update:
+            record["u"] = agent_update
+        if file:
+            record["f"] = file
+        line = json.dumps(record, separators=(",", ":"), default=str) + "\n"
+
+        with self._lock:
+            with open(self._path(request_id), "a", encoding="utf-8") as journal_file:
+                journal_file.write(line)
+            self._dirty.add(request_id)
+            self._start_flusher_locked()
+
+    def close_session(self, request_id: str):
+        """Marks a session as finished and uploads its remaining records soon."""
+        with self._lock:
+            self._closed.add(request_id)
+            self._dirty.add(request_id)
+            self._start_flusher_locked()
+        self._wakeup.set()
+
+    def _uploaded_offset(self, request_id: str) -> int:
+        offset = self._uploaded_offsets.get(request_id)
+        if offset is not None:
+            return offset
+        try:
+            with open(self._offset_path(request_id), encoding="utf-8") as offset_file:
+                return int(offset_file.read())
+        except (OSError, ValueError):
+            return 0
+
+    def _save_uploaded_offset(self, request_id: str, offset: int):
+        self._uploaded_offsets[request_id] = offset
+        temp_path = self._offset_path(request_id) + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as offset_file:
+            offset_file.write(str(offset))
+        os.replace(temp_path, self._offset_path(request_id))
+
+    def _remove(self, request_id: str):
+        self._uploaded_offsets.pop(request_id, None)
+        for path in (self._path(request_id), self._offset_path(request_id)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def load(self, request_id: str) -> Optional[Tuple[Dict, List[SessionEvent]]]:
+        """
+        Rebuilds a session from the local journal or, if the local file is gone,
+        from its uploaded segments.
+
+        Returns:
+            tuple: (session, events), or None if the session has no journal.
+        """
+        with self._lock:
+            path = self._path(request_id)
+            if os.path.exists(path):
+                with open(path, encoding="utf-8") as journal_file:
+                    lines = journal_file.readlines()
+            elif self._missing.get(request_id, 0) > time.monotonic():
+                return None
+            else:
+                lines = None
+
+        if lines is None:
+            lines = self._download(request_id)
+        records = [json.loads(line) for line in lines if line.strip()]
+        if not records:
+            with self._lock:
+                self._missing.pop(request_id, None)
+                self._missing[request_id] = (
+                    time.monotonic() + MISSING_SESSION_TTL_SECONDS
+                )
+                while len(self._missing) > MAX_MISSING_SESSIONS:
+                    self._missing.popitem(last=False)
+            return None
+        return replay(records)
+
+    def _download(self, request_id: str) -> List[str]:
+        storage = get_cloud_storage()
+        segments = sorted(
+            storage.list_files(prefix=f"{JOURNAL_REMOTE_DIR}/{request_id}/")
+        )
+        lines = []
+        for segment in segments:
+            with tempfile.NamedTemporaryFile(suffix=".jsonl") as temp_file:
+                storage.download_file(remote_path=segment, local_path=temp_file.name)
+                with open(temp_file.name, encoding="utf-8") as segment_file:
+                    lines.extend(segment_file.readlines())
+        return lines
+
+    def _start_flusher_locked(self):
+        if self._flusher is None:
+            self._flusher = threading.Thread(
+                target=self._flush_forever, name="session-journal-flusher", daemon=True
+            )
+            self._flusher.start()
+
+    def _flush_forever(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Journal flush failed")
+
+    def flush(self):
+        """Uploads the records appended since the previous flush, one segment per session."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+
+        for request_id in dirty:
+            try:
+                self._flush_session(request_id)
+            except Exception as e:
+                logger.warning(
+                    "Journal upload failed, will retry",
+                    extra=fields(request_id=request_id, error=str(e)),
+                )
+                with self._lock:
+                    self._dirty.add(request_id)
+
+    def _flush_session(self, request_id: str):
+        path = self._path(request_id)
+        offset = self._uploaded_offset(request_id)
+        with self._lock:
+            if not os.path.exists(path):
+                return
+            with open(path, "rb") as journal_file:
+                journal_file.seek(offset)
+                segment = journal_file.read()
+
+        if segment:
+            with tempfile.NamedTemporaryFile(suffix=".jsonl") as temp_file:
+                temp_file.write(segment)
+                temp_file.flush()
+                # offset-named segments sort in write order and make retries idempotent
+                get_cloud_storage().upload_file(
+                    local_path=temp_file.name,
+                    remote_path=f"{JOURNAL_REMOTE_DIR}/{request_id}/{offset:012d}.jsonl",
+                )
+            offset += len(segment)
+            self._save_uploaded_offset(request_id, offset)
+
+        with self._lock:
+            finished = request_id in self._closed and request_id not in self._dirty
+            if finished and os.path.getsize(path) == offset:
+                self._closed.discard(request_id)
+                if self.keep_local:
+                    self._uploaded_offsets.pop(request_id, None)
+                else:
+                    self._remove(request_id)
@@ -0,0 +1,1126 @@
+"""Session stores shared by the API routes and the pipeline workers."""
+
+import asyncio
+import heapq
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+from agentd.utils import get_generated_directory
+from agentd.utils.log_utils import get_logger
+
+from .session_events import SessionEvent, SessionEventLog
+
+logger = get_logger(__name__)
+
+PIPELINE_STATUSES = (
+    "queued",
+    "running",
+    "waiting_for_input",
+    "completed",
+    "failed",
+    "cancelled",
+)
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
+# how long a session is kept after its last update, per pipeline status
+# (queued and running sessions are never expired)
+SESSION_TTL_SECONDS = {
+    "completed": 60 * 10,
+    "failed": 60 * 10,
+    "cancelled": 60 * 10,
+    # longer than the pipeline's own input timeout, so that it can record the timeout
+    "waiting_for_input": 60 * 35,
+}
+
+# session fields exposed to clients, mapped to their names in API responses
+PUBLIC_SESSION_FIELDS = {
+    "pipeline_status": "pipeline_status",
+    "update_timestamp": "updated_at",
+    "progress": "progress",
+    "eta": "eta",
+    "update": "update",
+    "error": "error",
+    "start_timestamp": "started_at",
+    "end_timestamp": "ended_at",
+    "user_input_specs": "user_input_specs",
+    "token_usage": "token_usage",
+    "text_delta": "text_delta",
+}
+
+# fields rebuilt from the events instead of being stored with the session
+HISTORY_FIELDS = ("agent_updates", "agent_files")
+
+
+def build_event_data(
+    changes: Dict, agent_update: Optional[str] = None, file: Optional[Dict] = None
+) -> Dict:
+    """Returns the client facing payload of an event for a set of session changes."""
+    event_data = {
+        PUBLIC_SESSION_FIELDS[key]: value
+        for key, value in changes.items()
+        if key in PUBLIC_SESSION_FIELDS
+    }
+    if agent_update:
+        event_data["agent_update"] = agent_update
+    if file:
+        event_data["file"] = file
+    return event_data
+
+
+class SessionStore(ABC):
+    """
+    Abstract base class for pipeline session stores.
+
+    A session is a dict of fields (`pipeline_status`, `update`, `progress`, ...)
+    plus its history (`agent_updates`, `agent_files`). Every change is recorded as
+    an event, and the id of the latest event is the session `version`.
+    """
+
+    # True if other server processes see the same sessions, e.g. their answers
+    shared = False
+
+    @abstractmethod
+    def create(self, request_id: str, session: Dict) -> None:
+        """
+        Create a new session at version 0.
+
+        Args:
+            request_id: The id of the pipeline request.
+            session: The initial session fields.
+        """
+
+    @abstractmethod
+    def restore(
+        self, request_id: str, session: Dict, events: List[SessionEvent]
+    ) -> None:
+        """
+        Put back a session rebuilt elsewhere (e.g. from its journal) with its events.
+        Events keep their ids and the version is the id of the last one. Does
+        nothing if the session already exists.
+
+        Args:
+            request_id: The id of the pipeline request.
+            session: The session fields and history.
+            events: The session events, in version order.
+        """
+
+    @abstractmethod
+    def get(self, request_id: str, include_history: bool = True) -> Optional[Dict]:
+        """
+        Get a snapshot of a session.
+
+        Args:
+            request_id: The id of the pipeline request.
+            include_history: If False, `agent_updates` and `agent_files` are omitted.
+        Returns:
+            A copy of the session, or None if it does not exist.
+        """
+
+    @abstractmethod
+    def update(
+        self,
+        request_id: str,
+        event_type: str,
+        changes: Dict,
+        agent_update: Optional[str] = None,
+        file: Optional[Dict] = None,
+    ) -> int:
+        """
+        Apply changes to a session and record them as one event.
+
+        Args:
+            request_id: The id of the pipeline request.
+            event_type: The type of the recorded event.
+            changes: Session fields to set.
+            agent_update: Optional message appended to `agent_updates`.
+            file: Optional file appended to `agent_files`.
+        Returns:
+            The new session version.
+        """
+
+    @abstractmethod
+    def publish(self, request_id: str, event_type: str, changes: Dict) -> int:
+        """
+        Send a short-lived change (e.g. a chunk of streamed text) to the session's
+        subscribers as one event. The event isn't kept in the session's history,
+        the next change replaces it, and its version is skipped by later events.
+
+        Args:
+            request_id: The id of the pipeline request.
+            event_type: The type of the event.
+            changes: Session fields of the event.
+        Returns:
+            The version of the event.
+        """
+
+    @abstractmethod
+    def get_events(self, request_id: str, after_version: int) -> List[SessionEvent]:
+        """
+        Get the events recorded after a version.
+
+        Args:
+            request_id: The id of the pipeline request.
+            after_version: Only events with a higher version are returned.
+        Returns:
+            List of (version, event_type, data) tuples.
+        """
+
+    @abstractmethod
+    def wait_for_change(self, request_id: str, version: int, timeout: float) -> bool:
+        """
+        Block until the session is newer than `version`.
+
+        Args:
+            request_id: The id of the pipeline request.
+            version: The version the caller already has.
+            timeout: Maximum seconds to wait.
+        Returns:
+            True if a newer version exists.
+        """
+
+    @abstractmethod
+    async def wait_for_change_async(
+        self, request_id: str, version: int, timeout: float
+    ) -> bool:
+        """
+        Like `wait_for_change`, but waits without blocking the event loop.
+
+        Args:
+            request_id: The id of the pipeline request.
+            version: The version the caller already has.
+            timeout: Maximum seconds to wait.
+        Returns:
+            True if a newer version exists.
+        """
+
+    @abstractmethod
+    def submit_input(self, request_id: str, answer: str) -> bool:
+        """
+        Store the user's answer for a session that is waiting for input.
+
+        Args:
+            request_id: The id of the pipeline request.
+            answer: The user's answer.
+        Returns:
+            False if the session is not waiting or already has a pending answer.
+        """
+
+    @abstractmethod
+    def pop_input(self, request_id: str) -> Optional[str]:
+        """
+        Take the pending answer of a session, if any.
+
+        Args:
+            request_id: The id of the pipeline request.
+        Returns:
+            The answer, or None.
+        """
+
+    @abstractmethod
+    def claim_request_keys(self, request_id: str, keys: Dict[str, float]) -> str:
+        """
+        Atomically assign deduplication keys (e.g. an `Idempotency-Key`) to a new
+        request, unless one of them still belongs to an earlier request.
+
+        Args:
+            request_id: The id of the new pipeline request.
+            keys: Dict of key to the number of seconds the key is kept.
+        Returns:
+            `request_id` if the keys were assigned to it, else the earlier request id.
+        """
+
+    @abstractmethod
+    def find_request_key(self, key: str) -> Optional[str]:
+        """
+        Look up the request a deduplication key belongs to.
+
+        Args:
+            key: The deduplication key.
+        Returns:
+            The request id, or None if the key is unknown or expired.
+        """
+
+    @abstractmethod
+    def delete(self, request_id: str) -> None:
+        """
+        Delete a session and its events.
+
+        Args:
+            request_id: The id of the pipeline request.
+        """
+
+    @abstractmethod
+    def expire(self, now: Optional[float] = None) -> int:
+        """
+        Delete the sessions whose TTL (see `SESSION_TTL_SECONDS`) has passed, and
+        the expired request keys.
+
+        Args:
+            now: The current unix time, defaults to `time.time()`.
+        Returns:
+            Number of deleted sessions.
+        """
+
+    @abstractmethod
+    def count_by_status(self) -> Dict[str, int]:
+        """
+        Count sessions per pipeline status.
+
+        Returns:
+            Dict of pipeline_status to number of sessions.
+        """
+
+    @abstractmethod
+    def count(self) -> int:
+        """
+        Returns:
+            Total number of sessions.
+        """
+
+
+class StatusCounters:
+    """
+    Number of sessions per pipeline status. Counts only change through
+    `transition`, which stores call on every create, status change and removal.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {status: 0 for status in PIPELINE_STATUSES}
+
+    def transition(self, from_status: Optional[str], to_status: Optional[str]):
+        """Moves one session between statuses, None for a created or removed session."""
+        if from_status == to_status:
+            return
+        with self._lock:
+            if from_status is not None:
+                self._counts[from_status] -= 1
+            if to_status is not None:
+                self._counts[to_status] = self._counts.get(to_status, 0) + 1
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
+
+    def total(self) -> int:
+        with self._lock:
+            return sum(self._counts.values())
+
+
+class _SessionEntry:
+    """
+    A session held by the in-memory store.
+
+    `fields` is copy-on-write: updates build a new dict and swap it in under the
+    entry lock, so readers can use the reference they got without copying or
+    locking. The history lists are append-only for the same reason.
+    """
+
+    __slots__ = (
+        "lock",
+        "fields",
+        "agent_updates",
+        "agent_files",
+        "event_log",
+        "pending_input",
+        "expires_at",
+        "removed",
+    )
+
+    def __init__(self, fields: Dict):
+        self.lock = threading.Lock()
+        self.fields = fields
+        self.agent_updates: List[str] = []
+        self.agent_files: List[Dict] = []
+        self.event_log = SessionEventLog()
+        self.pending_input: Optional[str] = None
+        self.expires_at: Optional[float] = None
+        # set once the entry left the store, so late updates don't touch the counters
+        self.removed = False
+
+
+class InMemorySessionStore(SessionStore):
+    """
+    Keeps sessions in process memory. Only usable with a single server process.
+
+    The registry lock is only held to add or remove sessions, every session has
+    its own lock for updates. Expiry deadlines are kept in a min-heap, so
+    `expire()` only touches the sessions that are due. Per status counts are kept
+    up to date on every change, so counting never scans the sessions.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, _SessionEntry] = {}
+        self._counters = StatusCounters()
+        # (expires_at, request_id), entries whose deadline changed since are skipped
+        self._expiry_heap: List[Tuple[float, str]] = []
+        # deduplication key -> (request_id, expires_at), and their expiry heap
+        self._request_keys: Dict[str, Tuple[str, float]] = {}
+        self._request_key_heap: List[Tuple[float, str]] = []
+
+    def create(self, request_id: str, session: Dict) -> None:
+        fields = {
+            key: value for key, value in session.items() if key not in HISTORY_FIELDS
+        }
+        fields["version"] = 0
+        entry = _SessionEntry(fields)
+        with self._lock:
+            self._add_locked(request_id, entry)
+
+    def restore(
+        self, request_id: str, session: Dict, events: List[SessionEvent]
+    ) -> None:
+        entry = _SessionEntry(
+            {key: value for key, value in session.items() if key not in HISTORY_FIELDS}
+        )
+        entry.agent_updates = list(session.get("agent_updates", []))
+        entry.agent_files = list(session.get("agent_files", []))
+        for event_id, event_type, event_data in events:
+            # original ids, so that clients' Last-Event-ID and ?since stay valid
+            entry.event_log.append(event_type, event_data, event_id=event_id)
+        entry.fields["version"] = entry.event_log.last_event_id
+        with self._lock:
+            if request_id in self._sessions:
+                return
+            self._add_locked(request_id, entry)
+
+    def _add_locked(self, request_id: str, entry: _SessionEntry):
+        self._remove_locked(request_id)
+        self._sessions[request_id] = entry
+        self._counters.transition(None, entry.fields["pipeline_status"])
+        self._schedule_expiry_locked(request_id, entry)
+
+    def _remove_locked(self, request_id: str):
+        entry = self._sessions.pop(request_id, None)
+        if entry is None:
+            return
+        with entry.lock:
+            entry.removed = True
+            self._counters.transition(entry.fields["pipeline_status"], None)
+
+    def get(self, request_id: str, include_history: bool = True) -> Optional[Dict]:
+        entry = self._sessions.get(request_id)
+        if entry is None:
+            return None
+        # lists are append-only, so their length is enough for a consistent snapshot
+        with entry.lock:
+            fields = entry.fields
+            num_updates = len(entry.agent_updates)
+            num_files = len(entry.agent_files)
+
+        snapshot = dict(fields)
+        if include_history:
+            snapshot["agent_updates"] = entry.agent_updates[:num_updates]
+            snapshot["agent_files"] = entry.agent_files[:num_files]
+        return snapshot
+
+    def update(
+        self,
+        request_id: str,
+        event_type: str,
+        changes: Dict,
+        agent_update: Optional[str] = None,
+        file: Optional[Dict] = None,
+    ) -> int:
+        entry = self._sessions[request_id]
+        event_data = build_event_data(changes, agent_update, file)
+        with entry.lock:
+            previous_status = entry.fields["pipeline_status"]
+            fields = dict(entry.fields, **changes)
+            if agent_update:
+                entry.agent_updates.append(agent_update)
+            if file:
+                entry.agent_files.append(file)
+            fields["version"] = entry.event_log.append(event_type, event_data)
+            entry.fields = fields
+            if not entry.removed:
+                self._counters.transition(previous_status, fields["pipeline_status"])
+            status_changed = "pipeline_status" in changes
+
+        if status_changed or entry.expires_at is not None:
+            with self._lock:
+                self._schedule_expiry_locked(request_id, entry)
+        return fields["version"]
+
+    def publish(self, request_id: str, event_type: str, changes: Dict) -> int:
+        entry = self._sessions[request_id]
+        event_data = build_event_data(changes)
+        with entry.lock:
+            fields = dict(entry.fields, **changes)
+            fields["version"] = entry.event_log.append(
+                event_type, event_data, transient=True
+            )
+            entry.fields = fields
+        return fields["version"]
+
+    def get_events(self, request_id: str, after_version: int) -> List[SessionEvent]:
+        entry = self._sessions.get(request_id)
+        if entry is None:
+            return []
+        return entry.event_log.wait_for_events(after_version, timeout=0)
+
+    def wait_for_change(self, request_id: str, version: int, timeout: float) -> bool:
+        entry = self._sessions.get(request_id)
+        if entry is None:
+            return False
+        return bool(entry.event_log.wait_for_events(version, timeout=timeout))
+
+    async def wait_for_change_async(
+        self, request_id: str, version: int, timeout: float
+    ) -> bool:
+        entry = self._sessions.get(request_id)
+        if entry is None:
+            return False
+        return bool(await entry.event_log.wait_for_events_async(version, timeout))
+
+    def submit_input(self, request_id: str, answer: str) -> bool:
+        entry = self._sessions.get(request_id)
+        if entry is None:
+            return False
+        with entry.lock:
+            if entry.fields["pipeline_status"] != "waiting_for_input":
+                return False
+            if entry.pending_input is not None:
+                return False
+            entry.pending_input = answer
+            return True
+
+    def pop_input(self, request_id: str) -> Optional[str]:
+        entry = self._sessions.get(request_id)
+        if entry is None:
+            return None
+        with entry.lock:
+            answer, entry.pending_input = entry.pending_input, None
+            return answer
+
+    def claim_request_keys(self, request_id: str, keys: Dict[str, float]) -> str:
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                owner = self._request_keys.get(key)
+                if owner is not None and owner[1] > now:
+                    return owner[0]
+            for key, ttl in keys.items():
+                self._request_keys[key] = (request_id, now + ttl)
+                heapq.heappush(self._request_key_heap, (now + ttl, key))
+        return request_id
+
+    def find_request_key(self, key: str) -> Optional[str]:
+        owner = self._request_keys.get(key)
+        if owner is None or owner[1] <= time.time():
+            return None
+        return owner[0]
+
+    def delete(self, request_id: str) -> None:
+        with self._lock:
+            self._remove_locked(request_id)
+
+    def expire(self, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        expired = 0
+        with self._lock:
+            while self._request_key_heap and self._request_key_heap[0][0] <= now:
+                expires_at, key = heapq.heappop(self._request_key_heap)
+                owner = self._request_keys.get(key)
+                if owner is not None and owner[1] == expires_at:
+                    del self._request_keys[key]
+            while self._expiry_heap and self._expiry_heap[0][0] <= now:
+                expires_at, request_id = heapq.heappop(self._expiry_heap)
+                entry = self._sessions.get(request_id)
+                if entry is None or entry.expires_at != expires_at:
+                    # stale heap entry, the session was deleted or updated since
+                    continue
+                self._remove_locked(request_id)
+                expired += 1
+        return expired
+
+    def _schedule_expiry_locked(self, request_id: str, entry: _SessionEntry):
+        ttl = SESSION_TTL_SECONDS.get(entry.fields["pipeline_status"])
+        if ttl is None:
+            entry.expires_at = None
+            return
+        entry.expires_at = time.time() + ttl
+        heapq.heappush(self._expiry_heap, (entry.expires_at, request_id))
+
+    def count_by_status(self) -> Dict[str, int]:
+        return self._counters.snapshot()
+
+    def count(self) -> int:
+        return self._counters.total()
+
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    request_id TEXT PRIMARY KEY,
+    pipeline_status TEXT NOT NULL,
+    update_timestamp TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL,
+    pending_input TEXT,
+    expires_at REAL
+);
+CREATE INDEX IF NOT EXISTS sessions_pipeline_status ON sessions (pipeline_status);
+CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)
+    WHERE expires_at IS NOT NULL;
+CREATE TABLE IF NOT EXISTS session_events (
+    request_id TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    event_type TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (request_id, version)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS status_counts (
+    pipeline_status TEXT PRIMARY KEY,
+    count INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS request_keys (
+    key TEXT PRIMARY KEY,
+    request_id TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS request_keys_expires_at ON request_keys (expires_at);
+"""
+
+
+def _resolve(future: asyncio.Future, version: Optional[int]):
+    if not future.done():
+        future.set_result(version)
+
+
+class _VersionPoller:
+    """
+    Waits for version changes of the SQLite store's sessions for async readers.
+
+    Instead of every reader polling on its own, one thread reads the versions of
+    all sessions being waited on in a single query every `interval` seconds and
+    wakes the readers whose session changed (or is gone) on their event loop.
+
+    Args:
+        read_versions: Returns the current version of each of the given sessions
+            that still exists.
+        interval: Seconds between two polls.
+    """
+
+    # sqlite's default limit of query parameters is 999
+    MAX_QUERY_IDS = 500
+
+    def __init__(
+        self,
+        read_versions: Callable[[List[str]], Dict[str, int]],
+        interval: float,
+    ):
+        self._read_versions = read_versions
+        self.interval = interval
+        self._lock = threading.Lock()
+        # request_id -> (version, loop, future) of every reader
+        self._waiters: Dict[
+            str, List[Tuple[int, asyncio.AbstractEventLoop, asyncio.Future]]
+        ] = {}
+        self._has_waiters = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    async def wait(
+        self, request_id: str, version: int, timeout: float
+    ) -> Optional[int]:
+        """
+        Waits until the session is newer than `version`. Returns the new version,
+        or None if the session is gone or the timeout passed.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        waiter = (version, loop, future)
+        with self._lock:
+            self._waiters.setdefault(request_id, []).append(waiter)
+            self._has_waiters.set()
+            # the session may have changed before the reader got here
+            self._wakeup.set()
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._poll_forever,
+                    name="session-version-poller",
+                    daemon=True,
+                )
+                self._thread.start()
+
+        try:
+            return await asyncio.wait_for(future, timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            with self._lock:
+                waiters = self._waiters.get(request_id, [])
+                if waiter in waiters:
+                    waiters.remove(waiter)
+                if not waiters:
+                    self._waiters.pop(request_id, None)
+
+    def poll_now(self):
+        """Polls right away, e.g. after a change made by this process."""
+        self._wakeup.set()
+
+    def _poll_forever(self):
+        while True:
+            # sleeps until a reader waits, then polls every interval
+            self._has_waiters.wait()
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self._poll()
+            except Exception:
+                logger.exception("Session version poll failed")
+
+    def _poll(self):
+        with self._lock:
+            request_ids = list(self._waiters)
+            if not request_ids:
+                self._has_waiters.clear()
+                return
+
+        versions = {}
+        for start in range(0, len(request_ids), self.MAX_QUERY_IDS):
+            versions.update(
+                self._read_versions(request_ids[start : start + self.MAX_QUERY_IDS])
+            )
+
+        with self._lock:
+            for request_id, waiters in self._waiters.items():
+                current_version = versions.get(request_id)
+                for version, loop, future in waiters:
+                    if current_version is None or current_version > version:
+                        if not loop.is_closed():
+                            loop.call_soon_threadsafe(_resolve, future, current_version)
+
+
+def _expires_at(pipeline_status: str) -> Optional[float]:
+    ttl = SESSION_TTL_SECONDS.get(pipeline_status)
+    return None if ttl is None else time.time() + ttl
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Keeps sessions in a SQLite database in WAL mode, so that every server process
+    (e.g. gunicorn workers) on the machine sees the same sessions.
+
+    Other processes cannot be notified directly, so `wait_for_change` polls the
+    session version every `poll_interval` seconds, async readers share a single
+    poller thread (`_VersionPoller`). Expiry deadlines are indexed,
+    so `expire()` only reads the sessions that are due. Per status counts live in
+    `status_counts` and change in the same transaction as the sessions.
+
+    Published (transient) events are never written, they are kept in memory until
+    the next update and are only seen by subscribers of the publishing process.
+    """
+
+    shared = True
+
+    def __init__(self, db_path: str = None, poll_interval: float = 0.5):
+        if not db_path:
+            db_path = os.path.join(get_generated_directory(), "sessions.db")
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        # request_id -> the latest event published by this process
+        self._transient: Dict[str, SessionEvent] = {}
+        self._transient_lock = threading.Lock()
+        self._poller = _VersionPoller(self._versions, poll_interval)
+        self._connection().executescript(_SQLITE_SCHEMA)
+        with self._transaction() as connection:
+            if not connection.execute("SELECT 1 FROM status_counts LIMIT 1").fetchone():
+                # first start with counters, count the sessions that already exist
+                connection.execute(
+                    "INSERT INTO status_counts (pipeline_status, count)"
+                    " SELECT pipeline_status, COUNT(*) FROM sessions"
+                    " GROUP BY pipeline_status"
+                )
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite connections can't be shared between threads, keep one per thread
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def _transaction(self, write: bool = True):
+        connection = self._connection()
+        # writers take the write lock up front so that version bumps can't interleave,
+        # readers get a consistent snapshot of the session and its events
+        connection.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def _transition(
+        self,
+        connection: sqlite3.Connection,
+        from_status: Optional[str],
+        to_status: Optional[str],
+        count: int = 1,
+    ):
+        """
+        Moves `count` sessions between statuses in `status_counts`, None for created
+        or removed sessions. Must run in the transaction that changes the sessions.
+        """
+        if from_status == to_status:
+            return
+        if from_status is not None:
+            connection.execute(
+                "UPDATE status_counts SET count = count - ? WHERE pipeline_status = ?",
+                (count, from_status),
+            )
+        if to_status is not None:
+            connection.execute(
+                "INSERT INTO status_counts (pipeline_status, count) VALUES (?, ?)"
+                " ON CONFLICT (pipeline_status) DO UPDATE SET count = count + ?",
+                (to_status, count, count),
+            )
+
+    def create(self, request_id: str, session: Dict) -> None:
+        data = {
+            key: value for key, value in session.items() if key not in HISTORY_FIELDS
+        }
+        data.pop("version", None)
+        with self._transaction() as connection:
+            connection.execute(
+                "INSERT INTO sessions"
+                " (request_id, pipeline_status, update_timestamp, data, expires_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (
+                    request_id,
+                    session["pipeline_status"],
+                    session["update_timestamp"],
+                    json.dumps(data),
+                    _expires_at(session["pipeline_status"]),
+                ),
+            )
+            self._transition(connection, None, session["pipeline_status"])
+
+    def restore(
+        self, request_id: str, session: Dict, events: List[SessionEvent]
+    ) -> None:
+        data = {
+            key: value for key, value in session.items() if key not in HISTORY_FIELDS
+        }
+        data.pop("version", None)
+        # the version is the id of the latest event, like after an update
+        version = events[-1][0] if events else 0
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "INSERT OR IGNORE INTO sessions (request_id, pipeline_status,"
+                " update_timestamp, version, data, expires_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    request_id,
+                    data["pipeline_status"],
+                    data["update_timestamp"],
+                    version,
+                    json.dumps(data),
+                    _expires_at(data["pipeline_status"]),
+                ),
+            )
+            if cursor.rowcount == 0:
+                return
+            self._transition(connection, None, data["pipeline_status"])
+            connection.executemany(
+                "INSERT INTO session_events (request_id, version, event_type, data)"
+                " VALUES (?, ?, ?, ?)",
+                [
+                    (request_id, event_version, event_type, json.dumps(event_data))
+                    for event_version, event_type, event_data in events
+                ],
+            )
+
+    def get(self, request_id: str, include_history: bool = True) -> Optional[Dict]:
+        with self._transaction(write=False) as connection:
+            row = connection.execute(
+                "SELECT data, version FROM sessions WHERE request_id = ?",
+                (request_id,),
+            ).fetchone()
+            if row is None:
+                return None
+
+            session = json.loads(row[0])
+            session["version"] = row[1]
+            if include_history:
+                session["agent_updates"] = []
+                session["agent_files"] = []
+                for _, _, event_data in self.get_events(request_id, 0):
+                    if "agent_update" in event_data:
+                        session["agent_updates"].append(event_data["agent_update"])
+                    if "file" in event_data:
+                        session["agent_files"].append(event_data["file"])
+        return session
+
+    def update(
+        self,
+        request_id: str,
+        event_type: str,
+        changes: Dict,
+        agent_update: Optional[str] = None,
+        file: Optional[Dict] = None,
+    ) -> int:
+        with self._transaction() as connection:
+            row = connection.execute(
+                "SELECT data, version FROM sessions WHERE request_id = ?",
+                (request_id,),
+            ).fetchone()
+            if row is None:
+                raise KeyError(request_id)
+
+            data = json.loads(row[0])
+            previous_status = data["pipeline_status"]
+            data.update(changes)
+            with self._transient_lock:
+                # replaces the event published last, after its version
+                transient = self._transient.pop(request_id, None)
+            version = max(row[1], transient[0] if transient else 0) + 1
+            connection.execute(
+                "UPDATE sessions SET pipeline_status = ?, update_timestamp = ?,"
+                " version = ?, data = ?, expires_at = ? WHERE request_id = ?",
+                (
+                    data["pipeline_status"],
+                    data["update_timestamp"],
+                    version,
+                    json.dumps(data),
+                    _expires_at(data["pipeline_status"]),
+                    request_id,
+                ),
+            )
+            self._transition(connection, previous_status, data["pipeline_status"])
+            connection.execute(
+                "INSERT INTO session_events (request_id, version, event_type, data)"
+                " VALUES (?, ?, ?, ?)",
+                (
+                    request_id,
+                    version,
+                    event_type,
+                    json.dumps(build_event_data(changes, agent_update, file)),
+                ),
+            )
+        self._poller.poll_now()
+        return version
+
+    def publish(self, request_id: str, event_type: str, changes: Dict) -> int:
+        # a write per chunk of streamed text would keep the write lock busy
+        stored_version = self._stored_version(request_id)
+        if stored_version is None:
+            raise KeyError(request_id)
+        with self._transient_lock:
+            transient = self._transient.get(request_id)
+            version = max(stored_version, transient[0] if transient else 0) + 1
+            self._transient[request_id] = (
+                version,
+                event_type,
+                build_event_data(changes),
+            )
+        self._poller.poll_now()
+        return version
+
+    def get_events(self, request_id: str, after_version: int) -> List[SessionEvent]:
+        rows = self._connection().execute(
+            "SELECT version, event_type, data FROM session_events"
+            " WHERE request_id = ? AND version > ? ORDER BY version",
+            (request_id, after_version),
+        )
+        events = [
+            (version, event_type, json.loads(data))
+            for version, event_type, data in rows
+        ]
+        transient = self._transient.get(request_id)
+        # unless another process recorded an event after it
+        if transient and transient[0] > (events[-1][0] if events else after_version):
+            events.append(transient)
+        return events
+
+    def _stored_version(self, request_id: str) -> Optional[int]:
+        row = (
+            self._connection()
+            .execute("SELECT version FROM sessions WHERE request_id = ?", (request_id,))
+            .fetchone()
+        )
+        return row[0] if row else None
+
+    def _version(self, request_id: str) -> Optional[int]:
+        return self._versions([request_id]).get(request_id)
+
+    def _versions(self, request_ids: List[str]) -> Dict[str, int]:
+        rows = self._connection().execute(
+            "SELECT request_id, version FROM sessions WHERE request_id IN"
+            f" ({', '.join('?' * len(request_ids))})",
+            request_ids,
+        )
+        versions = dict(rows)
+        for request_id, version in versions.items():
+            transient = self._transient.get(request_id)
+            if transient is not None and transient[0] > version:
+                versions[request_id] = transient[0]
+        return versions
+
+    def wait_for_change(self, request_id: str, version: int, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while True:
+            current_version = self._version(request_id)
+            if current_version is None:
+                return False
+            if current_version > version:
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(self.poll_interval, remaining))
+
+    async def wait_for_change_async(
+        self, request_id: str, version: int, timeout: float
+    ) -> bool:
+        # no database reads on the event loop, the poller thread does them
+        return await self._poller.wait(request_id, version, timeout) is not None
+
+    def submit_input(self, request_id: str, answer: str) -> bool:
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE sessions SET pending_input = ? WHERE request_id = ?"
+                " AND pipeline_status = 'waiting_for_input' AND pending_input IS NULL",
+                (answer, request_id),
+            )
+            return cursor.rowcount == 1
+
+    def pop_input(self, request_id: str) -> Optional[str]:
+        # a waiting pipeline checks often, only take the write lock for an answer
+        row = (
+            self._connection()
+            .execute(
+                "SELECT pending_input FROM sessions WHERE request_id = ?", (request_id,)
+            )
+            .fetchone()
+        )
+        if row is None or row[0] is None:
+            return None
+        with self._transaction() as connection:
+            row = connection.execute(
+                "SELECT pending_input FROM sessions WHERE request_id = ?", (request_id,)
+            ).fetchone()
+            if row is None or row[0] is None:
+                return None
+            connection.execute(
+                "UPDATE sessions SET pending_input = NULL WHERE request_id = ?",
+                (request_id,),
+            )
+            return row[0]
+
+    def claim_request_keys(self, request_id: str, keys: Dict[str, float]) -> str:
+        now = time.time()
+        with self._transaction() as connection:
+            for key in keys:
+                row = connection.execute(
+                    "SELECT request_id FROM request_keys"
+                    " WHERE key = ? AND expires_at > ?",
+                    (key, now),
+                ).fetchone()
+                if row is not None:
+                    return row[0]
+            connection.executemany(
+                "INSERT OR REPLACE INTO request_keys (key, request_id, expires_at)"
+                " VALUES (?, ?, ?)",
+                [(key, request_id, now + ttl) for key, ttl in keys.items()],
+            )
+        return request_id
+
+    def find_request_key(self, key: str) -> Optional[str]:
+        row = (
+            self._connection()
+            .execute(
+                "SELECT request_id FROM request_keys WHERE key = ? AND expires_at > ?",
+                (key, time.time()),
+            )
+            .fetchone()
+        )
+        return row[0] if row else None
+
+    def delete(self, request_id: str) -> None:
+        with self._transaction() as connection:
+            row = connection.execute(
+                "SELECT pipeline_status FROM sessions WHERE request_id = ?",
+                (request_id,),
+            ).fetchone()
+            if row is not None:
+                self._transition(connection, row[0], None)
+            connection.execute(
+                "DELETE FROM sessions WHERE request_id = ?", (request_id,)
+            )
+            connection.execute(
+                "DELETE FROM session_events WHERE request_id = ?", (request_id,)
+            )
+        with self._transient_lock:
+            self._transient.pop(request_id, None)
+
+    def expire(self, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        with self._transaction() as connection:
+            rows = connection.execute(
+                "SELECT request_id, pipeline_status FROM sessions WHERE expires_at <= ?",
+                (now,),
+            ).fetchall()
+            expired = [(request_id,) for request_id, _ in rows]
+            connection.executemany(
+                "DELETE FROM session_events WHERE request_id = ?", expired
+            )
+            connection.executemany("DELETE FROM sessions WHERE request_id = ?", expired)
+
+            expired_by_status: Dict[str, int] = {}
+            for _, pipeline_status in rows:
+                expired_by_status[pipeline_status] = (
+                    expired_by_status.get(pipeline_status, 0) + 1
+                )
+            for pipeline_status, count in expired_by_status.items():
+                self._transition(connection, pipeline_status, None, count=count)
+
+            connection.execute("DELETE FROM request_keys WHERE expires_at <= ?", (now,))
+        with self._transient_lock:
+            for request_id, _ in rows:
+                self._transient.pop(request_id, None)
+        return len(expired)
+
+    def count_by_status(self) -> Dict[str, int]:
+        counts = {status: 0 for status in PIPELINE_STATUSES}
+        rows = self._connection().execute(
+            "SELECT pipeline_status, count FROM status_counts"
+        )
+        for pipeline_status, count in rows:
+            counts[pipeline_status] = count
+        return counts
+
+    def count(self) -> int:
+        return (
+            self._connection()
+            .execute("SELECT COALESCE(SUM(count), 0) FROM status_counts")
+            .fetchone()[0]
+        )
+
+
+def get_session_store() -> SessionStore:
+    """
+    Returns the session store selected by the `SESSION_STORE` environment variable:
+    `memory` (default, single process) or `sqlite` (shared by all workers on a machine,
+    file set by `SESSION_STORE_PATH`).
+    """
+    backend = os.getenv("SESSION_STORE", "memory").lower()
+    if backend == "memory":
+        return InMemorySessionStore()
+    if backend == "sqlite":
+        return SQLiteSessionStore(os.getenv("SESSION_STORE_PATH"))
+    raise ValueError(f"Unknown SESSION_STORE '{backend}', use 'memory' or 'sqlite'.")
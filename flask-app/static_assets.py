@@ -0,0 +1,159 @@
+"""In-memory manifest of the React build with precompressed variants and cache headers."""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+from typing import Dict, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # optional, gzip variants are always built
+    brotli = None
+
+# Vite writes fingerprinted bundles to `assets/`, e.g. `assets/index-BpD6m0Xb.js`
+HASHED_ASSET_PATTERN = re.compile(r"^assets/.+[.-][A-Za-z0-9_-]{8,}\.\w+$")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# unhashed files (index.html, favicons) are revalidated with their ETag
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/javascript",
+    "application/json",
+    "application/manifest+json",
+    "application/xml",
+    "image/svg+xml",
+)
+# smaller files don't get smaller enough to be worth a variant
+MIN_COMPRESS_SIZE = 1024
+# larger files (e.g. videos) are served from disk instead of memory
+MAX_IN_MEMORY_SIZE = 4 * 1024 * 1024
+
+STATIC_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
+# (status_code, headers, body), body is None for a 304, or for a 200 of an
+# asset that has to be sent from `asset.file_path`
+StaticResult = Tuple[int, Dict[str, str], Optional[bytes]]
+
+
+def _accepted_encodings(accept_encoding: Optional[str]) -> Tuple[str, ...]:
+    accepted = []
+    for item in (accept_encoding or "").split(","):
+        name, _, params = item.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.append(name.strip().lower())
+    return tuple(accepted)
+
+
+class StaticAsset:
+    """One file of the build, with its body and compressed variants."""
+
+    __slots__ = (
+        "path",
+        "file_path",
+        "content_type",
+        "etag",
+        "cache_control",
+        "body",
+        "encodings",
+    )
+
+    def __init__(self, path: str, file_path: str, data: Optional[bytes], etag: str):
+        self.path = path
+        self.file_path = file_path
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if content_type.startswith("text/") or content_type in (
+            "application/javascript",
+            "application/json",
+        ):
+            content_type += "; charset=utf-8"
+        self.content_type = content_type
+        self.etag = etag
+        self.cache_control = (
+            IMMUTABLE_CACHE_CONTROL
+            if HASHED_ASSET_PATTERN.match(path)
+            else REVALIDATE_CACHE_CONTROL
+        )
+        self.body = data
+        # encoding -> compressed body, best compression first
+        self.encodings: Dict[str, bytes] = {}
+        if data is not None and self._is_compressible(len(data)):
+            if brotli is not None:
+                self._add_variant("br", brotli.compress(data, quality=11))
+            self._add_variant("gzip", gzip.compress(data, compresslevel=9, mtime=0))
+
+    def _is_compressible(self, size: int) -> bool:
+        return size >= MIN_COMPRESS_SIZE and self.content_type.startswith(
+            COMPRESSIBLE_TYPES
+        )
+
+    def _add_variant(self, encoding: str, compressed: bytes):
+        if len(compressed) < len(self.body):
+            self.encodings[encoding] = compressed
+
+    def respond(
+        self, accept_encoding: Optional[str], if_none_match: Optional[str]
+    ) -> StaticResult:
+        """Picks the best variant for the client, or a 304 if its copy is current."""
+        accepted = _accepted_encodings(accept_encoding)
+        encoding = next((name for name in self.encodings if name in accepted), None)
+
+        headers = {
+            "Content-Type": self.content_type,
+            "Cache-Control": self.cache_control,
+            # each variant is its own representation with its own ETag
+            "ETag": f'"{self.etag}-{encoding}"' if encoding else f'"{self.etag}"',
+        }
+        if self.encodings:
+            headers["Vary"] = "Accept-Encoding"
+        if encoding:
+            headers["Content-Encoding"] = encoding
+
+        if if_none_match and (
+            if_none_match.strip() == "*" or self.etag in if_none_match
+        ):
+            # the content of every variant is the same, any of their ETags matches
+            return 304, headers, None
+        if encoding:
+            return 200, headers, self.encodings[encoding]
+        return 200, headers, self.body
+
+
+class StaticAssets:
+    """
+    Manifest of every file in the static folder, built once at startup so that
+    requests never touch the file system. Compressible files get brotli (when
+    installed) and gzip variants, fingerprinted bundles are cached as immutable.
+    """
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.assets: Dict[str, StaticAsset] = {}
+        if os.path.isdir(folder):
+            self._build()
+
+    def _build(self):
+        for directory, _, file_names in os.walk(self.folder):
+            for file_name in file_names:
+                file_path = os.path.join(directory, file_name)
+                path = os.path.relpath(file_path, self.folder).replace(os.sep, "/")
+
+                digest = hashlib.sha256()
+                with open(file_path, "rb") as asset_file:
+                    data = asset_file.read()
+                digest.update(data)
+                if len(data) > MAX_IN_MEMORY_SIZE:
+                    data = None
+                self.assets[path] = StaticAsset(
+                    path, file_path, data, digest.hexdigest()[:20]
+                )
+
+    def get(self, path: str) -> Optional[StaticAsset]:
+        return self.assets.get(path)
+
+    @property
+    def index(self) -> Optional[StaticAsset]:
+        return self.assets.get("index.html")
@@ -0,0 +1,298 @@
+"""Signed webhook deliveries to the `callback_url` of a pipeline run."""
+
+import hashlib
+import heapq
+import hmac
+import ipaddress
+import itertools
+import json
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+from typing import Dict, FrozenSet, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+
+from agentd.utils.log_utils import fields, get_logger
+from agentd.utils.metrics import REGISTRY
+
+logger = get_logger(__name__)
+
+# signs every delivery, runs with a `callback_url` are rejected without it
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+# deliveries waiting for a worker, new ones are dropped once it is full
+DEFAULT_MAX_QUEUE = int(os.getenv("WEBHOOK_MAX_QUEUE", "1000"))
+DEFAULT_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "4"))
+DEFAULT_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "6"))
+DEFAULT_TIMEOUT_SECONDS = float(os.getenv("WEBHOOK_TIMEOUT_SECONDS", "10"))
+# retry delays grow 2, 4, 8... seconds up to this
+MAX_RETRY_DELAY_SECONDS = 300
+MAX_CALLBACK_URL_LENGTH = 2048
+# comma separated hosts webhooks may be sent to, e.g. `hooks.example.com`. Empty
+# allows any host with public addresses only, listed hosts may also be internal
+WEBHOOK_ALLOWED_HOSTS = frozenset(
+    host.strip().lower()
+    for host in os.getenv("WEBHOOK_ALLOWED_HOSTS", "").split(",")
+    if host.strip()
+)
+
+SIGNATURE_HEADER = "X-Agentd-Signature"
+EVENT_HEADER = "X-Agentd-Event"
+DELIVERY_HEADER = "X-Agentd-Delivery"
+
+INPUT_REQUIRED_EVENT = "pipeline.input_required"
+FILE_CREATED_EVENT = "pipeline.file_created"
+COMPLETED_EVENT = "pipeline.completed"
+FAILED_EVENT = "pipeline.failed"
+CANCELLED_EVENT = "pipeline.cancelled"
+
+WEBHOOK_DELIVERIES = REGISTRY.counter(
+    "agentd_webhook_deliveries_total",
+    "Webhook deliveries per outcome: delivered, retried, failed and dropped.",
+    ["outcome"],
+)
+
+
+class UnsafeCallbackURL(Exception):
+    """Raised for a callback URL whose host isn't allowed, e.g. a private address."""
+
+
+def check_callback_host(
+    callback_url: str, allowed_hosts: Optional[FrozenSet[str]] = None
+):
+    """
+    Checks that webhooks may be sent to the host of `callback_url`. Without an
+    allowlist every address the host resolves to must be public, so the server
+    can't be made to POST to itself, its network or a cloud metadata service.
+
+    Raises:
+        UnsafeCallbackURL: if the host isn't allowed.
+        socket.gaierror: if the host can't be resolved.
+    """
+    if allowed_hosts is None:
+        allowed_hosts = WEBHOOK_ALLOWED_HOSTS
+    host = (urlparse(callback_url).hostname or "").lower()
+    if allowed_hosts:
+        if host not in allowed_hosts:
+            raise UnsafeCallbackURL(f"Host '{host}' is not allowed.")
+        return
+
+    for *_, sockaddr in socket.getaddrinfo(host, None, proto=socket.IPPROTO_TCP):
+        address = ipaddress.ip_address(sockaddr[0].split("%", 1)[0])
+        if getattr(address, "ipv4_mapped", None):
+            address = address.ipv4_mapped
+        if not address.is_global or address.is_multicast:
+            raise UnsafeCallbackURL(
+                f"Host '{host}' resolves to a non-public address ({address})."
+            )
+
+
+def validate_callback_url(callback_url) -> Tuple[bool, str]:
+    if not isinstance(callback_url, str) or not (
+        0 < len(callback_url) <= MAX_CALLBACK_URL_LENGTH
+    ):
+        return False, (
+            f"Field 'callback_url' must be a URL of at most {MAX_CALLBACK_URL_LENGTH}"
+            " characters."
+        )
+    parsed_url = urlparse(callback_url)
+    if parsed_url.scheme not in ("http", "https") or not parsed_url.hostname:
+        return False, "Field 'callback_url' must be an http(s) URL."
+    if not WEBHOOK_SECRET:
+        return False, "Webhooks are not configured on this server."
+    try:
+        check_callback_host(callback_url)
+    except UnsafeCallbackURL as e:
+        return False, f"Field 'callback_url' is not allowed: {e}"
+    except (OSError, UnicodeError) as e:
+        return False, f"Field 'callback_url' has a host that can't be resolved ({e})."
+    return True, ""
+
+
+def sign(secret: str, timestamp: int, body: bytes) -> str:
+    """
+    Returns the signature header value, `t=<timestamp>,v1=<hex HMAC-SHA256>` of
+    `<timestamp>.<body>`. Receivers recompute it and reject old timestamps.
+    """
+    signed_payload = f"{timestamp}.".encode("utf-8") + body
+    digest = hmac.new(secret.encode("utf-8"), signed_payload, hashlib.sha256)
+    return f"t={timestamp},v1={digest.hexdigest()}"
+
+
+class _Delivery:
+    __slots__ = ("url", "event_type", "delivery_id", "body", "attempts")
+
+    def __init__(self, url: str, event_type: str, delivery_id: str, body: bytes):
+        self.url = url
+        self.event_type = event_type
+        self.delivery_id = delivery_id
+        self.body = body
+        self.attempts = 0
+
+
+class WebhookDispatcher:
+    """
+    Delivers webhook events from a bounded queue on a few background threads.
+
+    `send()` never blocks: a full queue drops the event. Failed deliveries
+    (connection errors, timeouts, 429 and 5xx answers) are retried with
+    exponential backoff up to `max_attempts`, other 4xx answers are final.
+    Retries wait in the same queue without holding a worker.
+    """
+
+    def __init__(
+        self,
+        secret: str = WEBHOOK_SECRET,
+        max_queue: int = DEFAULT_MAX_QUEUE,
+        num_workers: int = DEFAULT_WORKERS,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        timeout: float = DEFAULT_TIMEOUT_SECONDS,
+    ):
+        self.secret = secret
+        self.max_queue = max_queue
+        self.num_workers = num_workers
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self._condition = threading.Condition()
+        # (due_at, seq, delivery), first attempts are due right away
+        self._pending: List[Tuple[float, int, _Delivery]] = []
+        self._seq = itertools.count()
+        self._workers: List[threading.Thread] = []
+
+    @property
+    def queue_length(self) -> int:
+        return len(self._pending)
+
+    def send(
+        self, url: str, event_type: str, request_id: str, data: Optional[Dict] = None
+    ) -> bool:
+        """
+        Queues an event for `url`.
+
+        Returns:
+            bool: False if the queue is full and the event was dropped.
+        """
+        delivery_id = str(uuid.uuid4())
+        body = json.dumps(
+            {
+                "id": delivery_id,
+                "type": event_type,
+                "request_id": request_id,
+                "created_at": time.time(),
+                "data": data or {},
+            }
+        ).encode("utf-8")
+
+        with self._condition:
+            if len(self._pending) >= self.max_queue:
+                WEBHOOK_DELIVERIES.inc(outcome="dropped")
+                return False
+            self._push_locked(
+                time.monotonic(), _Delivery(url, event_type, delivery_id, body)
+            )
+            # workers are started lazily so that forked workers own their threads
+            if len(self._workers) < self.num_workers:
+                worker = threading.Thread(
+                    target=self._run,
+                    name=f"webhook-worker-{len(self._workers)}",
+                    daemon=True,
+                )
+                self._workers.append(worker)
+                worker.start()
+        return True
+
+    def _push_locked(self, due_at: float, delivery: _Delivery):
+        heapq.heappush(self._pending, (due_at, next(self._seq), delivery))
+        self._condition.notify()
+
+    def _next_delivery(self) -> _Delivery:
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                if self._pending and self._pending[0][0] <= now:
+                    return heapq.heappop(self._pending)[2]
+                timeout = self._pending[0][0] - now if self._pending else None
+                self._condition.wait(timeout=timeout)
+
+    def _run(self):
+        while True:
+            delivery = self._next_delivery()
+            delivery.attempts += 1
+            try:
+                retry = not self._deliver(delivery)
+            except Exception as e:
+                logger.warning(
+                    "Webhook delivery failed",
+                    extra=fields(url=delivery.url, error=str(e)),
+                )
+                retry = True
+
+            if not retry:
+                continue
+            if delivery.attempts >= self.max_attempts:
+                WEBHOOK_DELIVERIES.inc(outcome="failed")
+                logger.error(
+                    "Giving up on webhook delivery",
+                    extra=fields(
+                        url=delivery.url,
+                        event=delivery.event_type,
+                        attempts=delivery.attempts,
+                    ),
+                )
+                continue
+
+            WEBHOOK_DELIVERIES.inc(outcome="retried")
+            delay = min(2**delivery.attempts, MAX_RETRY_DELAY_SECONDS)
+            # jitter so that receivers coming back aren't hit by every retry at once
+            delay *= random.uniform(0.5, 1.0)
+            with self._condition:
+                self._push_locked(time.monotonic() + delay, delivery)
+
+    def _deliver(self, delivery: _Delivery) -> bool:
+        """Returns True once the event is delivered, or can never be."""
+        try:
+            # again, the host may resolve to other addresses since it was validated,
+            # resolution errors are retried like connection errors
+            check_callback_host(delivery.url)
+        except UnsafeCallbackURL as e:
+            WEBHOOK_DELIVERIES.inc(outcome="failed")
+            logger.error(
+                "Webhook destination not allowed",
+                extra=fields(url=delivery.url, event=delivery.event_type, error=str(e)),
+            )
+            return True
+
+        headers = {
+            "Content-Type": "application/json",
+            "User-Agent": "agentd-webhooks",
+            EVENT_HEADER: delivery.event_type,
+            DELIVERY_HEADER: delivery.delivery_id,
+            SIGNATURE_HEADER: sign(self.secret, int(time.time()), delivery.body),
+        }
+        response = requests.post(
+            delivery.url,
+            data=delivery.body,
+            headers=headers,
+            timeout=self.timeout,
+            allow_redirects=False,
+        )
+        if response.status_code < 300:
+            WEBHOOK_DELIVERIES.inc(outcome="delivered")
+            return True
+        if response.status_code == 429 or response.status_code >= 500:
+            return False
+        # the receiver rejected the event, sending it again won't change that
+        WEBHOOK_DELIVERIES.inc(outcome="failed")
+        logger.error(
+            "Webhook rejected by the receiver",
+            extra=fields(
+                url=delivery.url,
+                event=delivery.event_type,
+                status=response.status_code,
+            ),
+        )
+        return True
@@ -1,4 +1,4 @@
-import { useState } from "react";
+import { useRef, useState } from "react";
 import { useNavigate } from "react-router-dom";
 import { Play, Sparkles, Loader2, ArrowRight } from "lucide-react";
 import { API_ENDPOINTS, getApiUrl } from "../utils";
@@ -6,22 +6,34 @@ import { API_ENDPOINTS, getApiUrl } from "../utils";
 export default function HomePage() {
   const [topic, setTopic] = useState("");
   const [isSubmitting, setIsSubmitting] = useState(false);
+  // one key per topic, so a double submit or retry reuses the same pipeline
+  const idempotencyKey = useRef({ topic: "", key: "" });
   const navigate = useNavigate();
 
   const handleSubmit = async (e: any) => {
     e.preventDefault();
     if (!topic.trim()) return alert("Please enter a valid topic");
     
+    if (idempotencyKey.current.topic !== topic) {
+      idempotencyKey.current = { topic, key: crypto.randomUUID() };
+    }
+
     setIsSubmitting(true);
     try {
       const res = await fetch(getApiUrl(API_ENDPOINTS.API_RUN), {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
+        headers: {
+          "Content-Type": "application/json",
+          "Idempotency-Key": idempotencyKey.current.key,
+        },
         body: JSON.stringify({ topic }),
       });
       const data = await res.json();
       if (res.ok) {
         navigate(`/status/${data.request_id}`);
+      } else if (res.status === 429) {
+        const retryAfter = res.headers.get("Retry-After");
+        alert(`${data.error?.message || "The server is busy."} Try again in ${retryAfter || "a few"} seconds.`);
       } else {
         alert(data.message || "Error starting pipeline");
       }
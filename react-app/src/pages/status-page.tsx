@@ -13,10 +13,14 @@ import {
   ChevronDown,
   ChevronUp
 } from "lucide-react";
-import { getSessionStatus, postSessionAnswer } from "../utils";
-import type { PipelineSessionStatus } from "../types";
+import { getSessionStatus, getSessionStream, postSessionAnswer, postSessionCancel } from "../utils";
+import { PIPELINE_EVENT_TYPES } from "../types";
+import type { PipelineSessionStatus, PipelineSessionStreamEvent } from "../types";
 import MarkdownBlock from "../components/markdown";
 
+// no more events follow once a session reaches one of these
+const FINISHED_STATUSES = ["completed", "failed", "cancelled"];
+
 function ShowHideComponent({ previousUpdates }: { previousUpdates: [] }) {
   const [isVisible, setIsVisible] = useState(false);
 
@@ -56,25 +60,51 @@ export default function StatusPage() {
   const [error, setError] = useState<string | null>(null);
   const [userAnswer, setUserAnswer] = useState("");
   const [isSubmitting, setIsSubmitting] = useState(false);
+  const [isCancelling, setIsCancelling] = useState(false);
   const navigate = useNavigate();
 
   useEffect(() => {
-    const interval = setInterval(async () => {
+    let eventSource: EventSource | null = null;
+    let cancelled = false;
+
+    const applyEvent = (e: MessageEvent) => {
+      const { agent_update, ...changes }: PipelineSessionStreamEvent = JSON.parse(e.data);
+      setStatus((prev) => {
+        if (!prev) return prev;
+        const next = { ...prev, ...changes, version: Number(e.lastEventId) };
+        if (agent_update) {
+          next.agent_updates = [...prev.agent_updates, agent_update] as [];
+        }
+        return next;
+      });
+      if (changes.pipeline_status && FINISHED_STATUSES.includes(changes.pipeline_status)) {
+        eventSource?.close();
+      }
+    };
+
+    // load the current snapshot once, then follow the event stream from there
+    (async () => {
       const res = await fetch(getSessionStatus(requestId || ""));
       const data = await res.json();
-      if (res.ok) {
-        setPageStatus("success");
-        setStatus(data);
-        if (data.pipeline_status === "completed") {
-          clearInterval(interval);
-        }
-      } else {
-        clearInterval(interval);
+      if (cancelled) return;
+      if (!res.ok) {
         setPageStatus("error");
         setError(data.message || "Failed to fetch reuqest status");
+        return;
+      }
+      setPageStatus("success");
+      setStatus(data);
+      if (FINISHED_STATUSES.includes(data.pipeline_status)) {
+        return;
       }
-    }, 1000);
-    return () => clearInterval(interval);
+      eventSource = new EventSource(getSessionStream(requestId || "", data.version));
+      PIPELINE_EVENT_TYPES.forEach((type) => eventSource?.addEventListener(type, applyEvent));
+    })();
+
+    return () => {
+      cancelled = true;
+      eventSource?.close();
+    };
   }, [requestId, navigate]);
 
   const handleSubmitAnswer = async () => {
@@ -103,6 +133,25 @@ export default function StatusPage() {
     }
   };
 
+  const handleCancel = async () => {
+    if (!confirm("Cancel this request? The agents will stop working on it.")) {
+      return;
+    }
+
+    setIsCancelling(true);
+    try {
+      const res = await fetch(postSessionCancel(requestId || ""), { method: "POST" });
+      if (!res.ok) {
+        const data = await res.json();
+        alert(data.error?.message || "Failed to cancel the request");
+      }
+    } catch (err) {
+      alert("Failed to cancel the request. Please try again.");
+    } finally {
+      setIsCancelling(false);
+    }
+  };
+
   if (pageStatus === "error") {
     return (
       <div className="min-h-screen bg-gray-900 flex items-center justify-center p-4">
@@ -135,19 +184,24 @@ export default function StatusPage() {
     );
   }
 
-  if (status.pipeline_status === "failed") {
+  if (status.pipeline_status === "failed" || status.pipeline_status === "cancelled") {
+    const cancelled = status.pipeline_status === "cancelled";
     return (
       <div className="min-h-screen bg-gray-900 flex items-center justify-center p-4">
         <div className="max-w-2xl w-full bg-gray-800 rounded-lg shadow-xl p-6 border border-gray-700">
           <div className="flex items-center mb-6">
             <AlertCircle className="h-8 w-8 text-red-400 mr-3" />
-            <h1 className="text-2xl font-bold text-white">Reuqest Failed</h1>
+            <h1 className="text-2xl font-bold text-white">
+              {cancelled ? "Reuqest Cancelled" : "Reuqest Failed"}
+            </h1>
           </div>
 
           <div className="space-y-4 mb-6">
-            <div className="bg-red-900/50 border border-red-700 rounded-lg p-4">
-              <p className="text-red-200 font-medium">Error: {status.error}</p>
-            </div>
+            {status.error && (
+              <div className="bg-red-900/50 border border-red-700 rounded-lg p-4">
+                <p className="text-red-200 font-medium">Error: {status.error}</p>
+              </div>
+            )}
 
             {status.update && (
               <div className="bg-gray-700 border border-gray-600 rounded-lg p-4">
@@ -328,6 +382,19 @@ export default function StatusPage() {
               </div>
             </div>
           )}
+
+          <button
+            onClick={handleCancel}
+            disabled={isCancelling}
+            className="w-full mt-6 bg-gray-700 hover:bg-red-800 disabled:bg-gray-600 disabled:cursor-not-allowed text-white font-medium py-2 px-4 rounded-lg transition-colors flex items-center justify-center border border-gray-600"
+          >
+            {isCancelling ? (
+              <Loader2 className="h-4 w-4 mr-2 animate-spin" />
+            ) : (
+              <XCircle className="h-4 w-4 mr-2" />
+            )}
+            Cancel Reuqest
+          </button>
         </div>
       </div>
     </div>
@@ -1,6 +1,6 @@
 type PipelineSession = {
   topic: string;
-  pipeline_status: "queued" | "running" | "waiting_for_input" | "completed" | "failed";
+  pipeline_status: "queued" | "running" | "waiting_for_input" | "completed" | "failed" | "cancelled";
   status: string;
   start_at: string;
   ended_at: string | null;
@@ -9,6 +9,25 @@ type PipelineSession = {
   error: string | null;
   agent_updates: [];
   progress: number;
+  version: number;
 };
 
-export type PipelineSessionStatus = PipelineSession;
\ No newline at end of file
+// fields carried by a single event of the `api/stream` endpoint
+type PipelineSessionEvent = Partial<PipelineSession> & {
+  agent_update?: string;
+};
+
+// named events sent by the `api/stream` endpoint
+export const PIPELINE_EVENT_TYPES = [
+  "pipeline_status",
+  "text_message",
+  "tool_call_request",
+  "tool_result",
+  "control_signal",
+  "user_input_request",
+  "progress_update",
+  "file_url",
+];
+
+export type PipelineSessionStatus = PipelineSession;
+export type PipelineSessionStreamEvent = PipelineSessionEvent;
\ No newline at end of file
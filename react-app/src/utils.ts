@@ -6,6 +6,8 @@ const API_ENDPOINTS = {
     API_RUN: 'api/run',
     API_SESSION_STATUS: 'api/status',
     API_ANSWER: 'api/answer',
+    API_CANCEL: 'api/cancel',
+    API_STREAM: 'api/stream',
     API_HEALTH: 'api/health',
 };
 
@@ -17,13 +19,23 @@ function getSessionStatus(sessionId: string): string {
     return getApiUrl(API_ENDPOINTS.API_SESSION_STATUS + `/${sessionId}`);
 }
 
+function getSessionStream(sessionId: string, lastEventId: number = 0): string {
+    return getApiUrl(API_ENDPOINTS.API_STREAM + `/${sessionId}?last_event_id=${lastEventId}`);
+}
+
 function postSessionAnswer(sessionId: string): string {
     return getApiUrl(API_ENDPOINTS.API_ANSWER + `/${sessionId}`);
 }
 
+function postSessionCancel(sessionId: string): string {
+    return getApiUrl(API_ENDPOINTS.API_CANCEL + `/${sessionId}`);
+}
+
 export {
     API_ENDPOINTS,
     getApiUrl,
     getSessionStatus,
-    postSessionAnswer
+    getSessionStream,
+    postSessionAnswer,
+    postSessionCancel
 }
\ No newline at end of file
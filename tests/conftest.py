@@ -0,0 +1,109 @@
+"""
+Shared fixtures. `flask-app` isn't a valid package name, its modules only use
+relative imports, so they are imported here as the `flask_app` package.
+"""
+
+import importlib.machinery
+import importlib.util
+import os
+import sys
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_spec = importlib.machinery.ModuleSpec("flask_app", None, is_package=True)
+_spec.submodule_search_locations = [os.path.join(ROOT, "flask-app")]
+sys.modules.setdefault("flask_app", importlib.util.module_from_spec(_spec))
+
+
+class FakeCloudStorage:
+    """Keeps "uploaded" files in memory, by remote path."""
+
+    def __init__(self):
+        self.files = {}
+        self.listed = []
+
+    def upload_file(self, local_path: str, remote_path: str) -> str:
+        with open(local_path, "rb") as f:
+            self.files[remote_path] = f.read()
+        return remote_path
+
+    def download_file(self, remote_path: str, local_path: str):
+        with open(local_path, "wb") as f:
+            f.write(self.files[remote_path])
+
+    def list_files(self, prefix: str = ""):
+        self.listed.append(prefix)
+        return [path for path in self.files if path.startswith(prefix)]
+
+
+@pytest.fixture
+def cloud_storage(monkeypatch):
+    """Replaces the cloud storage of the session journal with `FakeCloudStorage`."""
+    from flask_app import session_journal
+
+    storage = FakeCloudStorage()
+    monkeypatch.setattr(session_journal, "get_cloud_storage", lambda: storage)
+    return storage
+
+
+class ScriptedAgentD:
+    """
+    Asks the pipeline's questions in order: the solution, whether to proceed and
+    whether to generate social media posts. It finishes after the last answer.
+    """
+
+    QUESTIONS = [
+        ("solution_analysis_agent", "Which solution should be analyzed?"),
+        ("report_generation_agent", "Would you like to proceed with this idea?"),
+        ("root_agent", "Would you also like to generate social media posts?"),
+    ]
+
+    def __init__(self):
+        # the messages of each session, the topic and then the answers
+        self.messages = {}
+
+    @staticmethod
+    def generate_user_id():
+        return "user"
+
+    async def new_sesion(self, user_id):
+        session = SimpleNamespace(
+            id=str(uuid.uuid4()), user_id=user_id, app_name="agentd"
+        )
+        self.messages[session.id] = []
+        return session
+
+    async def continue_session(self, message, session, callback, token_usage):
+        from agentd import AgentD
+
+        messages = self.messages[session.id]
+        messages.append(message)
+        callback(["Thinking about it."], AgentD.EventType.TEXT_MESSAGE)
+        if len(messages) <= len(self.QUESTIONS):
+            agent_name, question = self.QUESTIONS[len(messages) - 1]
+            callback(
+                {"agent_name": agent_name, "description": question, "required": True},
+                AgentD.EventType.USER_INPUT_REQUEST,
+            )
+
+
+@pytest.fixture
+def scripted_agentd():
+    return ScriptedAgentD()
+
+
+@pytest.fixture
+def api_service(monkeypatch, tmp_path, cloud_storage, scripted_agentd):
+    from flask_app import api_service
+    from flask_app.session_journal import SessionJournal
+
+    monkeypatch.setattr(api_service, "AGENTD_INSTANCE", scripted_agentd)
+    monkeypatch.setattr(
+        api_service, "SESSION_JOURNAL", SessionJournal(str(tmp_path), keep_local=True)
+    )
+    return api_service
@@ -0,0 +1,50 @@
+import json
+
+
+def read_all(api_service, batch):
+    lines, cursor, finished = [], 0, False
+    while not finished:
+        batch.wait_for_results(cursor, timeout=5)
+        new_lines, cursor, finished = api_service.read_batch(batch, cursor)
+        lines.extend(json.loads(line) for line in new_lines)
+    return lines
+
+
+def test_policy_run_completes(api_service):
+    batch, error = api_service.start_batch(
+        {"topics": ["topic one", "topic two", "topic three"], "max_concurrency": 2}
+    )
+    assert error is None
+
+    lines = read_all(api_service, batch)
+
+    assert [line["type"] for line in lines] == ["batch"] + ["item"] * 3 + ["summary"]
+    assert lines[-1]["pipeline_statuses"] == {"completed": 3}
+    for line in lines[1:-1]:
+        session = api_service.SESSION_STORE.get(line["request_id"])
+        assert session["pipeline_status"] == "completed"
+        assert session["error"] is None
+    # the default policy's answers, each question answered once
+    assert sorted(api_service.AGENTD_INSTANCE.messages.values()) == [
+        [topic, "1", "yes", "no"] for topic in ["topic one", "topic three", "topic two"]
+    ]
+
+
+def test_policy_out_of_answers_fails_run(api_service):
+    batch, error = api_service.start_batch(
+        {"topics": ["topic one"], "answer_policy": {"max_answers": 1}}
+    )
+    assert error is None
+
+    lines = read_all(api_service, batch)
+
+    assert lines[-1]["pipeline_statuses"] == {"failed": 1}
+    assert lines[1]["error"].startswith("The answer policy has no answer for")
+
+
+def test_invalid_batch_is_rejected(api_service):
+    batch, (body, status_code, _) = api_service.start_batch({"topics": ["", "x"]})
+
+    assert batch is None
+    assert status_code == 400
+    assert "topics" in body["error"]["message"]
@@ -0,0 +1,62 @@
+import threading
+import time
+
+import pytest
+from flask_app.session_events import PIPELINE_STATUS_EVENT
+from flask_app.session_store import SQLiteSessionStore
+
+
+def wait_for_status(store, request_id, pipeline_status, timeout=5):
+    deadline = time.monotonic() + timeout
+    while store.get(request_id)["pipeline_status"] != pipeline_status:
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+
+@pytest.fixture
+def sqlite_store(api_service, monkeypatch, tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"), poll_interval=0.05)
+    monkeypatch.setattr(api_service, "SESSION_STORE", store)
+    return store
+
+
+def test_local_store_is_not_checked_for_cancellations(api_service, monkeypatch):
+    store = api_service.SESSION_STORE
+    body, _, _ = api_service.start_pipeline({"topic": "topic one"})
+    request_id = body["request_id"]
+    wait_for_status(store, request_id, "waiting_for_input")
+    status_checks = []
+    get = store.get
+
+    def recording_get(*args, include_history=True):
+        if not include_history:
+            status_checks.append(threading.current_thread().name)
+        return get(*args, include_history=include_history)
+
+    monkeypatch.setattr(store, "get", recording_get)
+    api_service.submit_answer(request_id, {"answer": "1"})
+    wait_for_status(store, request_id, "waiting_for_input")
+    assert api_service.cancel_pipeline(request_id)[1] == 202
+    wait_for_status(store, request_id, "cancelled")
+
+    # only /answer and /cancel checked the session's status, the pipeline never did
+    assert status_checks
+    assert not any(name.startswith("pipeline-loop") for name in status_checks)
+
+
+def test_cancel_by_another_process_stops_pipeline(api_service, sqlite_store, tmp_path):
+    body, _, _ = api_service.start_pipeline({"topic": "topic one"})
+    request_id = body["request_id"]
+    wait_for_status(sqlite_store, request_id, "waiting_for_input")
+
+    # what /cancel does in a process that doesn't run the pipeline
+    SQLiteSessionStore(str(tmp_path / "sessions.db")).update(
+        request_id, PIPELINE_STATUS_EVENT, {"pipeline_status": "cancelled"}
+    )
+
+    # picked up by the pipeline's next store check, which frees its slot
+    deadline = time.monotonic() + 5
+    while api_service.PIPELINE_EXECUTOR.queue_position(request_id) is not None:
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+    assert sqlite_store.get(request_id)["update"] == "Pipeline cancelled."
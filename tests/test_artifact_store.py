@@ -0,0 +1,51 @@
+import os
+import time
+
+import pytest
+
+from agentd.artifact_store import (
+    REFERENCE_PREFIX,
+    TOUCH_INTERVAL_SECONDS,
+    ArtifactStore,
+)
+
+
+def age(store, reference, seconds):
+    path = store._path(reference[len(REFERENCE_PREFIX) :])
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+    return path
+
+
+def test_values_are_stored_once(tmp_path):
+    store = ArtifactStore(str(tmp_path), min_size=10)
+
+    reference = store.offload("a long report " * 10)
+
+    assert reference.startswith(REFERENCE_PREFIX)
+    assert store.offload("a long report " * 10) == reference
+    assert store.offload("short") == "short"
+    assert store.resolve(reference) == "a long report " * 10
+    with pytest.raises(KeyError):
+        store.get(REFERENCE_PREFIX + "0" * 64)
+
+
+def test_sweep_deletes_unused_artifacts(tmp_path):
+    store = ArtifactStore(str(tmp_path), min_size=10)
+    unused = store.put("an old report")
+    read = store.put("an old report that was read")
+    written = store.put("an old report that was written again")
+    age(store, unused, 3 * TOUCH_INTERVAL_SECONDS)
+    age(store, read, 3 * TOUCH_INTERVAL_SECONDS)
+    age(store, written, 3 * TOUCH_INTERVAL_SECONDS)
+
+    store.get(read)
+    store.put("an old report that was written again")
+
+    assert store.sweep(2 * TOUCH_INTERVAL_SECONDS) == 1
+    with pytest.raises(KeyError):
+        store.get(unused)
+    assert store.get(read) == "an old report that was read"
+    # a swept value is written again by the next put
+    assert store.put("an old report") == unused
+    assert store.get(unused) == "an old report"
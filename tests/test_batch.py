@@ -0,0 +1,104 @@
+import asyncio
+import io
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from agentd import agent
+from agentd.agent import MASTER_REPORT_URL_KEY, simple_after_model_modifier
+from agentd.batch import read_topics, run_batch
+
+REPORT_URL = "https://x/master_report.pdf"
+
+
+class FakeSessionService:
+    """Every session ends with the same state."""
+
+    def __init__(self, state):
+        self.state = state
+
+    async def get_session(self, app_name, user_id, session_id):
+        return SimpleNamespace(state=self.state)
+
+
+@pytest.fixture
+def batch_agentd(scripted_agentd):
+    scripted_agentd.session_service = FakeSessionService(
+        {"architecture": "The architecture.", MASTER_REPORT_URL_KEY: REPORT_URL}
+    )
+    scripted_agentd.runner = SimpleNamespace(
+        agent=SimpleNamespace(output_key="architecture", sub_agents=[])
+    )
+    return scripted_agentd
+
+
+def test_batch_writes_one_result_per_topic(batch_agentd, tmp_path):
+    topics = tmp_path / "topics.jsonl"
+    topics.write_text(
+        '{"id": "a", "topic": "topic one"}\n'
+        "\n"
+        '{"title": "topic two", "answer_policy": {"max_answers": 1}}\n'
+    )
+    output = io.StringIO()
+
+    statuses = asyncio.run(
+        run_batch(batch_agentd, read_topics(str(topics)), output, concurrency=2)
+    )
+
+    assert statuses == {"completed": 1, "failed": 1}
+    results = {
+        result["id"]: result
+        for result in (json.loads(line) for line in output.getvalue().splitlines())
+    }
+    assert set(results) == {"a", "line-3"}
+    completed = results["a"]
+    assert [answer["answer"] for answer in completed["answers"]] == ["1", "yes", "no"]
+    assert completed["outputs"] == {
+        "architecture": "The architecture.",
+        MASTER_REPORT_URL_KEY: REPORT_URL,
+    }
+    assert [file["url"] for file in completed["files"]] == [REPORT_URL]
+    # the item's own policy ran out of answers
+    assert results["line-3"]["error"].startswith("The answer policy has no answer")
+
+
+def test_invalid_topic_line_is_reported(tmp_path):
+    topics = tmp_path / "topics.jsonl"
+    topics.write_text('{"topic": "fine"}\n{"topic": ""}\n')
+
+    with pytest.raises(ValueError, match="topics.jsonl:2"):
+        read_topics(str(topics))
+
+
+def test_master_report_is_generated_once_per_outputs(monkeypatch):
+    uploads = []
+
+    def upload(markdown_content, **kwargs):
+        uploads.append(markdown_content)
+        return f"https://x/report-{len(uploads)}.pdf"
+
+    monkeypatch.setattr(agent, "create_and_upload_pdf", upload)
+    architecture_key = agent.architecture_agent.output_key
+    social_media_key = agent.social_media_post_generation_agent.output_key
+    context = SimpleNamespace(state={})
+
+    # the pipeline hasn't reached its last agent yet
+    assert simple_after_model_modifier(context) is None
+
+    context.state[architecture_key] = "The architecture."
+    content = simple_after_model_modifier(context)
+    assert len(content.parts) == 2
+    assert "<ASK>" in content.parts[1].text
+    # later turns of the root agent don't upload it again
+    assert simple_after_model_modifier(context) is None
+    assert simple_after_model_modifier(context) is None
+
+    # until the social media posts are added to it
+    context.state[social_media_key] = "The posts."
+    content = simple_after_model_modifier(context)
+    assert len(content.parts) == 1
+    assert context.state[MASTER_REPORT_URL_KEY] == "https://x/report-2.pdf"
+    assert "The posts." in uploads[1]
+    assert simple_after_model_modifier(context) is None
+    assert len(uploads) == 2
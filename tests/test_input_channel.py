@@ -0,0 +1,90 @@
+import asyncio
+import threading
+
+import pytest
+from flask_app.input_channel import InputChannelClosed, TurnState, UserInputChannel
+
+
+def test_turn_transitions():
+    async def run():
+        channel = UserInputChannel(asyncio.get_running_loop())
+        assert channel.state == TurnState.AGENT
+        # nobody is waiting yet
+        assert not channel.submit("early")
+
+        channel.request_input()
+        channel.request_input()
+        assert channel.state == TurnState.WAITING_FOR_USER
+
+        # answered from an API thread
+        threading.Thread(target=channel.submit, args=("1",)).start()
+        answer = await channel.wait_for_input(timeout=5)
+        assert channel.state == TurnState.AGENT
+        assert not channel.submit("late")
+        return answer
+
+    assert asyncio.run(run()) == "1"
+
+
+def test_only_the_first_answer_counts():
+    async def run():
+        channel = UserInputChannel(asyncio.get_running_loop())
+        channel.request_input()
+        assert channel.submit("first")
+        assert channel.state == TurnState.USER_ANSWERED
+        assert not channel.submit("second")
+        return await channel.wait_for_input(timeout=5)
+
+    assert asyncio.run(run()) == "first"
+
+
+def test_wait_requires_a_request():
+    async def run():
+        await UserInputChannel(asyncio.get_running_loop()).wait_for_input()
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(run())
+
+
+def test_wait_times_out():
+    async def run():
+        channel = UserInputChannel(asyncio.get_running_loop())
+        channel.request_input()
+        await channel.wait_for_input(timeout=0.05)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(run())
+
+
+def test_answer_stored_elsewhere_is_polled():
+    stored = []
+
+    def poll():
+        return stored.pop() if stored else None
+
+    async def run():
+        channel = UserInputChannel(asyncio.get_running_loop())
+        channel.request_input()
+        asyncio.get_running_loop().call_later(0.05, stored.append, "polled")
+        return await channel.wait_for_input(
+            timeout=5, poll=poll, poll_interval=0.01, max_poll_interval=0.02
+        )
+
+    assert asyncio.run(run()) == "polled"
+
+
+def test_close_wakes_up_the_waiting_pipeline():
+    async def run():
+        channel = UserInputChannel(asyncio.get_running_loop())
+        channel.request_input()
+        threading.Timer(0.05, channel.close).start()
+        try:
+            await channel.wait_for_input(timeout=5)
+        finally:
+            assert channel.state == TurnState.CLOSED
+            with pytest.raises(InputChannelClosed):
+                channel.request_input()
+            assert not channel.submit("too late")
+
+    with pytest.raises(InputChannelClosed):
+        asyncio.run(run())
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import threading
+import time
+
+import pytest
+from flask_app import pipeline_executor
+from flask_app.pipeline_executor import PipelineExecutor
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+async def wait_for(event: threading.Event):
+    while not event.is_set():
+        await asyncio.sleep(0.01)
+
+
+class Job:
+    """A job that runs until it is told to finish, and records what happened."""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.finish = threading.Event()
+        self.finished = threading.Event()
+        self.cancelled = threading.Event()
+
+    async def run(self):
+        self.started.set()
+        try:
+            await wait_for(self.finish)
+        except asyncio.CancelledError:
+            self.cancelled.set()
+            raise
+        finally:
+            self.finished.set()
+
+
+def test_jobs_over_the_limit_are_queued():
+    executor = PipelineExecutor(max_in_flight=1, num_loops=2)
+    first, second = Job(), Job()
+
+    assert executor.submit("first", first.run) == 0
+    assert executor.submit("second", second.run) == 1
+    with pytest.raises(ValueError):
+        executor.submit("second", second.run)
+
+    first.started.wait(5)
+    assert executor.in_flight == 1
+    assert executor.queue_position("second") == 1
+    assert not second.started.is_set()
+
+    first.finish.set()
+    second.started.wait(5)
+    assert executor.queue_position("first") is None
+    assert executor.queue_position("second") == 0
+    second.finish.set()
+    wait_until(lambda: executor.in_flight == 0)
+    assert executor.average_run_seconds is not None
+
+
+def test_released_slot_is_taken_back_before_the_queue():
+    executor = PipelineExecutor(max_in_flight=1, num_loops=2)
+    answered, resumed, done = threading.Event(), threading.Event(), threading.Event()
+    second, third = Job(), Job()
+
+    async def waits_for_answer():
+        executor.release_slot("first")
+        await wait_for(answered)
+        await executor.acquire_slot("first")
+        resumed.set()
+        await wait_for(done)
+
+    executor.submit("first", waits_for_answer)
+    executor.submit("second", second.run)
+    executor.submit("third", third.run)
+
+    # the released slot went to the queue
+    second.started.wait(5)
+    assert executor.idle == 1
+    assert executor.in_flight == 1
+
+    answered.set()
+    time.sleep(0.1)
+    assert not resumed.is_set()
+
+    # the resuming job goes before the queued one
+    second.finish.set()
+    assert resumed.wait(5)
+    time.sleep(0.1)
+    assert not third.started.is_set()
+    done.set()
+    assert third.started.wait(5)
+    third.finish.set()
+    wait_until(lambda: executor.in_flight == 0 and executor.idle == 0)
+
+
+def test_cancelled_jobs_clean_up():
+    executor = PipelineExecutor(max_in_flight=1, num_loops=1)
+    running, queued = Job(), Job()
+    executor.submit("running", running.run)
+    executor.submit("queued", queued.run)
+    running.started.wait(5)
+
+    assert executor.cancel("queued")
+    assert executor.cancel("running")
+    assert not executor.cancel("unknown")
+
+    # the queued job is started to be cancelled at its first `await`
+    for job in (running, queued):
+        assert job.finished.wait(5)
+        assert job.cancelled.is_set()
+    wait_until(lambda: executor.in_flight == 0)
+    assert executor.queue_length == 0
+    # cut short, they don't count towards the average
+    assert executor.average_run_seconds is None
+
+
+def test_failed_job_is_logged_and_frees_its_slot():
+    executor = PipelineExecutor(max_in_flight=1, num_loops=1)
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    pipeline_executor.logger.addHandler(handler)
+    next_job = Job()
+
+    async def fails():
+        raise RuntimeError("boom")
+
+    try:
+        executor.submit("fails", fails)
+        executor.submit("next", next_job.run)
+        assert next_job.started.wait(5)
+    finally:
+        pipeline_executor.logger.removeHandler(handler)
+
+    next_job.finish.set()
+    assert [record.getMessage() for record in records] == ["Pipeline job failed"]
+    assert records[0].exc_info[0] is RuntimeError
@@ -0,0 +1,86 @@
+import json
+import os
+
+from flask_app.session_events import PIPELINE_STATUS_EVENT
+from flask_app.session_journal import JOURNAL_REMOTE_DIR, SessionJournal, replay
+
+CREATED = {
+    "pipeline_status": "queued",
+    "update": "Pipeline queued.",
+    "update_timestamp": "2025-01-01T00:00:00",
+}
+
+
+def journal_run(journal, request_id, pipeline_status="completed"):
+    journal.append(request_id, 0, "created", CREATED)
+    journal.append(request_id, 1, PIPELINE_STATUS_EVENT, {"pipeline_status": "running"})
+    journal.append(
+        request_id, 3, "text_message", {"update": "Hello"}, agent_update="Hello"
+    )
+    journal.append(
+        request_id, 4, PIPELINE_STATUS_EVENT, {"pipeline_status": pipeline_status}
+    )
+
+
+def test_replay_rebuilds_session_and_events():
+    records = [
+        {"v": 0, "t": "created", "c": CREATED},
+        {"v": 2, "t": "text_message", "c": {"update": "Hi"}, "u": "Hi"},
+        {"v": 2, "t": "text_message", "c": {"update": "Hi"}, "u": "Hi"},
+        {"v": 5, "t": "file_url", "c": {}, "f": {"url": "https://x/r.pdf"}},
+    ]
+
+    session, events = replay(records)
+
+    # the journal ends mid-run and the repeated record is skipped
+    assert session["pipeline_status"] == "failed"
+    assert session["error"] == "The pipeline was interrupted."
+    assert session["version"] == 5
+    assert session["agent_updates"] == ["Hi"]
+    assert session["agent_files"] == [{"url": "https://x/r.pdf"}]
+    assert [event[0] for event in events] == [2, 5]
+    assert events[0] == (2, "text_message", {"update": "Hi", "agent_update": "Hi"})
+
+
+def test_finished_journal_is_uploaded_and_loaded_back(tmp_path, cloud_storage):
+    journal = SessionJournal(str(tmp_path))
+    journal_run(journal, "r")
+    journal.flush()
+    journal.append("r", 5, PIPELINE_STATUS_EVENT, {"update": "Done."})
+    journal.close_session("r")
+    journal.flush()
+
+    # two segments, named by their offset, and no local files left
+    segments = sorted(cloud_storage.files)
+    assert len(segments) == 2
+    assert segments[0] == f"{JOURNAL_REMOTE_DIR}/r/{0:012d}.jsonl"
+    assert os.listdir(tmp_path) == []
+
+    session, events = journal.load("r")
+    assert session["pipeline_status"] == "completed"
+    assert session["update"] == "Done."
+    assert [event[0] for event in events] == [1, 3, 4, 5]
+
+
+def test_unknown_session_is_looked_up_once(tmp_path, cloud_storage):
+    journal = SessionJournal(str(tmp_path))
+
+    assert journal.load("unknown") is None
+    assert journal.load("unknown") is None
+    assert cloud_storage.listed == [f"{JOURNAL_REMOTE_DIR}/unknown/"]
+
+
+def test_journals_of_an_earlier_process_are_uploaded(tmp_path, cloud_storage):
+    journal = SessionJournal(str(tmp_path))
+    journal.append("r", 0, "created", CREATED)
+    journal.flush()
+    # the process dies before its next upload
+    journal.append("r", 1, PIPELINE_STATUS_EVENT, {"pipeline_status": "running"})
+
+    SessionJournal(str(tmp_path)).flush()
+
+    # only the records after the uploaded offset are uploaded again
+    segments = [cloud_storage.files[path] for path in sorted(cloud_storage.files)]
+    assert [
+        [json.loads(line)["v"] for line in segment.splitlines()] for segment in segments
+    ] == [[0], [1]]
@@ -0,0 +1,71 @@
+import asyncio
+import time
+
+from google.adk.events import Event, EventActions
+from google.adk.sessions.base_session_service import GetSessionConfig
+
+from agentd.session_service import SQLiteSessionService
+
+
+def test_sessions_are_stored_and_loaded(tmp_path):
+    service = SQLiteSessionService(str(tmp_path / "sessions.db"))
+
+    async def run():
+        session = await service.create_session(
+            app_name="agentd", user_id="u", state={"topic": "t", "app:model": "m"}
+        )
+        for index in range(3):
+            await service.append_event(
+                session,
+                Event(
+                    author="agent",
+                    invocation_id="i",
+                    actions=EventActions(
+                        state_delta={"step": index, "temp:scratch": "x"}
+                    ),
+                ),
+            )
+        # other services see it, like a restarted process
+        other = SQLiteSessionService(str(tmp_path / "sessions.db"))
+        return (
+            await other.get_session(
+                app_name="agentd", user_id="u", session_id=session.id
+            ),
+            await other.get_session(
+                app_name="agentd",
+                user_id="u",
+                session_id=session.id,
+                config=GetSessionConfig(num_recent_events=2),
+            ),
+        )
+
+    loaded, recent = asyncio.run(run())
+
+    assert loaded.state == {"topic": "t", "step": 2, "app:model": "m"}
+    assert [event.actions.state_delta["step"] for event in loaded.events] == [0, 1, 2]
+    assert [event.actions.state_delta["step"] for event in recent.events] == [1, 2]
+
+
+def test_expired_sessions_are_purged(tmp_path):
+    service = SQLiteSessionService(
+        str(tmp_path / "sessions.db"), ttl_seconds=60, purge_interval=0
+    )
+
+    async def create():
+        return await service.create_session(app_name="agentd", user_id="u")
+
+    old, new = asyncio.run(create()), asyncio.run(create())
+    service._connection().execute(
+        "UPDATE adk_sessions SET update_time = ? WHERE session_id = ?",
+        (time.time() - 120, old.id),
+    )
+
+    service._purge_expired()
+
+    async def get(session_id):
+        return await service.get_session(
+            app_name="agentd", user_id="u", session_id=session_id
+        )
+
+    assert asyncio.run(get(old.id)) is None
+    assert asyncio.run(get(new.id)) is not None
@@ -0,0 +1,166 @@
+import asyncio
+import time
+
+import pytest
+from flask_app.session_events import PIPELINE_STATUS_EVENT
+from flask_app.session_store import InMemorySessionStore, SQLiteSessionStore
+
+
+def new_session(pipeline_status="queued"):
+    return {
+        "pipeline_status": pipeline_status,
+        "status": "Queued",
+        "update": "Pipeline queued.",
+        "update_timestamp": "2025-01-01T00:00:00",
+        "agent_updates": [],
+        "agent_files": [],
+    }
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return InMemorySessionStore()
+    return SQLiteSessionStore(str(tmp_path / "sessions.db"), poll_interval=0.05)
+
+
+def test_published_events_are_not_kept(store):
+    store.create("r", new_session("running"))
+    store.update("r", PIPELINE_STATUS_EVENT, {"update": "Started."})
+    assert store.publish("r", "text_delta", {"text_delta": {"text": "Hel"}}) == 2
+    assert store.publish("r", "text_delta", {"text_delta": {"text": "lo"}}) == 3
+
+    # a subscriber gets the latest published event only
+    assert store.get_events("r", 1) == [
+        (3, "text_delta", {"text_delta": {"text": "lo"}})
+    ]
+    assert store.get_events("r", 3) == []
+    assert store.wait_for_change("r", 2, timeout=0)
+
+    version = store.update(
+        "r", "text_message", {"text_delta": None}, agent_update="Hello"
+    )
+
+    # the message replaced the chunks, after their versions
+    assert version == 4
+    assert [event[0] for event in store.get_events("r", 0)] == [1, 4]
+    assert store.get_events("r", 2) == [
+        (4, "text_message", {"text_delta": None, "agent_update": "Hello"})
+    ]
+    assert store.get("r")["agent_updates"] == ["Hello"]
+
+
+def test_async_waits_wake_on_change(store):
+    store.create("r", new_session())
+
+    async def wait_and_update():
+        waits = [
+            asyncio.ensure_future(store.wait_for_change_async("r", 0, timeout=5))
+            for _ in range(3)
+        ]
+        await asyncio.sleep(0.1)
+        assert not any(wait.done() for wait in waits)
+        await asyncio.to_thread(
+            store.update, "r", PIPELINE_STATUS_EVENT, {"pipeline_status": "running"}
+        )
+        return await asyncio.gather(*waits)
+
+    assert asyncio.run(wait_and_update()) == [True, True, True]
+    assert asyncio.run(store.wait_for_change_async("r", 1, timeout=0.1)) is False
+    assert asyncio.run(store.wait_for_change_async("gone", 0, timeout=1)) is False
+
+
+def test_sqlite_async_waits_see_other_processes(tmp_path):
+    # two stores on one database, like two server processes
+    path = str(tmp_path / "sessions.db")
+    reader = SQLiteSessionStore(path, poll_interval=0.05)
+    writer = SQLiteSessionStore(path, poll_interval=0.05)
+    writer.create("r", new_session())
+
+    async def wait_and_update():
+        wait = asyncio.ensure_future(reader.wait_for_change_async("r", 0, timeout=5))
+        await asyncio.sleep(0.1)
+        writer.update("r", PIPELINE_STATUS_EVENT, {"pipeline_status": "running"})
+        return await wait
+
+    assert asyncio.run(wait_and_update()) is True
+
+
+def test_counters_follow_status_changes(store):
+    store.create("a", new_session())
+    store.create("b", new_session())
+    store.update("a", PIPELINE_STATUS_EVENT, {"pipeline_status": "running"})
+    store.update("a", PIPELINE_STATUS_EVENT, {"pipeline_status": "completed"})
+    # not a status change
+    store.update("a", "text_message", {"update": "Done."})
+
+    assert store.count() == 2
+    counts = store.count_by_status()
+    assert counts["queued"] == 1
+    assert counts["running"] == 0
+    assert counts["completed"] == 1
+
+    # the queued session never expires, the completed one does
+    assert store.expire(now=time.time() + 60 * 60) == 1
+    assert store.get("a") is None
+    store.delete("b")
+    store.delete("b")
+
+    assert store.count() == 0
+    assert set(store.count_by_status().values()) == {0}
+
+
+def test_updates_are_versioned(store):
+    store.create("r", new_session())
+    assert store.get("r")["version"] == 0
+    assert store.update("r", PIPELINE_STATUS_EVENT, {"pipeline_status": "running"}) == 1
+    assert store.update("r", "file_url", {}, file={"url": "https://x/r.pdf"}) == 2
+
+    session = store.get("r")
+    assert session["version"] == 2
+    assert session["pipeline_status"] == "running"
+    assert session["agent_files"] == [{"url": "https://x/r.pdf"}]
+    assert "agent_files" not in store.get("r", include_history=False)
+    assert store.get_events("r", 1) == [
+        (2, "file_url", {"file": {"url": "https://x/r.pdf"}})
+    ]
+    assert store.wait_for_change("r", 1, timeout=0)
+    assert not store.wait_for_change("r", 2, timeout=0.05)
+
+
+def test_restored_session_keeps_its_event_ids(store):
+    events = [
+        (1, PIPELINE_STATUS_EVENT, {"pipeline_status": "running"}),
+        (4, "text_message", {"agent_update": "Hi"}),
+    ]
+    session = dict(new_session("running"), agent_updates=["Hi"])
+    store.restore("r", session, events)
+    # already there, left as is
+    store.restore("r", new_session("failed"), [])
+
+    assert store.get("r")["version"] == 4
+    assert store.get("r")["agent_updates"] == ["Hi"]
+    assert store.get_events("r", 1) == [events[1]]
+    assert store.update("r", "text_message", {"update": "Bye"}) == 5
+    assert store.count_by_status()["running"] == 1
+
+
+def test_answer_is_taken_once(store):
+    store.create("r", new_session("running"))
+    assert not store.submit_input("r", "too early")
+
+    store.update("r", PIPELINE_STATUS_EVENT, {"pipeline_status": "waiting_for_input"})
+    assert store.submit_input("r", "1")
+    assert not store.submit_input("r", "2")
+
+    assert store.pop_input("r") == "1"
+    assert store.pop_input("r") is None
+    assert store.pop_input("unknown") is None
+
+
+def test_request_keys_are_claimed_once(store):
+    assert store.claim_request_keys("first", {"key": 60}) == "first"
+    assert store.claim_request_keys("second", {"key": 60, "other": 60}) == "first"
+    assert store.find_request_key("key") == "first"
+    # a rejected claim takes none of its keys
+    assert store.find_request_key("other") is None
@@ -0,0 +1,119 @@
+import json
+import threading
+from types import SimpleNamespace
+
+import pytest
+from flask_app import webhooks
+from flask_app.webhooks import (
+    DELIVERY_HEADER,
+    EVENT_HEADER,
+    SIGNATURE_HEADER,
+    UnsafeCallbackURL,
+    WebhookDispatcher,
+    check_callback_host,
+    sign,
+)
+
+PUBLIC_URL = "https://93.184.216.34/hook"
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "http://127.0.0.1:8080/hook",
+        "http://10.0.0.5/hook",
+        "http://169.254.169.254/latest/meta-data",
+        "http://[::1]/hook",
+        "http://[::ffff:192.168.0.1]/hook",
+        "http://0.0.0.0/hook",
+    ],
+)
+def test_internal_hosts_are_refused(url):
+    with pytest.raises(UnsafeCallbackURL):
+        check_callback_host(url, allowed_hosts=frozenset())
+
+
+def test_allowlist_decides_when_set():
+    check_callback_host(PUBLIC_URL, allowed_hosts=frozenset())
+    check_callback_host("http://127.0.0.1/hook", frozenset({"127.0.0.1"}))
+    with pytest.raises(UnsafeCallbackURL):
+        check_callback_host(PUBLIC_URL, frozenset({"hooks.example.com"}))
+
+
+def test_callback_url_is_validated(monkeypatch):
+    monkeypatch.setattr(webhooks, "WEBHOOK_SECRET", "secret")
+    monkeypatch.setattr(webhooks, "WEBHOOK_ALLOWED_HOSTS", frozenset())
+
+    assert webhooks.validate_callback_url(PUBLIC_URL) == (True, "")
+    for url in [None, "", "ftp://93.184.216.34/hook", "http://127.0.0.1/hook"]:
+        valid, message = webhooks.validate_callback_url(url)
+        assert not valid
+        assert message.startswith("Field 'callback_url'")
+
+    monkeypatch.setattr(webhooks, "WEBHOOK_SECRET", "")
+    assert not webhooks.validate_callback_url(PUBLIC_URL)[0]
+
+
+class FakeReceiver:
+    """Answers with the given status codes in turn, then with 200."""
+
+    def __init__(self, status_codes):
+        self.status_codes = list(status_codes)
+        self.requests = []
+        self.done = threading.Event()
+
+    def post(self, url, data, headers, timeout, allow_redirects):
+        self.requests.append((url, data, headers))
+        status_code = self.status_codes.pop(0) if self.status_codes else 200
+        if status_code < 300 or (400 <= status_code < 500 and status_code != 429):
+            self.done.set()
+        return SimpleNamespace(status_code=status_code)
+
+
+@pytest.fixture
+def receiver(monkeypatch, request):
+    receiver = FakeReceiver(request.param)
+    monkeypatch.setattr(webhooks.requests, "post", receiver.post)
+    monkeypatch.setattr(webhooks, "WEBHOOK_ALLOWED_HOSTS", frozenset())
+    # retry right away
+    monkeypatch.setattr(webhooks.random, "uniform", lambda a, b: 0)
+    return receiver
+
+
+@pytest.mark.parametrize("receiver", [[503, 429]], indirect=True)
+def test_failed_deliveries_are_retried(receiver):
+    dispatcher = WebhookDispatcher(secret="secret", num_workers=1)
+
+    assert dispatcher.send(PUBLIC_URL, "pipeline.completed", "r", {"a": 1})
+    assert receiver.done.wait(5)
+
+    assert len(receiver.requests) == 3
+    url, body, headers = receiver.requests[-1]
+    assert url == PUBLIC_URL
+    assert json.loads(body)["data"] == {"a": 1}
+    # every attempt is the same delivery, signed
+    assert len({headers[DELIVERY_HEADER] for _, _, headers in receiver.requests}) == 1
+    timestamp = int(headers[SIGNATURE_HEADER].split(",")[0][2:])
+    assert headers[SIGNATURE_HEADER] == sign("secret", timestamp, body)
+
+
+@pytest.mark.parametrize("receiver", [[404]], indirect=True)
+def test_rejected_delivery_is_not_retried(receiver):
+    dispatcher = WebhookDispatcher(secret="secret", num_workers=1)
+    dispatcher.send(PUBLIC_URL, "pipeline.completed", "r")
+    assert receiver.done.wait(5)
+    receiver.done.clear()
+    dispatcher.send(PUBLIC_URL, "pipeline.failed", "r")
+
+    assert receiver.done.wait(5)
+    assert [headers[EVENT_HEADER] for _, _, headers in receiver.requests] == [
+        "pipeline.completed",
+        "pipeline.failed",
+    ]
+
+
+@pytest.mark.parametrize("receiver", [[]], indirect=True)
+def test_full_queue_drops_events(receiver):
+    dispatcher = WebhookDispatcher(secret="secret", max_queue=0)
+    assert not dispatcher.send(PUBLIC_URL, "pipeline.completed", "r")
+    assert receiver.requests == []